@@ -17,41 +17,353 @@ Data sources:
 Run: python scripts/ai_accuracy_validator.py
 """
 
-from google.cloud import firestore
-from google.oauth2 import service_account
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from collections import defaultdict
-import pandas as pd
-import numpy as np
-import os
-
-# Initialize Firestore with service account
-script_dir = os.path.dirname(os.path.abspath(__file__))
-project_dir = os.path.dirname(script_dir)
-key_path = os.path.join(project_dir, 'serviceAccountKey.json')
-
-if os.path.exists(key_path):
-    credentials = service_account.Credentials.from_service_account_file(key_path)
-    db = firestore.Client(credentials=credentials, project=credentials.project_id)
-else:
-    print(f"ERROR: Service account key not found at: {key_path}")
-    print("\nTo fix this:")
-    print("1. Go to Firebase Console → Project Settings → Service Accounts")
-    print("2. Click 'Generate new private key'")
-    print("3. Save the file as 'serviceAccountKey.json' in your project root")
-    print(f"   Expected location: {key_path}")
-    exit(1)
-
-
-def validate_ai_predictions():
-    """Main AI accuracy validation function."""
+import re
+import unicodedata
+
+from pp_analytics.accuracy import (
+    DUPLICATE,
+    MATCH_COLUMNS,
+    NAME_ONLY,
+    NOT_OUTCOME,
+    UNMATCHED,
+    AccuracyLedger,
+    AccuracyStats,
+    daily_cells,
+    drift_series,
+    merge_cells,
+)
+from pp_analytics.aggregations import count_documents
+from pp_analytics.bootstrap import DEFAULT_CONFIDENCE, DEFAULT_RESAMPLES, bootstrap_intervals, rank_against
+from pp_analytics.client import CredentialsNotFound, client, print_credentials_help
+from pp_analytics.columns import DICTIONARY, FLOAT, MAP, NAT, PRESENT, TIMESTAMP, epoch_ns, to_columns
+from pp_analytics.fetch import add_fetch_arguments, fetch_collections
+from pp_analytics.fields import report_fields
+from pp_analytics.scans import add_scan_arguments, configure_scans_from_args
+from pp_analytics.snapshot import add_snapshot_arguments, may_contain, snapshot_fetched_at
+from pp_analytics.trace import add_trace_arguments, configure_from_args, section, traced_report
+
+SOLD_STAGES = ['sold', 'SOLD']
+
+# Typed columns read for METHOD 1 (see pp_analytics/columns.py)
+FEEDBACK_COLUMNS = {
+    'stage': ('stage', DICTIONARY),
+    'listing_id': ('listingId', DICTIONARY),
+    'value_is_map': ('value', MAP),
+    'value_actual': ('value.actualPrice', FLOAT),
+    'value_actual_set': ('value.actualPrice', PRESENT),
+    'value_sold': ('value.soldPrice', FLOAT),
+    'metadata_actual': ('metadata.actualPrice', FLOAT),
+    'metadata_actual_set': ('metadata.actualPrice', PRESENT),
+    'metadata_sold': ('metadata.soldPrice', FLOAT),
+    'sold_at': ('createdAt', TIMESTAMP),
+}
+
+LISTING_COLUMNS = {
+    'alias': ('id', DICTIONARY),
+    'listing_price': ('pricingStrategy.listingPrice', FLOAT),
+    'listing_price_set': ('pricingStrategy.listingPrice', PRESENT),
+    'optimal_price': ('pricingStrategy.optimal', FLOAT),
+    'item_category': ('itemIdentification.category', DICTIONARY),
+    'category': ('category', DICTIONARY),
+    'item_condition': ('itemIdentification.observedCondition', DICTIONARY),
+    'condition': ('condition', DICTIONARY),
+    'item_name': ('itemIdentification.name', DICTIONARY),
+    'name': ('itemName', DICTIONARY),
+}
+
+
+def normalize_name(name):
+    """Return the case-insensitive lookup key for an item name."""
+    return name.casefold() if isinstance(name, str) else ''
+
+
+def listing_item_name(listing_data):
+    """Return the item name a listing is known by."""
+    return listing_data.get('itemIdentification', {}).get('name') or listing_data.get('itemName', '')
+
+
+def build_name_index(listing_records):
+    """
+    Map normalized item name -> listing data.
+
+    Listings are indexed in stream order and the first listing with a given
+    name wins, matching the old linear scan.
+    """
+    index = {}
+    for data in listing_records:
+        key = normalize_name(listing_item_name(data))
+        if key and key not in index:
+            index[key] = data
+    return index
+
+
+def name_tokens(name):
+    """Split an item name into a set of case- and accent-insensitive word tokens ("Café" -> "cafe")."""
+    decomposed = unicodedata.normalize('NFKD', normalize_name(name))
+    return frozenset(re.findall(r'\w+', ''.join(char for char in decomposed if not unicodedata.combining(char))))
+
+
+def build_token_index(listing_records):
+    """
+    Build an inverted index of name tokens for near-miss name matching.
+
+    Returns a dict with 'postings' (token -> list of listing positions),
+    'tokens' (token set per listing) and 'records' (listing data by position).
+    """
+    postings = defaultdict(list)
+    tokens = []
+    for pos, data in enumerate(listing_records):
+        listing_tokens = name_tokens(listing_item_name(data))
+        tokens.append(listing_tokens)
+        for token in listing_tokens:
+            postings[token].append(pos)
+    return {'postings': postings, 'tokens': tokens, 'records': listing_records}
+
+
+def listing_index(listings):
+    """
+    Index a to_columns() frame of LISTING_COLUMNS by doc id and `id` alias.
+
+    Returns (keys, rows): a pandas Index of ids and the listing row each one
+    refers to. Each listing writes its doc id, then its alias, in stream
+    order, and the last write of a key wins, as when filling a dict.
+    """
+    import numpy as np
+    import pandas as pd
+
+    positions = np.arange(len(listings))
+    alias = listings['alias'].array
+    alias_codes = np.asarray(alias.codes)
+    has_alias = alias_codes >= 0
+    keys = np.concatenate([listings['id'].to_numpy(dtype=object),
+                           np.asarray(alias.categories, dtype=object)[alias_codes[has_alias]]])
+    rows = np.concatenate([positions, positions[has_alias]])
+    writes = np.concatenate([positions * 2, positions[has_alias] * 2 + 1])
+    order = np.argsort(writes, kind='stable')
+    keys, rows = keys[order], rows[order]
+    last = ~pd.Index(keys, dtype=object).duplicated(keep='last')
+    return pd.Index(keys[last], dtype=object), rows[last]
+
+
+def resolve_listings(index, ids):
+    """Listing rows for an array of listing ids (-1 where there is none)."""
+    import numpy as np
+    import pandas as pd
+
+    keys, rows = index
+    found = keys.get_indexer(pd.Index(np.asarray(ids, dtype=object), dtype=object))
+    return np.where(found >= 0, rows[found], -1)
+
+
+def _or(first, second, first_set):
+    """`first or second` for FLOAT columns; first_set is first's PRESENT column (NaN is truthy)."""
+    import numpy as np
+
+    return np.where(np.asarray(first_set), np.asarray(first), np.asarray(second))
+
+
+def _first_value(frame, names, default):
+    """`a or b or default` over DICTIONARY columns, as an object array."""
+    import numpy as np
+
+    result = np.full(len(frame), default, dtype=object)
+    for name in reversed(names):
+        column = frame[name].array
+        codes = np.asarray(column.codes)
+        present = codes >= 0
+        result[present] = np.asarray(column.categories, dtype=object)[codes[present]]
+    return result
+
+
+def join_sold_events(events, listings, index):
+    """
+    Join sold feedback events to their listings, a column at a time.
+
+    Args:
+        events: to_columns() frame of FEEDBACK_COLUMNS (sold events with a listingId)
+        listings: to_columns() frame of LISTING_COLUMNS
+        index: listing_index(listings)
+
+    Returns:
+        MATCH_COLUMNS frame of the events whose listing was found and whose
+        AI and actual prices are both positive, in event order, plus
+        'listing_row', the listing's row in `listings`
+    """
+    import numpy as np
+    import pandas as pd
+
+    # Resolve each distinct listingId once
+    listing_ids = events['listing_id'].array
+    rows = np.append(resolve_listings(index, listing_ids.categories), -1)[np.asarray(listing_ids.codes)]
+    found = rows >= 0
+    events, rows = events[found], rows[found]
+    listed = listings.iloc[rows]
+
+    # AI price: listingPrice, else optimal. Actual price: from `value` when it
+    # is a map, else from metadata
+    ai_price = _or(listed['listing_price'], listed['optimal_price'], listed['listing_price_set'])
+    actual_price = np.where(events['value_is_map'].to_numpy(),
+                            _or(events['value_actual'], events['value_sold'], events['value_actual_set']),
+                            _or(events['metadata_actual'], events['metadata_sold'], events['metadata_actual_set']))
+    usable = (ai_price > 0) & (actual_price > 0)
+    events, listed, rows = events[usable], listed[usable], rows[usable]
+    ai_price, actual_price = ai_price[usable], actual_price[usable]
+
+    error = actual_price - ai_price
+    abs_error = np.abs(error)
+    return pd.DataFrame({
+        'outcome_id': events['id'].to_numpy(dtype=object),
+        'source': 'feedback',
+        'match': 'id',
+        'listing_id': np.asarray(events['listing_id'].array, dtype=object),
+        'category': _first_value(listed, ['item_category', 'category'], 'unknown'),
+        'condition': _first_value(listed, ['item_condition', 'condition'], 'unknown'),
+        'item_name': _first_value(listed, ['item_name', 'name'], ''),
+        'ai_price': ai_price,
+        'actual_price': actual_price,
+        'error': error,
+        'abs_error': abs_error,
+        'pct_error': abs_error / actual_price * 100,
+        'direction': np.select([ai_price > actual_price, ai_price < actual_price], ['over', 'under'], 'exact'),
+        'days_to_sell': np.nan,
+        'sold_at': events['sold_at'].to_numpy(),
+        'listing_row': rows,
+    })
+
+
+def first_sales(joined, earlier):
+    """
+    Which joined sold events count: a listing sells once, so only its
+    earliest sold event (by sold_at, events without one last, ties in event
+    order), and none for a listing an earlier run matched.
+
+    Args:
+        joined: join_sold_events() frame
+        earlier: Listing rows already matched (resolve_listings() of the
+            ledger's feedback listings)
+
+    Returns:
+        Boolean array, one per joined event
+    """
+    import numpy as np
+    import pandas as pd
+
+    sold_at = joined['sold_at'].to_numpy()
+    order = np.lexsort((np.arange(len(joined)), np.where(sold_at == NAT, np.iinfo(np.int64).max, sold_at)))
+    first = np.zeros(len(joined), dtype=bool)
+    first[order] = ~pd.Series(joined['listing_row'].to_numpy()[order]).duplicated().to_numpy()
+    return first & ~np.isin(joined['listing_row'].to_numpy(), earlier)
+
+
+def mape_change(cells, today, min_count=5):
+    """
+    Per-category MAPE of the 30 days to today against the 30 days before.
+
+    Args:
+        cells: Daily cells (accuracy.daily_cells())
+        today: Last day of the recent window (a Timestamp)
+        min_count: Matches a category needs in both windows
+
+    Returns:
+        DataFrame indexed by category with mape, before, count (recent
+        matches) and delta (mape - before)
+    """
+    import pandas as pd
+
+    monthly = drift_series(cells, 'category', window=30, start=today - timedelta(days=30), end=today)
+    if monthly.empty:
+        return pd.DataFrame(columns=['mape', 'before', 'count', 'delta'])
+    recent = monthly.xs(today, level='period')
+    before = monthly.xs(today - timedelta(days=30), level='period')
+    change = pd.DataFrame({'mape': recent['mape'], 'before': before['mape'], 'count': recent['count']})
+    change = change[(recent['count'] >= min_count) & (before['count'] >= min_count)]
+    return change.assign(delta=change['mape'] - change['before'])
+
+
+def find_fuzzy_match(token_index, item_name, min_score=0.75, max_postings=5000):
+    """
+    Find the listing whose name tokens best overlap item_name (Jaccard score).
+
+    Candidates are listings sharing at least one token with the query; tokens
+    shared by more than max_postings listings are too common to narrow the
+    search and are skipped. Ties go to the earliest listing. Returns None
+    below min_score.
+    """
+    query = name_tokens(item_name)
+    if not query:
+        return None
+
+    postings = token_index['postings']
+    candidates = set()
+    for token in query:
+        positions = postings.get(token)
+        if positions and len(positions) <= max_postings:
+            candidates.update(positions)
+
+    best_pos = None
+    best_score = 0.0
+    for pos in sorted(candidates):
+        listing_tokens = token_index['tokens'][pos]
+        score = len(query & listing_tokens) / len(query | listing_tokens)
+        if score > best_score:
+            best_pos, best_score = pos, score
+
+    if best_pos is None or best_score < min_score:
+        return None
+    return token_index['records'][best_pos]
+
+
+@traced_report('ai_accuracy_validator')
+def validate_ai_predictions(fuzzy_names=False, fuzzy_min_score=0.75,
+                            refresh=False, snapshot_ttl=None, incremental=None,
+                            fetch_concurrency=None, quick=False, drift_csv=None,
+                            bootstrap_resamples=DEFAULT_RESAMPLES, bootstrap_workers=None, db=None, tables=None):
+    """
+    Main AI accuracy validation function.
+
+    Args:
+        fuzzy_names: If True, temp listings with no exact item name match fall
+            back to a token-overlap match against listing names.
+        fuzzy_min_score: Minimum Jaccard token overlap for a fuzzy match.
+        refresh: If True, re-fetch collections from Firestore instead of using local snapshots.
+        snapshot_ttl: Max age in hours of a local snapshot (default: PP_SNAPSHOT_TTL_HOURS or 12).
+        incremental: If True, update stale snapshots with a delta sync (default: PP_SNAPSHOT_INCREMENTAL).
+        fetch_concurrency: Max collections fetched at once (default: PP_FETCH_CONCURRENCY or all).
+        quick: If True, only print the headline totals, from aggregation queries.
+        drift_csv: If set, write the daily 30-day rolling accuracy of every category,
+            condition and price range over the past year to this CSV.
+        bootstrap_resamples: Resamples per category for the error confidence intervals.
+        bootstrap_workers: Processes computing them (default: PP_BOOTSTRAP_WORKERS or one per CPU).
+        db: Firestore client (default: the shared, lazily created client; see pp_analytics/client.py).
+        tables: Collections already loaded this run (see run_reports.py), used instead of fetching.
+    """
+    import numpy as np
+    import pandas as pd
+
+    if db is None:
+        db = client
 
     print("Fetching data from Firestore...")
 
-    listings = list(db.collection('listings').stream())
-    listings_temp = list(db.collection('listings_temp').stream())
-    feedback_events = list(db.collection('feedback_events').stream())
-    sold_prices = list(db.collection('soldPrices').stream())
+    if quick:
+        listing_count, temp_count, feedback_count = (
+            count_documents(db, name, refresh=refresh, ttl_hours=snapshot_ttl, tables=tables)
+            for name in ('listings', 'listings_temp', 'feedback_events')
+        )
+    else:
+        collections, _ = fetch_collections(
+            db, ['listings', 'listings_temp', 'feedback_events'],
+            max_workers=fetch_concurrency, refresh=refresh, ttl_hours=snapshot_ttl, incremental=incremental,
+            fields=report_fields('ai_accuracy_validator'),
+            tables=tables,
+        )
+        listings = collections['listings']
+        listings_temp = collections['listings_temp']
+        feedback_events = collections['feedback_events']
+        listing_count, temp_count, feedback_count = len(listings), len(listings_temp), len(feedback_events)
+    sold_price_count = count_documents(db, 'soldPrices', refresh=refresh, ttl_hours=snapshot_ttl, tables=tables)
 
     now = datetime.now()
 
@@ -59,88 +371,115 @@ def validate_ai_predictions():
     print("AI PREDICTION ACCURACY REPORT - Precision Prices")
     print(f"{'='*60}")
     print(f"Report Generated: {now.strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"\nTotal Listings: {len(listings)}")
-    print(f"Total Temp Listings: {len(listings_temp)}")
-    print(f"Total Feedback Events: {len(feedback_events)}")
-    print(f"Total Sold Prices Records: {len(sold_prices)}")
+    print(f"\nTotal Listings: {listing_count}")
+    print(f"Total Temp Listings: {temp_count}")
+    print(f"Total Feedback Events: {feedback_count}")
+    print(f"Total Sold Prices Records: {sold_price_count}")
+
+    if quick:
+        print(f"\n{'='*60}")
+        return {
+            'total_listings': listing_count,
+            'total_temp_listings': temp_count,
+            'total_feedback_events': feedback_count,
+            'total_sold_prices': sold_price_count,
+        }
 
     # ===========================================
     # METHOD 1: Match listings with feedback outcomes
     # ===========================================
+    section("METHOD 1: Listings with Transaction Outcomes")
     print(f"\n{'='*60}")
     print("METHOD 1: Listings with Transaction Outcomes")
     print(f"{'='*60}")
 
-    # Build lookup for listings by various IDs
-    listings_by_id = {}
-    for listing in listings:
-        data = listing.to_dict()
-        listings_by_id[listing.id] = data
-        # Also index by custom ID field if present
-        if data.get('id'):
-            listings_by_id[data['id']] = data
-
-    matches = []
-
-    # Check feedback_events for price_accuracy and actual prices
-    for feedback in feedback_events:
-        data = feedback.to_dict()
-        listing_id = data.get('listingId')
-        purpose = data.get('purpose')
-        stage = data.get('stage')
-        value = data.get('value')
-        metadata = data.get('metadata', {})
-
-        # Look for transaction outcome feedback
-        if stage in ['sold', 'SOLD'] and listing_id:
-            listing_data = listings_by_id.get(listing_id)
-            if listing_data:
-                # Get AI predicted price
-                pricing_strategy = listing_data.get('pricingStrategy', {})
-                ai_price = pricing_strategy.get('listingPrice') or pricing_strategy.get('optimal')
-
-                # Get actual price from feedback or metadata
-                actual_price = None
-                if isinstance(value, dict):
-                    actual_price = value.get('actualPrice') or value.get('soldPrice')
-                elif metadata:
-                    actual_price = metadata.get('actualPrice') or metadata.get('soldPrice')
-
-                if ai_price and actual_price and ai_price > 0 and actual_price > 0:
-                    error = actual_price - ai_price
-                    abs_error = abs(error)
-                    pct_error = (abs_error / actual_price) * 100
-                    direction = 'over' if ai_price > actual_price else 'under' if ai_price < actual_price else 'exact'
-
-                    item_id = listing_data.get('itemIdentification', {})
-                    matches.append({
-                        'listing_id': listing_id,
-                        'category': item_id.get('category') or listing_data.get('category', 'unknown'),
-                        'condition': item_id.get('observedCondition') or listing_data.get('condition', 'unknown'),
-                        'item_name': item_id.get('name') or listing_data.get('itemName', ''),
-                        'ai_price': ai_price,
-                        'actual_price': actual_price,
-                        'error': error,
-                        'abs_error': abs_error,
-                        'pct_error': pct_error,
-                        'direction': direction,
-                    })
+    # Outcomes settled by earlier runs are skipped (see pp_analytics/accuracy.py);
+    # those left unmatched are tried again when the listings were fetched again
+    ledger = AccuracyLedger()
+    listings_fetched_at = snapshot_fetched_at('listings')
+    retry = ledger.retry_needed(listings_fetched_at)
+    lookups = {}
+
+    def listing_records():
+        """Listing data in stream order (for name matching), built the first time it's needed."""
+        if 'records' not in lookups:
+            lookups['records'] = [listing.to_dict() for listing in listings]
+        return lookups['records']
+
+    def listing_columns():
+        """LISTING_COLUMNS of every listing and their id index, built the first time they're needed."""
+        if 'columns' not in lookups:
+            columns = to_columns(listings, LISTING_COLUMNS)
+            lookups['columns'] = columns, listing_index(columns)
+        return lookups['columns']
+
+    # Only events the ledger hasn't settled, and that may be sales at all, are
+    # decoded, into columns; the sold ones are hash-joined to listings on
+    # listingId (doc id or `id` alias)
+    pending = ledger.pending_mask('feedback', [feedback.id for feedback in feedback_events], retry)
+    pending = [feedback for feedback, keep in zip(feedback_events, pending) if keep]
+    maybe_sold = may_contain(pending, SOLD_STAGES)
+    ledger.set_statuses('feedback', [feedback.id for feedback, keep in zip(pending, maybe_sold) if not keep],
+                        NOT_OUTCOME)
+    events = to_columns([feedback for feedback, keep in zip(pending, maybe_sold) if keep], FEEDBACK_COLUMNS)
+    sold = events['stage'].isin(SOLD_STAGES).to_numpy() & (np.asarray(events['listing_id'].array.codes) >= 0)
+    ledger.set_statuses('feedback', events['id'][~sold], NOT_OUTCOME)
+    ledger.set_statuses('feedback', events['id'][sold], UNMATCHED)
+
+    feedback_matches = pd.DataFrame(columns=MATCH_COLUMNS)
+    if sold.any():
+        listing_frame, index = listing_columns()
+        joined = join_sold_events(events[sold], listing_frame, index)
+
+        first = first_sales(joined, resolve_listings(index, list(ledger.feedback_listings)))
+        ledger.set_statuses('feedback', joined.loc[~first, 'outcome_id'], DUPLICATE)
+        feedback_matches = joined.loc[first, MATCH_COLUMNS]
+
+    print(f"Matched by listing id: {ledger.match_count('feedback', 'id') + len(feedback_matches)}")
+    duplicates = ledger.status_count('feedback', DUPLICATE)
+    if duplicates:
+        print(f"Repeated sold events for a matched listing (not counted): {duplicates}")
 
     # ===========================================
     # METHOD 2: Check listings_temp for outcomes
     # ===========================================
+    section("METHOD 2: Temp Listings with Outcomes")
     print(f"\n{'='*60}")
     print("METHOD 2: Temp Listings with Outcomes")
     print(f"{'='*60}")
 
+    # Build name lookups once instead of scanning every listing per temp listing
+    name_lookups = {}
+
+    def name_lookup(item_name):
+        """(listing data, 'exact' or 'fuzzy'), or (None, None)."""
+        if not name_lookups:
+            records = listing_records()
+            name_lookups['name'] = build_name_index(records)
+            name_lookups['token'] = build_token_index(records) if fuzzy_names else None
+        ldata = name_lookups['name'].get(normalize_name(item_name))
+        if ldata is not None:
+            return ldata, 'exact'
+        if name_lookups['token'] is not None:
+            ldata = find_fuzzy_match(name_lookups['token'], item_name, min_score=fuzzy_min_score)
+            if ldata is not None:
+                return ldata, 'fuzzy'
+        return None, None
+
+    matches = []
+    fuzzy_matches = 0
+
+    # Fuzzy matches aren't kept in the ledger, so with --fuzzy-names every
+    # temp listing not matched exactly is looked at again
     for temp_listing in listings_temp:
+        if not ledger.pending('temp', temp_listing.id, retry or fuzzy_names):
+            continue
         data = temp_listing.to_dict()
 
         if data.get('wasSold') and data.get('actualPrice'):
             actual_price = data['actualPrice']
 
             # Try to find corresponding listing for AI price
-            session_id = data.get('sessionId')
             item_name = data.get('itemName', '')
 
             # Look for listing with same item name (approximate match)
@@ -148,16 +487,17 @@ def validate_ai_predictions():
             category = 'unknown'
             condition = 'unknown'
 
-            for lid, ldata in listings_by_id.items():
-                l_item = ldata.get('itemIdentification', {})
-                l_name = l_item.get('name') or ldata.get('itemName', '')
+            ldata, match = name_lookup(item_name)
+            ledger.set_status('temp', temp_listing.id, NAME_ONLY if match == 'exact' else UNMATCHED)
+            if match == 'fuzzy':
+                fuzzy_matches += 1
 
-                if l_name and item_name and l_name.lower() == item_name.lower():
-                    pricing = ldata.get('pricingStrategy', {})
-                    ai_price = pricing.get('listingPrice') or pricing.get('optimal')
-                    category = l_item.get('category') or 'unknown'
-                    condition = l_item.get('observedCondition') or 'unknown'
-                    break
+            if ldata is not None:
+                l_item = ldata.get('itemIdentification', {})
+                pricing = ldata.get('pricingStrategy', {})
+                ai_price = pricing.get('listingPrice') or pricing.get('optimal')
+                category = l_item.get('category') or 'unknown'
+                condition = l_item.get('observedCondition') or 'unknown'
 
             if ai_price and actual_price and ai_price > 0 and actual_price > 0:
                 error = actual_price - ai_price
@@ -166,6 +506,9 @@ def validate_ai_predictions():
                 direction = 'over' if ai_price > actual_price else 'under' if ai_price < actual_price else 'exact'
 
                 matches.append({
+                    'outcome_id': temp_listing.id,
+                    'source': 'temp',
+                    'match': match,
                     'listing_id': temp_listing.id,
                     'category': category,
                     'condition': condition,
@@ -177,12 +520,27 @@ def validate_ai_predictions():
                     'pct_error': pct_error,
                     'direction': direction,
                     'days_to_sell': data.get('daysToSell'),
+                    # When the sale was recorded on the temp listing
+                    'sold_at': epoch_ns(data.get('updatedAt') or data.get('createdAt')),
                 })
 
+    new_matches = pd.concat([frame for frame in (feedback_matches, pd.DataFrame(matches, columns=MATCH_COLUMNS))
+                             if len(frame)] or [feedback_matches], ignore_index=True)
+    fuzzy = new_matches['match'] == 'fuzzy'
+    ledger.add_matches(new_matches[~fuzzy])
+    ledger.save(listings_fetched_at)
+    stats = ledger.stats.copy().merge(AccuracyStats().add_frame(new_matches[fuzzy]))
+    exact_matches = ledger.match_count('temp', 'exact') + ledger.status_count('temp', NAME_ONLY)
+
+    print(f"Matched by exact item name: {exact_matches}")
+    if fuzzy_names:
+        print(f"Matched by fuzzy item name: {fuzzy_matches}")
+
     # ===========================================
     # RESULTS ANALYSIS
     # ===========================================
-    if not matches:
+    overall = stats.overall
+    if not overall.count:
         print(f"\n{'='*60}")
         print("⚠️  NO MATCHED PREDICTIONS FOUND")
         print(f"{'='*60}")
@@ -216,97 +574,115 @@ RECOMMENDATIONS TO COLLECT THIS DATA:
 
         return {'matches': 0, 'message': 'No matched predictions found'}
 
-    # Convert to DataFrame for analysis
-    df = pd.DataFrame(matches)
+    # Everything below comes from the accumulators (the median from their
+    # quantile sketch); only the category intervals read matches, from the
+    # ledger plus this run's fuzzy ones
+    total = overall.count
 
+    section("OVERALL ACCURACY METRICS")
     print(f"\n{'='*60}")
     print("OVERALL ACCURACY METRICS")
     print(f"{'='*60}")
-    print(f"Total validated predictions: {len(df)}")
+    print(f"Total validated predictions: {total}")
 
     # Key metrics
-    mae = df['abs_error'].mean()
-    mape = df['pct_error'].mean()
-    median_pct_error = df['pct_error'].median()
+    mae = overall.mae
+    mape = overall.mape
+    median_pct_error = overall.median_pct_error()
 
     print(f"\nMean Absolute Error (MAE): ${mae:.2f}")
     print(f"Mean Absolute Percentage Error (MAPE): {mape:.1f}%")
     print(f"Median Percentage Error: {median_pct_error:.1f}%")
 
     # Accuracy buckets
-    within_10 = len(df[df['pct_error'] <= 10])
-    within_20 = len(df[df['pct_error'] <= 20])
-    within_30 = len(df[df['pct_error'] <= 30])
+    within_10 = overall.within[10]
+    within_20 = overall.within[20]
+    within_30 = overall.within[30]
 
     print(f"\nAccuracy Distribution:")
-    print(f"  Within 10%: {within_10} ({within_10/len(df)*100:.1f}%) - EXCELLENT")
-    print(f"  Within 20%: {within_20} ({within_20/len(df)*100:.1f}%) - GOOD")
-    print(f"  Within 30%: {within_30} ({within_30/len(df)*100:.1f}%) - ACCEPTABLE")
-    print(f"  Over 30%: {len(df) - within_30} ({(len(df)-within_30)/len(df)*100:.1f}%) - NEEDS IMPROVEMENT")
+    print(f"  Within 10%: {within_10} ({within_10/total*100:.1f}%) - EXCELLENT")
+    print(f"  Within 20%: {within_20} ({within_20/total*100:.1f}%) - GOOD")
+    print(f"  Within 30%: {within_30} ({within_30/total*100:.1f}%) - ACCEPTABLE")
+    print(f"  Over 30%: {total - within_30} ({(total-within_30)/total*100:.1f}%) - NEEDS IMPROVEMENT")
 
     # Directional bias
-    over_predictions = len(df[df['direction'] == 'over'])
-    under_predictions = len(df[df['direction'] == 'under'])
-    exact_predictions = len(df[df['direction'] == 'exact'])
+    over_predictions = overall.directions['over']
+    under_predictions = overall.directions['under']
+    exact_predictions = overall.directions['exact']
 
     print(f"\nDirectional Bias:")
-    print(f"  Over-predicted (AI > Actual): {over_predictions} ({over_predictions/len(df)*100:.1f}%)")
-    print(f"  Under-predicted (AI < Actual): {under_predictions} ({under_predictions/len(df)*100:.1f}%)")
+    print(f"  Over-predicted (AI > Actual): {over_predictions} ({over_predictions/total*100:.1f}%)")
+    print(f"  Under-predicted (AI < Actual): {under_predictions} ({under_predictions/total*100:.1f}%)")
     print(f"  Exact: {exact_predictions}")
 
-    avg_over = df[df['direction'] == 'over']['error'].mean() if over_predictions else 0
-    avg_under = df[df['direction'] == 'under']['error'].mean() if under_predictions else 0
+    avg_over = overall.avg_over_error if over_predictions else 0
+    avg_under = overall.avg_under_error if under_predictions else 0
     print(f"  Avg over-prediction: ${abs(avg_over):.2f}")
     print(f"  Avg under-prediction: ${abs(avg_under):.2f}")
 
     # ===========================================
     # CATEGORY ANALYSIS
     # ===========================================
+    section("WORST PERFORMING CATEGORIES (Need More Training Data)")
     print(f"\n{'='*60}")
     print("WORST PERFORMING CATEGORIES (Need More Training Data)")
     print(f"{'='*60}")
 
-    category_stats = df.groupby('category').agg({
-        'pct_error': ['mean', 'median', 'count'],
-        'error': 'mean',
-        'abs_error': 'mean'
-    }).round(2)
-
-    category_stats.columns = ['avg_pct_error', 'median_pct_error', 'count', 'avg_error', 'avg_abs_error']
+    # Categories are compared with the overall MAPE on bootstrap intervals of
+    # their errors (see pp_analytics/bootstrap.py): worst when the whole
+    # interval is above it, best when the whole interval is below it, so a
+    # small, noisy category is in neither list
+    category_stats = stats.table('category').round(2)
     category_stats = category_stats[category_stats['count'] >= 2]  # Min 2 samples
+    # Only the matches of categories with 2+ samples are read; all of them are
+    # resampled, so unlike the rest of the report this grows with history
+    names = ['category', 'abs_error', 'pct_error']
+    stored = ledger.columns(names, where=('category', category_stats.index))
+    fuzzy_rows = new_matches[fuzzy & new_matches['category'].isin(category_stats.index)]
+    match_columns = {name: np.concatenate([stored[name], fuzzy_rows[name].to_numpy()]) for name in names}
+    intervals = bootstrap_intervals(match_columns['category'], match_columns['abs_error'].astype(float),
+                                    match_columns['pct_error'].astype(float), resamples=bootstrap_resamples,
+                                    workers=bootstrap_workers, name='category')
+    category_stats = category_stats.join(intervals.drop(columns='count').round(2))
+    ci = f"{DEFAULT_CONFIDENCE:.0%} CI"
+    worst, best = rank_against(category_stats, mape, limit=10)
 
     if not category_stats.empty:
-        worst = category_stats.nlargest(10, 'avg_pct_error')
-        print("\nCategories with highest prediction error:")
+        print(f"\nCategories with error above the overall {mape:.1f}% MAPE (whole {ci}), "
+              f"by the low end of the interval:")
+        if worst.empty:
+            print("  None")
         for cat, row in worst.iterrows():
             direction = "OVER" if row['avg_error'] < 0 else "UNDER"
             print(f"  {cat}:")
-            print(f"    - Avg error: {row['avg_pct_error']:.1f}% ({direction}-predicted)")
+            print(f"    - Avg error: {row['avg_pct_error']:.1f}% "
+                  f"({ci} {row['mape_low']:.1f}-{row['mape_high']:.1f}%, {direction}-predicted)")
+            print(f"    - Median error: {row['median']:.1f}% ({ci} {row['median_low']:.1f}-{row['median_high']:.1f}%)")
             print(f"    - Samples: {int(row['count'])}")
-            print(f"    - Avg $ off: ${row['avg_abs_error']:.2f}")
+            print(f"    - Avg $ off: ${row['avg_abs_error']:.2f} ({ci} ${row['mae_low']:.2f}-${row['mae_high']:.2f})")
 
+        section("BEST PERFORMING CATEGORIES (AI is accurate)")
         print(f"\n{'='*60}")
         print("BEST PERFORMING CATEGORIES (AI is accurate)")
         print(f"{'='*60}")
 
-        best = category_stats.nsmallest(10, 'avg_pct_error')
-        print("\nCategories with lowest prediction error:")
+        print(f"\nCategories with error below the overall {mape:.1f}% MAPE (whole {ci}), "
+              f"by the high end of the interval:")
+        if best.empty:
+            print("  None")
         for cat, row in best.iterrows():
-            print(f"  {cat}: {row['avg_pct_error']:.1f}% avg error ({int(row['count'])} samples)")
+            print(f"  {cat}: {row['avg_pct_error']:.1f}% avg error "
+                  f"({ci} {row['mape_low']:.1f}-{row['mape_high']:.1f}%, {int(row['count'])} samples)")
 
     # ===========================================
     # CONDITION ANALYSIS
     # ===========================================
+    section("ACCURACY BY CONDITION")
     print(f"\n{'='*60}")
     print("ACCURACY BY CONDITION")
     print(f"{'='*60}")
 
-    condition_stats = df.groupby('condition').agg({
-        'pct_error': ['mean', 'count'],
-        'error': 'mean'
-    }).round(2)
-
-    condition_stats.columns = ['avg_pct_error', 'count', 'avg_error']
+    condition_stats = stats.table('condition')[['avg_pct_error', 'count', 'avg_error']].round(2)
 
     for cond, row in condition_stats.iterrows():
         direction = "over" if row['avg_error'] < 0 else "under"
@@ -315,58 +691,87 @@ RECOMMENDATIONS TO COLLECT THIS DATA:
     # ===========================================
     # PRICE RANGE ANALYSIS
     # ===========================================
+    section("ACCURACY BY PRICE RANGE")
     print(f"\n{'='*60}")
     print("ACCURACY BY PRICE RANGE")
     print(f"{'='*60}")
 
-    df['price_bucket'] = pd.cut(df['actual_price'],
-                                 bins=[0, 25, 50, 100, 250, 500, 1000, float('inf')],
-                                 labels=['$0-25', '$25-50', '$50-100', '$100-250', '$250-500', '$500-1K', '$1K+'])
-
-    price_stats = df.groupby('price_bucket').agg({
-        'pct_error': ['mean', 'count'],
-        'error': 'mean'
-    }).round(2)
-
-    price_stats.columns = ['avg_pct_error', 'count', 'avg_error']
+    # Buckets are pd.cut() bins of the actual price (see pp_analytics/accuracy.py)
+    price_stats = stats.table('price_bucket')[['avg_pct_error', 'count', 'avg_error']].round(2)
 
     for bucket, row in price_stats.iterrows():
-        if pd.notna(bucket) and row['count'] > 0:
+        if row['count'] > 0:
             direction = "over" if row['avg_error'] < 0 else "under"
             print(f"  {bucket}: {row['avg_pct_error']:.1f}% avg error ({direction}), {int(row['count'])} samples")
 
     # ===========================================
     # DAYS TO SELL CORRELATION
     # ===========================================
-    if 'days_to_sell' in df.columns and df['days_to_sell'].notna().any():
+    days_to_sell = stats.days_to_sell
+    if days_to_sell.n:
+        section("PRICING ACCURACY VS TIME TO SELL")
         print(f"\n{'='*60}")
         print("PRICING ACCURACY VS TIME TO SELL")
         print(f"{'='*60}")
 
-        df_with_days = df[df['days_to_sell'].notna()]
-        if len(df_with_days) > 0:
-            # Items that sold quickly vs slowly
-            quick = df_with_days[df_with_days['days_to_sell'] <= 3]
-            medium = df_with_days[(df_with_days['days_to_sell'] > 3) & (df_with_days['days_to_sell'] <= 14)]
-            slow = df_with_days[df_with_days['days_to_sell'] > 14]
-
-            if len(quick) > 0:
-                print(f"  Quick sells (≤3 days): {quick['pct_error'].mean():.1f}% avg error")
-            if len(medium) > 0:
-                print(f"  Medium sells (4-14 days): {medium['pct_error'].mean():.1f}% avg error")
-            if len(slow) > 0:
-                print(f"  Slow sells (>14 days): {slow['pct_error'].mean():.1f}% avg error")
-
-            # Correlation
-            correlation = df_with_days['pct_error'].corr(df_with_days['days_to_sell'])
-            print(f"\n  Correlation (error vs days to sell): {correlation:.2f}")
-            if correlation > 0.3:
-                print("  ↳ Positive correlation: Higher errors correlate with longer sell times")
-                print("    (Possible over-pricing when predictions are off)")
+        # Items that sold quickly vs slowly
+        if days_to_sell.bands['quick'][0] > 0:
+            print(f"  Quick sells (≤3 days): {days_to_sell.band_mean('quick'):.1f}% avg error")
+        if days_to_sell.bands['medium'][0] > 0:
+            print(f"  Medium sells (4-14 days): {days_to_sell.band_mean('medium'):.1f}% avg error")
+        if days_to_sell.bands['slow'][0] > 0:
+            print(f"  Slow sells (>14 days): {days_to_sell.band_mean('slow'):.1f}% avg error")
+
+        # Correlation
+        correlation = days_to_sell.correlation()
+        print(f"\n  Correlation (error vs days to sell): {correlation:.2f}")
+        if correlation > 0.3:
+            print("  ↳ Positive correlation: Higher errors correlate with longer sell times")
+            print("    (Possible over-pricing when predictions are off)")
+
+    # ===========================================
+    # ACCURACY DRIFT (by day of sale)
+    # ===========================================
+    section("ACCURACY DRIFT")
+    print(f"\n{'='*60}")
+    print("ACCURACY DRIFT")
+    print(f"{'='*60}")
+
+    # Daily cells are kept in the ledger; only this run's fuzzy matches are added
+    cells = merge_cells(ledger.daily, daily_cells(new_matches[fuzzy]))
+    today = pd.Timestamp(datetime.now(timezone.utc).date())
+    weekly = drift_series(cells, 'overall', freq='W', window=1, start=today - timedelta(weeks=7), end=today)
+    if weekly.empty:
+        print("No matches with a sale date yet")
+    else:
+        print(f"\n{'Week of':<12} {'Matches':>8} {'MAE':>9} {'MAPE':>7} {'Bias':>9} {'Within 20%':>11}")
+        for (_, week), row in weekly.iterrows():
+            if row['count'] == 0:
+                print(f"{week.date().isoformat():<12} {0:>8}")
+                continue
+            mae, bias = f"${row['mae']:.2f}", f"${row['bias']:.2f}"
+            print(f"{week.date().isoformat():<12} {int(row['count']):>8} {mae:>9} {row['mape']:>6.1f}% "
+                  f"{bias:>9} {row['within_20']*100:>10.1f}%")
+        print("(UTC weeks from Monday, by sale date; bias is actual - AI price)")
+
+        # Last 30 days against the 30 days before, per category
+        change = mape_change(cells, today)
+        if not change.empty:
+            print("\n30-day MAPE vs the 30 days before (categories with 5+ matches in both):")
+            for cat, row in change.nlargest(5, 'delta').iterrows():
+                print(f"  {cat}: {row['mape']:.1f}% (was {row['before']:.1f}%, {row['delta']:+.1f} pts), "
+                      f"{int(row['count'])} matches")
+
+    if drift_csv:
+        frames = [drift_series(cells, group, window=30, end=today).assign(group=group)
+                  for group in ('overall', 'category', 'condition', 'price_bucket')]
+        pd.concat(frames).to_csv(drift_csv)
+        print(f"\nDaily 30-day rolling accuracy written to {drift_csv}")
 
     # ===========================================
     # SPECIFIC IMPROVEMENT RECOMMENDATIONS
     # ===========================================
+    section("RECOMMENDATIONS FOR AI IMPROVEMENT")
     print(f"\n{'='*60}")
     print("RECOMMENDATIONS FOR AI IMPROVEMENT")
     print(f"{'='*60}")
@@ -377,29 +782,32 @@ RECOMMENDATIONS TO COLLECT THIS DATA:
     if over_predictions > under_predictions * 1.5:
         recommendations.append({
             'issue': 'Systematic Over-Prediction',
-            'detail': f'AI over-predicts {over_predictions/len(df)*100:.0f}% of the time',
+            'detail': f'AI over-predicts {over_predictions/total*100:.0f}% of the time',
             'fix': 'Consider applying a global correction factor or adjusting confidence in historical high prices'
         })
     elif under_predictions > over_predictions * 1.5:
         recommendations.append({
             'issue': 'Systematic Under-Prediction',
-            'detail': f'AI under-predicts {under_predictions/len(df)*100:.0f}% of the time',
+            'detail': f'AI under-predicts {under_predictions/total*100:.0f}% of the time',
             'fix': 'Users may be getting better prices than predicted. Consider adjusting for market conditions.'
         })
 
-    # Check for category-specific issues
-    if not category_stats.empty:
-        worst_cat = category_stats.nlargest(1, 'avg_pct_error')
-        if worst_cat['avg_pct_error'].iloc[0] > 30:
-            cat_name = worst_cat.index[0]
+    # Check for category-specific issues: only when even the low end of the
+    # interval is over 30%
+    if not worst.empty:
+        worst_cat = worst.iloc[0]
+        if worst_cat['mape_low'] > 30:
+            cat_name = worst.index[0]
             recommendations.append({
                 'issue': f'High Error in "{cat_name}" Category',
-                'detail': f'{worst_cat["avg_pct_error"].iloc[0]:.0f}% average error',
+                'detail': (f'{worst_cat["avg_pct_error"]:.0f}% average error '
+                           f'({ci} {worst_cat["mape_low"]:.0f}-{worst_cat["mape_high"]:.0f}%)'),
                 'fix': f'Collect more training data for "{cat_name}" or apply category-specific adjustments'
             })
 
     # Check for price range issues
-    if len(df[df['price_bucket'] == '$1K+']) < 5:
+    high_value = stats.groups['price_bucket'].get('$1K+')
+    if (high_value.count if high_value else 0) < 5:
         recommendations.append({
             'issue': 'Limited High-Value Item Data',
             'detail': 'Few validated predictions for items >$1000',
@@ -407,10 +815,10 @@ RECOMMENDATIONS TO COLLECT THIS DATA:
         })
 
     # Data volume recommendation
-    if len(df) < 50:
+    if total < 50:
         recommendations.append({
             'issue': 'Limited Validation Data',
-            'detail': f'Only {len(df)} predictions validated',
+            'detail': f'Only {total} predictions validated',
             'fix': 'Prioritize collecting actual sale outcomes to build a larger validation set'
         })
 
@@ -425,16 +833,48 @@ RECOMMENDATIONS TO COLLECT THIS DATA:
     print(f"\n{'='*60}")
 
     return {
-        'total_validated': len(df),
+        'total_validated': total,
         'mae': mae,
         'mape': mape,
-        'within_20_pct': within_20 / len(df) * 100,
-        'over_prediction_rate': over_predictions / len(df) * 100,
-        'under_prediction_rate': under_predictions / len(df) * 100,
-        'worst_categories': worst.index.tolist()[:5] if not category_stats.empty else [],
+        'within_20_pct': within_20 / total * 100,
+        'over_prediction_rate': over_predictions / total * 100,
+        'under_prediction_rate': under_predictions / total * 100,
+        'worst_categories': worst.index.tolist()[:5],
         'recommendations': recommendations
     }
 
 
 if __name__ == "__main__":
-    results = validate_ai_predictions()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Validate AI price predictions against actual sold prices.")
+    parser.add_argument('--fuzzy-names', action='store_true',
+                        help="Fall back to token-overlap matching for temp listing item names")
+    add_snapshot_arguments(parser)
+    add_scan_arguments(parser)
+    add_fetch_arguments(parser)
+    parser.add_argument('--quick', action='store_true',
+                        help="Only print headline totals (aggregation queries, no document downloads)")
+    parser.add_argument('--drift-csv', default=None, metavar='FILE',
+                        help="Write the daily 30-day rolling accuracy per category/condition/price range to FILE")
+    parser.add_argument('--bootstrap-resamples', type=int, default=DEFAULT_RESAMPLES, metavar='N',
+                        help=f"Resamples per category for error confidence intervals (default: {DEFAULT_RESAMPLES})")
+    parser.add_argument('--bootstrap-workers', type=int, default=None, metavar='N',
+                        help="Processes computing the intervals (default: PP_BOOTSTRAP_WORKERS or one per CPU)")
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+    configure_scans_from_args(args)
+
+    try:
+        results = validate_ai_predictions(fuzzy_names=args.fuzzy_names, refresh=args.refresh,
+                                          snapshot_ttl=args.snapshot_ttl,
+                                          incremental=args.incremental,
+                                          fetch_concurrency=args.fetch_concurrency,
+                                          quick=args.quick,
+                                          drift_csv=args.drift_csv,
+                                          bootstrap_resamples=args.bootstrap_resamples,
+                                          bootstrap_workers=args.bootstrap_workers)
+    except CredentialsNotFound as e:
+        print_credentials_help(e)
+        raise SystemExit(1)
@@ -0,0 +1,235 @@
+# benchmark.py
+"""
+Precision Prices - Scaling Benchmarks
+
+Runs each report offline against synthetic datasets of increasing size
+(pp_analytics/synthetic.py) and records, per report and per report
+section:
+- wall time
+- peak RSS of the report process
+- docs/s: documents the report reads (per its REPORT_FIELDS entry) divided
+  by the time taken
+
+Each report runs in its own process, offline, with one of two backends:
+- snapshots (default): served from the synthetic snapshots as a warm run
+  would be. PP_SNAPSHOT_DIR points at the dataset and PP_SERVICE_ACCOUNT_KEY
+  at a file that doesn't exist, so a report that tried to reach Firestore
+  fails instead of reading production.
+- local: a cold run against the in-process Firestore backend (local.py)
+  loaded with the dataset, so every query, projection and window goes
+  through the same path as against Firestore, into a scratch snapshot
+  directory.
+
+Sections are the report's own
+=====-framed headings, timed by when they are printed ("load" is
+everything before the first heading).
+
+Datasets are written once to .bench/<size>-seed<seed>/ and reused.
+
+Run: python scripts/benchmark.py --sizes 10k 100k 1M
+     python scripts/benchmark.py --sizes 100k --reports validator --output bench.json
+     python scripts/benchmark.py --sizes 1M --backend local
+"""
+
+from datetime import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from pp_analytics.fields import report_fields
+from pp_analytics.snapshot import PROJECT_DIR, SCRIPTS_DIR, read_manifest
+from pp_analytics.synthetic import dataset_info, write_dataset
+from run_reports import REPORTS
+
+DEFAULT_BENCH_DIR = os.path.join(PROJECT_DIR, '.bench')
+DEFAULT_SIZES = ['10k', '100k']
+BACKENDS = ('snapshots', 'local')
+
+_SUFFIXES = {'k': 1_000, 'm': 1_000_000}
+
+
+def parse_size(text):
+    """'10k' -> 10000, '1M' -> 1000000, '2500' -> 2500."""
+    text = text.strip().lower().replace('_', '')
+    if text and text[-1] in _SUFFIXES:
+        return int(float(text[:-1]) * _SUFFIXES[text[-1]])
+    return int(text)
+
+
+def prepare_dataset(size, seed=0, bench_dir=None):
+    """Return the snapshot directory of a synthetic dataset, writing it if needed."""
+    path = os.path.join(bench_dir or DEFAULT_BENCH_DIR, f"{size}-seed{seed}")
+    if dataset_info(path) == {'size': size, 'seed': seed}:
+        return path
+    print(f"Generating synthetic dataset (size {size:,}, seed {seed}) in {path}")
+    started = time.perf_counter()
+    write_dataset(size, path=path, seed=seed)
+    print(f"  done in {time.perf_counter() - started:.1f}s")
+    return path
+
+
+def _is_rule(line):
+    return len(line) >= 10 and set(line) == {'='}
+
+
+def _peak_rss_mb(rusage):
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return rusage.ru_maxrss * scale / 1024 / 1024
+
+
+def _report_env(backend, data_dir, scratch_dir):
+    env = dict(os.environ)
+    env['PP_SNAPSHOT_INCREMENTAL'] = ''
+    if backend == 'local':
+        env.update({
+            'PP_FIRESTORE_BACKEND': 'local',
+            'PP_LOCAL_DATA': data_dir,
+            'PP_SNAPSHOT_DIR': scratch_dir,
+        })
+    else:
+        env.update({
+            'PP_FIRESTORE_BACKEND': 'firestore',
+            'PP_SNAPSHOT_DIR': data_dir,
+            'PP_SNAPSHOT_TTL_HOURS': 'inf',
+            'PP_SERVICE_ACCOUNT_KEY': os.path.join(data_dir, 'no-credentials.json'),
+        })
+    return env
+
+
+def run_report(name, data_dir, backend='snapshots'):
+    """
+    Run one report in a child process against a synthetic dataset.
+
+    Returns:
+        {'report', 'seconds', 'peak_rss_mb', 'docs', 'docs_per_s', 'sections',
+         'returncode'}; on failure also 'output' (the last lines printed)
+    """
+    fields_key, module_name, _ = REPORTS[name]
+    manifest = read_manifest(data_dir)
+    docs = sum(manifest[collection]['doc_count'] for collection in report_fields(fields_key))
+
+    scratch_dir = tempfile.mkdtemp(prefix='pp-bench-')
+    env = _report_env(backend, data_dir, scratch_dir)
+    command = [sys.executable, '-u', os.path.join(SCRIPTS_DIR, f"{module_name}.py")]
+
+    sections = [['load', 0.0]]
+    lines = ['', '']
+    started = time.perf_counter()
+    proc = subprocess.Popen(command, cwd=SCRIPTS_DIR, env=env, text=True,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    title_at = 0.0
+    for line in proc.stdout:
+        now = time.perf_counter() - started
+        line = line.rstrip('\n')
+        # A heading is a line framed by two rules: =====, TITLE, =====
+        if _is_rule(line) and _is_rule(lines[-2]) and lines[-1].strip() and not _is_rule(lines[-1]):
+            sections.append([lines[-1].strip(), title_at])
+        title_at = now
+        lines = lines[-20:] + [line]
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    seconds = time.perf_counter() - started
+    shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    result = {
+        'report': name,
+        'backend': backend,
+        'seconds': round(seconds, 3),
+        'peak_rss_mb': round(_peak_rss_mb(rusage), 1),
+        'docs': docs,
+        'docs_per_s': round(docs / seconds) if seconds else None,
+        'sections': [],
+        'returncode': proc.returncode,
+    }
+    ends = [start for _, start in sections[1:]] + [seconds]
+    for (title, start), end in zip(sections, ends):
+        elapsed = end - start
+        result['sections'].append({
+            'section': title,
+            'seconds': round(elapsed, 3),
+            'docs_per_s': round(docs / elapsed) if elapsed >= 0.001 else None,
+        })
+    if proc.returncode != 0:
+        result['output'] = lines[-20:]
+    return result
+
+
+def print_result(result):
+    status = '' if result['returncode'] == 0 else f"  FAILED (exit {result['returncode']})"
+    print(f"\n  {result['report']}: {result['seconds']:.2f}s, peak RSS {result['peak_rss_mb']:.0f} MB, "
+          f"{result['docs']:,} docs, {result['docs_per_s'] or 0:,} docs/s{status}")
+    for section in result['sections']:
+        rate = f"{section['docs_per_s']:,} docs/s" if section['docs_per_s'] else '-'
+        print(f"    {section['section'][:44]:<44} {section['seconds']:>9.3f}s  {rate:>18}")
+    if result['returncode'] != 0:
+        print('\n'.join(f"    | {line}" for line in result['output']))
+
+
+def run_benchmarks(sizes=None, reports=None, seed=0, bench_dir=None, backend='snapshots'):
+    """
+    Benchmark reports across dataset sizes.
+
+    Args:
+        sizes: Dataset sizes (ints or strings like '100k'; default: DEFAULT_SIZES)
+        reports: Report names from run_reports.REPORTS (default: all)
+        seed: Synthetic data seed
+        bench_dir: Where datasets are kept (default: <project>/.bench)
+        backend: 'snapshots' (warm runs) or 'local' (cold runs on local.py)
+
+    Returns:
+        List of {'size', 'seed', **run_report() result}
+    """
+    sizes = [parse_size(str(size)) for size in sizes or DEFAULT_SIZES]
+    reports = [name for name in REPORTS if reports is None or name in reports]
+
+    results = []
+    for size in sizes:
+        data_dir = prepare_dataset(size, seed=seed, bench_dir=bench_dir)
+        print(f"\n{'='*60}")
+        print(f"SIZE {size:,} (seed {seed}, {backend} backend)")
+        print(f"{'='*60}")
+        for name in reports:
+            result = run_report(name, data_dir, backend=backend)
+            print_result(result)
+            results.append({'size': size, 'seed': seed, **result})
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the reports offline on synthetic data.")
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES, metavar='SIZE',
+                        help=f"Dataset sizes, e.g. 10k 100k 1M (default: {' '.join(DEFAULT_SIZES)})")
+    parser.add_argument('--reports', nargs='+', choices=list(REPORTS), default=None, metavar='REPORT',
+                        help=f"Reports to run (default: all). Choices: {', '.join(REPORTS)}")
+    parser.add_argument('--seed', type=int, default=0, help="Synthetic data seed (default: 0)")
+    parser.add_argument('--bench-dir', default=None, metavar='DIR',
+                        help="Where synthetic datasets are kept (default: <project>/.bench)")
+    parser.add_argument('--backend', choices=BACKENDS, default='snapshots',
+                        help="snapshots: warm runs from the dataset's snapshots (default); "
+                             "local: cold runs through the in-process Firestore backend")
+    parser.add_argument('--output', default=None, metavar='FILE', help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    results = run_benchmarks(sizes=args.sizes, reports=args.reports, seed=args.seed, bench_dir=args.bench_dir,
+                             backend=args.backend)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'generated_at': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'results': results,
+            }, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if any(result['returncode'] != 0 for result in results):
+        raise SystemExit(1)
@@ -12,39 +12,78 @@ Generates and optionally executes cleanup tasks:
 IMPORTANT: Run with dry_run=True first to see what would be changed!
 
 Run: python scripts/data_cleanup.py
+Execute: python scripts/data_cleanup.py --execute
 """
 
-from google.cloud import firestore
-from google.oauth2 import service_account
 from datetime import datetime, timedelta
 from collections import defaultdict
-import os
-
-# Initialize Firestore with service account
-script_dir = os.path.dirname(os.path.abspath(__file__))
-project_dir = os.path.dirname(script_dir)
-key_path = os.path.join(project_dir, 'serviceAccountKey.json')
-
-if os.path.exists(key_path):
-    credentials = service_account.Credentials.from_service_account_file(key_path)
-    db = firestore.Client(credentials=credentials, project=credentials.project_id)
-else:
-    print(f"ERROR: Service account key not found at: {key_path}")
-    print("\nTo fix this:")
-    print("1. Go to Firebase Console → Project Settings → Service Accounts")
-    print("2. Click 'Generate new private key'")
-    print("3. Save the file as 'serviceAccountKey.json' in your project root")
-    print(f"   Expected location: {key_path}")
-    exit(1)
-
-
-def generate_cleanup_tasks(dry_run=True):
+
+from pp_analytics.aggregations import count_documents
+from pp_analytics.antijoin import anti_join
+from pp_analytics.client import CredentialsNotFound, client, print_credentials_help
+from pp_analytics.columns import DICTIONARY, iter_column_batches
+from pp_analytics.fields import report_fields
+from pp_analytics.scans import add_scan_arguments, configure_scans_from_args
+from pp_analytics.sessions import DEFAULT_GAP_SECONDS, load_sessions, merge_operations
+from pp_analytics.snapshot import (
+    ROW_GROUP_SIZE,
+    add_snapshot_arguments,
+    iter_collection,
+    iter_document_ids,
+    load_collection,
+    state_path,
+)
+from pp_analytics.trace import add_trace_arguments, configure_from_args, section, traced_report
+from pp_analytics.windows import load_window, utc_cutoff
+from pp_analytics.writes import add_write_arguments, execute_writes
+
+
+DEFAULT_ORPHANS_FILE = 'orphaned_feedback.json'
+
+# Typed columns read from each feedback event for the orphan check (see pp_analytics/columns.py)
+FEEDBACK_COLUMNS = {
+    'listing_id': ('listingId', DICTIONARY),
+    'purpose': ('purpose', DICTIONARY),
+}
+
+
+def _gap_label(seconds):
+    """60 -> '1min', 90 -> '90s'."""
+    if seconds >= 60 and seconds % 60 == 0:
+        return f"{seconds / 60:g}min"
+    return f"{seconds:g}s"
+
+
+@traced_report('data_cleanup')
+def generate_cleanup_tasks(dry_run=True, refresh=False, snapshot_ttl=None, incremental=None,
+                           write_concurrency=None, session_gaps=None, merge_sessions=False,
+                           orphans_file=None, db=None, tables=None):
     """
     Generate and optionally execute data cleanup tasks.
 
     Args:
         dry_run: If True, only shows what would be done. If False, executes changes.
+        refresh: If True, re-fetch collections from Firestore instead of using local snapshots.
+            Always on when dry_run is False, so nothing is changed based on stale data.
+        snapshot_ttl: Max age in hours of a local snapshot (default: PP_SNAPSHOT_TTL_HOURS or 12).
+        incremental: If True, update stale snapshots with a delta sync (default: PP_SNAPSHOT_INCREMENTAL).
+        write_concurrency: Batches committed at once when executing (default: PP_WRITE_CONCURRENCY or 8).
+        session_gaps: Gap thresholds in seconds for rapid-fire sessions (default: [60]). The first
+            one decides the cleanup task; the others are reported alongside it.
+        merge_sessions: If True, merge each rapid-fire burst into its first session (only
+            written when dry_run is False).
+        orphans_file: Where the ids of orphaned feedback events are written, grouped by purpose
+            (default: orphaned_feedback.json in the snapshot state directory). Written in
+            dry runs too.
+        db: Firestore client (default: the shared, lazily created client; see pp_analytics/client.py).
+        tables: Collections already loaded this run (see run_reports.py), used instead of fetching.
     """
+    if db is None:
+        db = client
+
+    if not dry_run:
+        refresh = True
+    session_gaps = list(session_gaps or [DEFAULT_GAP_SECONDS])
 
     now = datetime.now()
 
@@ -61,10 +100,13 @@ def generate_cleanup_tasks(dry_run=True):
 
     tasks = []
     executed_tasks = []
+    snapshot_options = {'refresh': refresh, 'ttl_hours': snapshot_ttl, 'incremental': incremental, 'tables': tables}
+    fields = report_fields('data_cleanup')
 
     # ===========================================
     # TASK 1: Clean up old temp listings
     # ===========================================
+    section("TASK 1: Old Temporary Listings")
     print(f"\n{'='*60}")
     print("TASK 1: Old Temporary Listings")
     print(f"{'='*60}")
@@ -73,8 +115,15 @@ def generate_cleanup_tasks(dry_run=True):
     cutoff_30_days = now - timedelta(days=30)
 
     try:
-        # Get all temp listings (can't query by timestamp easily, so fetch all)
-        temp_listings = list(db.collection('listings_temp').stream())
+        # Only temp listings that can be old or stale: created before the 7-day
+        # cutoff, or an open stage with its latest activity before it
+        cutoff = utc_cutoff(cutoff_7_days)
+        open_stages = ['pre_listing', 'active_listing']
+        temp_listings = load_window(db, 'listings_temp', [
+            [('createdAt', '<', cutoff)],
+            [('stage', 'in', open_stages), ('updatedAt', '<', cutoff)],
+            [('stage', 'in', open_stages), ('lastFeedbackAt', '<', cutoff)],
+        ], fields=fields['listings_temp'], **snapshot_options)
 
         old_temp_7d = []
         old_temp_30d = []
@@ -103,7 +152,7 @@ def generate_cleanup_tasks(dry_run=True):
 
             # Check for stale entries with no outcome
             stage = data.get('stage')
-            if stage in ['pre_listing', 'active_listing'] and latest_activity:
+            if stage in open_stages and latest_activity:
                 if latest_activity < cutoff_7_days:
                     stale_no_activity.append(doc)
 
@@ -120,25 +169,34 @@ def generate_cleanup_tasks(dry_run=True):
             })
 
             if not dry_run:
-                batch = db.batch()
-                for doc in old_temp_30d[:500]:  # Batch limit is 500
-                    batch.delete(doc.reference)
-                batch.commit()
-                executed_tasks.append(f"Deleted {min(len(old_temp_30d), 500)} old temp listings")
-                print(f"✓ Deleted {min(len(old_temp_30d), 500)} old temp listings")
-
+                # Split into 500-write batches, committed in parallel; an
+                # interrupted run resumes from the checkpoint
+                result = execute_writes(
+                    db, [('delete', doc.reference) for doc in old_temp_30d],
+                    checkpoint='delete_old_temp_listings', max_workers=write_concurrency,
+                )
+                executed_tasks.append(f"Deleted {result['written']} old temp listings")
+                print(f"✓ Deleted {result['written']} old temp listings")
+                if result['skipped']:
+                    print(f"  {result['skipped']} were already deleted by an interrupted earlier run")
+                if result['failed']:
+                    print(f"✗ {result['failed']} deletes failed; re-run to retry them")
+
+    except CredentialsNotFound:
+        raise
     except Exception as e:
         print(f"Error checking temp listings: {e}")
 
     # ===========================================
     # TASK 2: Flag incomplete soldPrices
     # ===========================================
+    section("TASK 2: Incomplete Sold Prices Records")
     print(f"\n{'='*60}")
     print("TASK 2: Incomplete Sold Prices Records")
     print(f"{'='*60}")
 
     try:
-        sold_prices = list(db.collection('soldPrices').stream())
+        sold_prices = load_collection(db, 'soldPrices', fields=fields['soldPrices'], **snapshot_options)
 
         incomplete_records = []
         fixable_records = []
@@ -200,136 +258,148 @@ def generate_cleanup_tasks(dry_run=True):
             for rec in incomplete_records[:20]:
                 print(f"  - {rec['id']}: {', '.join(rec['issues'])}")
 
+    except CredentialsNotFound:
+        raise
     except Exception as e:
         print(f"Error checking sold prices: {e}")
 
     # ===========================================
     # TASK 3: Identify duplicate/suspicious sessions
     # ===========================================
+    section("TASK 3: Session Cleanup")
     print(f"\n{'='*60}")
     print("TASK 3: Session Cleanup")
     print(f"{'='*60}")
 
     try:
-        sessions = list(db.collection('sessions').stream())
-
-        # Group sessions by user
-        user_sessions = defaultdict(list)
-        orphan_sessions = []
-        very_short_sessions = []
-
-        for session in sessions:
-            data = session.to_dict()
-            user_id = data.get('userId')
-            start_time = data.get('startTime')
-            duration = data.get('duration', 0)
-
-            # Convert timestamps
-            if start_time and hasattr(start_time, 'timestamp'):
-                start_time = datetime.fromtimestamp(start_time.timestamp())
-
-            session_info = {
-                'doc': session,
-                'start_time': start_time,
-                'duration': duration,
-                'is_guest': data.get('isGuest', False)
-            }
-
-            if user_id:
-                user_sessions[user_id].append(session_info)
+        # Columnar: one global sort by (user, start time) finds rapid-fire
+        # sessions for every gap threshold (see pp_analytics/sessions.py)
+        sessions = iter_collection(db, 'sessions', fields=fields['sessions'], **snapshot_options)
+        session_table = load_sessions(sessions)
+        bursts = [session_table.bursts(gap) for gap in session_gaps]
+        rapid = bursts[0]
+
+        orphan_sessions = int((session_table.user < 0).sum())
+        duration = session_table.duration
+        # Very short sessions (< 10 seconds); missing durations compare False
+        very_short_sessions = int(((duration != 0) & (duration < 10000)).sum())  # milliseconds
+
+        print(f"Total sessions: {len(session_table)}")
+        print(f"Sessions without user_id: {orphan_sessions}")
+        print(f"Very short sessions (<10s): {very_short_sessions}")
+        for gap_bursts in bursts:
+            label = _gap_label(gap_bursts.gap_seconds)
+            print(f"Rapid-fire session pairs (<{label} apart): {gap_bursts.pair_count}")
+            print(f"Rapid-fire bursts (<{label} apart): {gap_bursts.burst_count} "
+                  f"({gap_bursts.session_count} sessions, largest {gap_bursts.max_size()})")
+
+        if rapid.pair_count:
+            if merge_sessions:
+                tasks.append({
+                    'name': 'Merge rapid-fire sessions into the first session of each burst',
+                    'count': rapid.pair_count,
+                    'action': 'merge'
+                })
             else:
-                orphan_sessions.append(session)
-
-            # Very short sessions (< 10 seconds)
-            if duration and duration < 10000:  # milliseconds
-                very_short_sessions.append(session)
-
-        # Find rapid-fire sessions (potential duplicates)
-        rapid_sessions = []
-        for user_id, sessions_list in user_sessions.items():
-            sorted_sessions = sorted(sessions_list, key=lambda x: x['start_time'] or datetime.min)
-
-            for i in range(len(sorted_sessions) - 1):
-                current = sorted_sessions[i]['start_time']
-                next_sess = sorted_sessions[i + 1]['start_time']
-
-                if current and next_sess:
-                    gap = (next_sess - current).total_seconds()
-                    if gap < 60:  # Sessions within 1 minute
-                        rapid_sessions.append({
-                            'user_id': user_id,
-                            'session1': sorted_sessions[i]['doc'].id,
-                            'session2': sorted_sessions[i + 1]['doc'].id,
-                            'gap_seconds': gap
-                        })
-
-        print(f"Total sessions: {len(sessions)}")
-        print(f"Sessions without user_id: {len(orphan_sessions)}")
-        print(f"Very short sessions (<10s): {len(very_short_sessions)}")
-        print(f"Rapid-fire session pairs (<1min apart): {len(rapid_sessions)}")
-
-        if rapid_sessions:
-            tasks.append({
-                'name': 'Review potential duplicate sessions',
-                'count': len(rapid_sessions),
-                'action': 'review'
-            })
+                tasks.append({
+                    'name': 'Review potential duplicate sessions',
+                    'count': rapid.pair_count,
+                    'action': 'review'
+                })
             print(f"\nFirst 10 rapid session pairs:")
-            for pair in rapid_sessions[:10]:
+            for pair in rapid.pairs(limit=10):
                 print(f"  User {pair['user_id']}: {pair['session1']} -> {pair['session2']} ({pair['gap_seconds']:.1f}s gap)")
-
+            print(f"\nLargest rapid-fire bursts:")
+            for burst in rapid.describe(limit=5, largest_first=True):
+                print(f"  User {burst['user_id']}: {len(burst['session_ids'])} sessions over "
+                      f"{burst['span_seconds']:.1f}s ({', '.join(burst['session_ids'])})")
+
+            if merge_sessions and not dry_run:
+                # The first session of each burst absorbs the rest, which are
+                # deleted in the same batch
+                result = execute_writes(
+                    db, merge_operations(db, rapid),
+                    checkpoint='merge_rapid_sessions', max_workers=write_concurrency,
+                )
+                # Each merge is one update plus a delete per session removed
+                merged = (f"Merged {result['written'] - result['groups_written']} duplicate sessions "
+                          f"into {result['groups_written']} sessions")
+                executed_tasks.append(merged)
+                print(f"✓ {merged}")
+                if result['groups_skipped']:
+                    print(f"  {result['groups_skipped']} bursts were already merged by an interrupted earlier run")
+                if result['failed']:
+                    print(f"✗ {result['failed']} writes failed; re-run to retry them")
+            elif merge_sessions:
+                print(f"\nWould merge {rapid.pair_count} duplicate sessions into {rapid.burst_count} sessions")
+
+    except CredentialsNotFound:
+        raise
     except Exception as e:
         print(f"Error checking sessions: {e}")
 
     # ===========================================
     # TASK 4: Orphaned feedback events
     # ===========================================
+    section("TASK 4: Orphaned Feedback Events")
     print(f"\n{'='*60}")
     print("TASK 4: Orphaned Feedback Events")
     print(f"{'='*60}")
 
     try:
-        feedback_events = list(db.collection('feedback_events').stream())
-        listings = {doc.id: doc.to_dict() for doc in db.collection('listings').stream()}
-        listings_temp = {doc.id: doc.to_dict() for doc in db.collection('listings_temp').stream()}
-
-        orphaned_feedback = []
-
-        for feedback in feedback_events:
-            data = feedback.to_dict()
-            listing_id = data.get('listingId')
-
-            if listing_id:
-                # Check if listing exists in either collection
-                if listing_id not in listings and listing_id not in listings_temp:
-                    orphaned_feedback.append({
-                        'feedback_id': feedback.id,
-                        'listing_id': listing_id,
-                        'purpose': data.get('purpose'),
-                        'created': data.get('createdAt')
-                    })
-
-        print(f"Total feedback events: {len(feedback_events)}")
+        # Anti-join on ids only: listing ids are indexed compactly (or in a
+        # Bloom filter when there are very many) and feedback events are
+        # streamed against them (see pp_analytics/antijoin.py)
+        listing_collections = ['listings', 'listings_temp']
+        id_options = {'refresh': refresh, 'ttl_hours': snapshot_ttl, 'incremental': incremental, 'tables': tables}
+        expected_ids = sum(count_documents(db, name, refresh=refresh, ttl_hours=snapshot_ttl, tables=tables)
+                           for name in listing_collections)
+
+        def feedback_batches():
+            feedback_events = iter_collection(db, 'feedback_events', fields=fields['feedback_events'],
+                                              **snapshot_options)
+            return iter_column_batches(feedback_events, FEEDBACK_COLUMNS, batch_size=ROW_GROUP_SIZE)
+
+        orphaned_feedback, join_stats = anti_join(
+            feedback_batches, 'listing_id',
+            [lambda name=name: iter_document_ids(db, name, **id_options) for name in listing_collections],
+            expected_ids=expected_ids,
+        )
+
+        print(f"Total feedback events: {join_stats['rows']}")
+        index = 'exact id set' if join_stats['mode'] == 'exact' else 'Bloom filter'
+        print(f"Listing ids checked: {join_stats['ids']} ({index}, {join_stats['index_bytes'] / 1024 / 1024:.1f} MB)")
+        if join_stats['mode'] == 'bloom':
+            print(f"  Verified {join_stats['candidates']} matched listing ids; "
+                  f"{join_stats['false_positives']} false positives")
         print(f"Orphaned feedback (no matching listing): {len(orphaned_feedback)}")
 
-        if orphaned_feedback:
-            tasks.append({
+        if len(orphaned_feedback):
+            by_purpose = group_orphaned_feedback(orphaned_feedback)
+            task = {
                 'name': 'Review orphaned feedback events',
                 'count': len(orphaned_feedback),
-                'action': 'review'
-            })
+                'action': 'review',
+            }
+            tasks.append(task)
 
             # These might still be valuable for aggregate data, so don't auto-delete
-            print(f"\nFirst 10 orphaned feedback events:")
-            for fb in orphaned_feedback[:10]:
-                print(f"  - {fb['feedback_id']} -> listing {fb['listing_id']} ({fb['purpose']})")
-
+            print(f"\nOrphaned feedback by purpose:")
+            for purpose, entries in sorted(by_purpose.items(), key=lambda x: len(x[1]), reverse=True):
+                print(f"  {purpose}: {len(entries)}")
+            # A review file, not a change: written in dry runs too
+            task['file'] = write_orphaned_feedback(by_purpose, orphans_file)
+            print(f"Orphaned feedback ids written to {task['file']}")
+
+    except CredentialsNotFound:
+        raise
     except Exception as e:
         print(f"Error checking feedback events: {e}")
 
     # ===========================================
     # TASK 5: Data integrity checks
     # ===========================================
+    section("TASK 5: Data Integrity Issues")
     print(f"\n{'='*60}")
     print("TASK 5: Data Integrity Issues")
     print(f"{'='*60}")
@@ -338,7 +408,7 @@ def generate_cleanup_tasks(dry_run=True):
 
     try:
         # Check for listings with impossible prices
-        listings_all = list(db.collection('listings').stream())
+        listings_all = load_collection(db, 'listings', fields=fields['listings'], **snapshot_options)
 
         for listing in listings_all:
             data = listing.to_dict()
@@ -383,12 +453,15 @@ def generate_cleanup_tasks(dry_run=True):
                 print(f"  - {issue['id']}: {', '.join(issue['issues'])}")
                 print(f"    Pricing: {issue['pricing']}")
 
+    except CredentialsNotFound:
+        raise
     except Exception as e:
         print(f"Error checking data integrity: {e}")
 
     # ===========================================
     # SUMMARY
     # ===========================================
+    section("CLEANUP SUMMARY")
     print(f"\n{'='*60}")
     print("CLEANUP SUMMARY")
     print(f"{'='*60}")
@@ -406,17 +479,60 @@ def generate_cleanup_tasks(dry_run=True):
         print(f"\n{'='*60}")
         print("TO EXECUTE CLEANUP:")
         print(f"{'='*60}")
-        print("Run with: generate_cleanup_tasks(dry_run=False)")
+        print("Run with: python scripts/data_cleanup.py --execute")
         print("\n⚠️  Review the changes above before executing!")
 
     return tasks
 
 
-def export_incomplete_records(output_file='incomplete_records.json'):
+def group_orphaned_feedback(orphaned):
+    """
+    Group orphaned feedback events as {purpose: [{'feedback_id', 'listing_id'}]}.
+
+    Args:
+        orphaned: DataFrame of FEEDBACK_COLUMNS rows (from anti_join())
+    """
+    by_purpose = defaultdict(list)
+    purposes = orphaned['purpose'].astype(object).where(orphaned['purpose'].notna(), '(none)')
+    for feedback_id, listing_id, purpose in zip(orphaned['id'], orphaned['listing_id'].astype(object), purposes):
+        by_purpose[purpose].append({'feedback_id': feedback_id, 'listing_id': listing_id})
+    return by_purpose
+
+
+def write_orphaned_feedback(by_purpose, output_file=None):
+    """
+    Write grouped orphaned feedback events (from group_orphaned_feedback()) as JSON.
+
+    Args:
+        by_purpose: {purpose: entries} dict
+        output_file: JSON file to write (default: orphaned_feedback.json in the
+            snapshot state directory)
+
+    Returns:
+        The path written
+    """
+    import json
+
+    if output_file is None:
+        output_file = state_path(DEFAULT_ORPHANS_FILE)
+    with open(output_file, 'w') as f:
+        json.dump({
+            'generated_at': datetime.now().isoformat(timespec='seconds'),
+            'count': sum(len(entries) for entries in by_purpose.values()),
+            'by_purpose': by_purpose,
+        }, f, indent=2, default=str)
+    return output_file
+
+
+def export_incomplete_records(output_file='incomplete_records.json',
+                              refresh=False, snapshot_ttl=None, incremental=None, db=None):
     """Export incomplete soldPrices records for manual review."""
     import json
 
-    sold_prices = list(db.collection('soldPrices').stream())
+    if db is None:
+        db = client
+
+    sold_prices = load_collection(db, 'soldPrices', refresh=refresh, ttl_hours=snapshot_ttl, incremental=incremental)
     incomplete = []
 
     for doc in sold_prices:
@@ -451,11 +567,37 @@ def export_incomplete_records(output_file='incomplete_records.json'):
 
 
 if __name__ == "__main__":
-    # Run in dry-run mode first
-    tasks = generate_cleanup_tasks(dry_run=True)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Identify and optionally execute data cleanup tasks.")
+    parser.add_argument('--execute', action='store_true',
+                        help="Actually execute the cleanup (BE CAREFUL!). Default is a dry run.")
+    add_snapshot_arguments(parser)
+    add_scan_arguments(parser)
+    parser.add_argument('--session-gap', type=float, nargs='+', default=None, metavar='SECONDS',
+                        help=f"Gap thresholds for rapid-fire sessions (default: {DEFAULT_GAP_SECONDS}); "
+                             "the first one is used for the cleanup task")
+    parser.add_argument('--orphans-file', default=None, metavar='FILE',
+                        help=f"Where orphaned feedback event ids are written "
+                             f"(default: {DEFAULT_ORPHANS_FILE} in the snapshot state directory)")
+    parser.add_argument('--merge-sessions', action='store_true',
+                        help="Merge each rapid-fire burst into its first session (with --execute)")
+    add_write_arguments(parser)
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+    configure_scans_from_args(args)
+
+    # Dry run unless --execute is given
+    try:
+        tasks = generate_cleanup_tasks(dry_run=not args.execute, refresh=args.refresh,
+                                       snapshot_ttl=args.snapshot_ttl, incremental=args.incremental,
+                                       write_concurrency=args.write_concurrency,
+                                       session_gaps=args.session_gap, merge_sessions=args.merge_sessions,
+                                       orphans_file=args.orphans_file)
+    except CredentialsNotFound as e:
+        print_credentials_help(e)
+        raise SystemExit(1)
 
     # Uncomment to export incomplete records for review:
     # export_incomplete_records()
-
-    # Uncomment to actually execute cleanup (BE CAREFUL!):
-    # tasks = generate_cleanup_tasks(dry_run=False)
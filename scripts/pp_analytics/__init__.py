@@ -0,0 +1,26 @@
+"""
+Precision Prices - shared helpers for the analytics scripts.
+
+Modules:
+- client: lazily created, shared Firestore client
+- snapshot: local Parquet snapshots of Firestore collections
+- sync: incremental (watermark-based) updates of those snapshots
+- fetch: concurrent loading of several collections
+- scans: partitioned full collection scans, id ranges streamed in parallel and resumed on deadline errors
+- sketches: mergeable running statistics and quantile sketches
+- fields: per-report field manifest used for select() projections
+- aggregations: document counts and sums without downloading documents
+- writes: chunked, parallel, checkpointed batch writes
+- windows: time-windowed loads pushed down into Firestore queries
+- columns: typed columnar (NumPy/pandas) views of document batches
+- sessions: vectorized rapid-fire (duplicate) session detection and merging
+- antijoin: id-only anti-joins (exact id set or Bloom filter) for orphan checks
+- activity_matrix: user x activity-type count matrix with bitset funnels
+- active_users: persisted per-day HyperLogLog sketches for DAU/WAU/MAU series
+- cohorts: incrementally maintained weekly cohort retention (signup week x weeks since)
+- accuracy: persisted match ledger, mergeable accuracy accumulators and daily drift series for the validator
+- bootstrap: seeded, vectorized bootstrap confidence intervals per group, in a process pool
+- synthetic: seeded synthetic datasets for offline runs and benchmarks
+- local: in-process Firestore stand-in over local fixtures (PP_FIRESTORE_BACKEND=local)
+- trace: per-section timing, memory and read-count tracing and profiling (--trace)
+"""
@@ -0,0 +1,683 @@
+# accuracy.py
+"""
+Persisted, incrementally updated accuracy statistics for the AI accuracy
+validator.
+
+Sold outcomes only accumulate, so the validator keeps what it has already
+worked out under the snapshot directory (state/accuracy/):
+
+- a match ledger: one row per outcome document matched to a listing
+  (feedback event id or temp listing id, with the listing id, prices and
+  errors), appended one Parquet part per run. Runs read only the columns,
+  and rows, a section needs from it (see AccuracyLedger.columns())
+- outcome statuses: the status of every outcome document examined, so a
+  run only decodes and joins documents it hasn't settled. Each run appends
+  one Parquet part with the statuses it set or changed (the latest wins);
+  once there are OUTCOME_PARTS_MAX parts they are merged into one
+- mergeable accumulators (AccuracyStats): count and sums of errors,
+  absolute errors and percentage errors, accuracy bands, direction counts
+  and a quantile sketch of percentage error, overall and per category,
+  condition and price bucket, plus the days-to-sell bands and correlation
+  sums
+- daily cells: the same sums per UTC day of the sale and group key, from
+  which drift_series() builds rolling-window MAE/MAPE/bias series
+- the listing ids matched by sold feedback events, so a repeated sale is
+  recognised without reading the ledger
+- meta.json: the accumulators (with their quantile sketches), match counts
+  per source and method, outcome counts per source and status, when the
+  listings matched against were fetched, and the current match and outcome
+  parts, cell and listing id files; written last, so a run that stops early
+  is simply done again
+
+Outcome statuses:
+- matched: in the ledger; never looked at again
+- not_outcome: a feedback event that isn't a sale (events don't change)
+- unmatched: a sale whose listing wasn't found, or whose prices are
+  unusable; tried again when the listings were fetched again since
+- name_only: a sold temp listing whose item name matched a listing without
+  a usable AI price; tried again like unmatched
+- duplicate: a sold feedback event for a listing that an earlier sold event
+  was already matched to (a listing sells once)
+
+A match is frozen when it is first made: later edits of the listing don't
+change it. Fuzzy name matches depend on the run's options, so they are
+never stored (see ai_accuracy_validator.py).
+"""
+
+import json
+import os
+import shutil
+
+from pp_analytics.columns import NAT
+from pp_analytics.sketches import QuantileSketch
+from pp_analytics.snapshot import state_path
+
+STORE_NAME = 'accuracy'
+META_NAME = 'meta.json'
+LEDGER_VERSION = 5  # state written by another version is rebuilt
+OUTCOME_PARTS_MAX = 32
+
+# Same bins as the validator's price range section
+PRICE_BINS = [0, 25, 50, 100, 250, 500, 1000, float('inf')]
+PRICE_LABELS = ['$0-25', '$25-50', '$50-100', '$100-250', '$250-500', '$500-1K', '$1K+']
+
+ACCURACY_BANDS = (10, 20, 30)  # percentage error thresholds
+GROUPS = ('category', 'condition', 'price_bucket')
+
+# Ledger columns, in order (days_to_sell is NaN for feedback matches; sold_at
+# is epoch ns, NAT if the outcome has no timestamp)
+MATCH_COLUMNS = ['outcome_id', 'source', 'match', 'listing_id', 'category', 'condition', 'item_name',
+                 'ai_price', 'actual_price', 'error', 'abs_error', 'pct_error', 'direction', 'days_to_sell',
+                 'sold_at']
+
+# Sums kept per day and group key (see daily_cells())
+DAY_METRICS = ['count', 'sum_error', 'sum_abs_error', 'sum_pct_error', 'within_10', 'within_20', 'within_30']
+CELL_COLUMNS = ['day', 'group', 'key'] + DAY_METRICS
+_DAY_NS = 86_400 * 1_000_000_000
+
+MATCHED = 'matched'
+NOT_OUTCOME = 'not_outcome'
+UNMATCHED = 'unmatched'
+NAME_ONLY = 'name_only'
+DUPLICATE = 'duplicate'
+
+# Days-to-sell bands of the validator: (label, low exclusive, high inclusive)
+DAYS_TO_SELL_BANDS = (('quick', None, 3), ('medium', 3, 14), ('slow', 14, None))
+
+
+def price_buckets(actual_price):
+    """The validator's price range of each actual price (pd.cut, right-closed bins)."""
+    import pandas as pd
+
+    return pd.cut(actual_price, bins=PRICE_BINS, labels=PRICE_LABELS)
+
+
+class ErrorStats:
+    """
+    Mergeable prediction error statistics of a set of matches.
+
+    Errors are actual - AI price; percentage errors are |error| / actual * 100.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.count = 0
+        self.sum_error = 0.0
+        self.sum_abs_error = 0.0
+        self.sum_pct_error = 0.0
+        self.within = {band: 0 for band in ACCURACY_BANDS}
+        self.directions = {'over': 0, 'under': 0, 'exact': 0}
+        self.sum_over_error = 0.0
+        self.sum_under_error = 0.0
+        self.pct_error_sketch = QuantileSketch(relative_accuracy)
+
+    def add_frame(self, frame):
+        """Add matches: a DataFrame with error, abs_error, pct_error and direction columns."""
+        if not len(frame):
+            return self
+        pct_error = frame['pct_error'].to_numpy(dtype=float)
+        direction = frame['direction'].to_numpy()
+        error = frame['error'].to_numpy(dtype=float)
+        self.count += len(frame)
+        self.sum_error += float(error.sum())
+        self.sum_abs_error += float(frame['abs_error'].to_numpy(dtype=float).sum())
+        self.sum_pct_error += float(pct_error.sum())
+        for band in ACCURACY_BANDS:
+            self.within[band] += int((pct_error <= band).sum())
+        for name in self.directions:
+            self.directions[name] += int((direction == name).sum())
+        self.sum_over_error += float(error[direction == 'over'].sum())
+        self.sum_under_error += float(error[direction == 'under'].sum())
+        self.pct_error_sketch.add_many(pct_error)
+        return self
+
+    def merge(self, other):
+        self.count += other.count
+        self.sum_error += other.sum_error
+        self.sum_abs_error += other.sum_abs_error
+        self.sum_pct_error += other.sum_pct_error
+        for band in ACCURACY_BANDS:
+            self.within[band] += other.within[band]
+        for name in self.directions:
+            self.directions[name] += other.directions[name]
+        self.sum_over_error += other.sum_over_error
+        self.sum_under_error += other.sum_under_error
+        self.pct_error_sketch.merge(other.pct_error_sketch)
+        return self
+
+    def _mean(self, total, count=None):
+        count = self.count if count is None else count
+        return total / count if count else float('nan')
+
+    @property
+    def mae(self):
+        return self._mean(self.sum_abs_error)
+
+    @property
+    def mape(self):
+        return self._mean(self.sum_pct_error)
+
+    @property
+    def bias(self):
+        """Mean error (actual - AI): negative when the AI over-predicts."""
+        return self._mean(self.sum_error)
+
+    @property
+    def avg_over_error(self):
+        return self._mean(self.sum_over_error, self.directions['over'])
+
+    @property
+    def avg_under_error(self):
+        return self._mean(self.sum_under_error, self.directions['under'])
+
+    def median_pct_error(self):
+        """Approximate median percentage error (quantile sketch, 1% relative)."""
+        return self.pct_error_sketch.quantile(0.5)
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum_error': self.sum_error,
+            'sum_abs_error': self.sum_abs_error,
+            'sum_pct_error': self.sum_pct_error,
+            'within': {str(band): n for band, n in self.within.items()},
+            'directions': dict(self.directions),
+            'sum_over_error': self.sum_over_error,
+            'sum_under_error': self.sum_under_error,
+            'pct_error_sketch': self.pct_error_sketch.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.count = data['count']
+        stats.sum_error = data['sum_error']
+        stats.sum_abs_error = data['sum_abs_error']
+        stats.sum_pct_error = data['sum_pct_error']
+        stats.within = {int(band): n for band, n in data['within'].items()}
+        stats.directions = dict(data['directions'])
+        stats.sum_over_error = data['sum_over_error']
+        stats.sum_under_error = data['sum_under_error']
+        stats.pct_error_sketch = QuantileSketch.from_dict(data['pct_error_sketch'])
+        return stats
+
+
+class DaysToSellStats:
+    """Percentage error by days-to-sell band, plus the sums for their Pearson correlation."""
+
+    def __init__(self):
+        self.bands = {label: [0, 0.0] for label, _, _ in DAYS_TO_SELL_BANDS}  # [count, sum of pct_error]
+        self.n = 0
+        self.sums = {'x': 0.0, 'y': 0.0, 'xx': 0.0, 'yy': 0.0, 'xy': 0.0}  # x: pct_error, y: days
+
+    def add_frame(self, frame):
+        import numpy as np
+
+        if 'days_to_sell' not in frame:
+            return self
+        days = frame['days_to_sell'].to_numpy(dtype=float)
+        known = ~np.isnan(days)
+        days = days[known]
+        pct_error = frame['pct_error'].to_numpy(dtype=float)[known]
+        for label, low, high in DAYS_TO_SELL_BANDS:
+            in_band = np.ones(len(days), dtype=bool)
+            if low is not None:
+                in_band &= days > low
+            if high is not None:
+                in_band &= days <= high
+            self.bands[label][0] += int(in_band.sum())
+            self.bands[label][1] += float(pct_error[in_band].sum())
+        self.n += len(days)
+        for key, values in (('x', pct_error), ('y', days), ('xx', pct_error * pct_error),
+                            ('yy', days * days), ('xy', pct_error * days)):
+            self.sums[key] += float(values.sum())
+        return self
+
+    def merge(self, other):
+        for label in self.bands:
+            self.bands[label][0] += other.bands[label][0]
+            self.bands[label][1] += other.bands[label][1]
+        self.n += other.n
+        for key in self.sums:
+            self.sums[key] += other.sums[key]
+        return self
+
+    def band_mean(self, label):
+        count, total = self.bands[label]
+        return total / count if count else float('nan')
+
+    def correlation(self):
+        """Pearson correlation of percentage error and days to sell (NaN if undefined)."""
+        n, s = self.n, self.sums
+        if n < 2:
+            return float('nan')
+        covariance = n * s['xy'] - s['x'] * s['y']
+        variance = (n * s['xx'] - s['x'] ** 2) * (n * s['yy'] - s['y'] ** 2)
+        return covariance / variance ** 0.5 if variance > 0 else float('nan')
+
+    def to_dict(self):
+        return {'bands': self.bands, 'n': self.n, 'sums': self.sums}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.bands = {label: list(value) for label, value in data['bands'].items()}
+        stats.n = data['n']
+        stats.sums = dict(data['sums'])
+        return stats
+
+
+class AccuracyStats:
+    """ErrorStats overall and per category, condition and price bucket, plus DaysToSellStats."""
+
+    def __init__(self):
+        self.overall = ErrorStats()
+        self.groups = {group: {} for group in GROUPS}
+        self.days_to_sell = DaysToSellStats()
+
+    def add_frame(self, frame):
+        """Add ledger rows (MATCH_COLUMNS); rows without a category/condition skip that group."""
+        if not len(frame):
+            return self
+        frame = frame.assign(price_bucket=price_buckets(frame['actual_price']))
+        self.overall.add_frame(frame)
+        for group in GROUPS:
+            stats = self.groups[group]
+            # groupby drops missing keys, as the validator's groupby did
+            for key, rows in frame.groupby(group, observed=True, sort=False):
+                stats.setdefault(key, ErrorStats()).add_frame(rows)
+        self.days_to_sell.add_frame(frame)
+        return self
+
+    def merge(self, other):
+        self.overall.merge(other.overall)
+        for group in GROUPS:
+            stats = self.groups[group]
+            for key, value in other.groups[group].items():
+                if key in stats:
+                    stats[key].merge(value)
+                else:
+                    stats[key] = ErrorStats().merge(value)
+        self.days_to_sell.merge(other.days_to_sell)
+        return self
+
+    def copy(self):
+        return AccuracyStats().merge(self)
+
+    def table(self, group):
+        """
+        DataFrame of one group's statistics, indexed by key (sorted, as groupby
+        sorts): count, avg_pct_error, median_pct_error, avg_error, avg_abs_error.
+        """
+        import pandas as pd
+
+        stats = self.groups[group]
+        keys = [key for key in PRICE_LABELS if key in stats] if group == 'price_bucket' else sorted(stats)
+        return pd.DataFrame({
+            'avg_pct_error': [stats[key].mape for key in keys],
+            'median_pct_error': [stats[key].median_pct_error() for key in keys],
+            'count': [stats[key].count for key in keys],
+            'avg_error': [stats[key].bias for key in keys],
+            'avg_abs_error': [stats[key].mae for key in keys],
+        }, index=pd.Index(keys, name=group))
+
+    def to_dict(self):
+        return {
+            'overall': self.overall.to_dict(),
+            'groups': {group: {key: value.to_dict() for key, value in self.groups[group].items()}
+                       for group in GROUPS},
+            'days_to_sell': self.days_to_sell.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.overall = ErrorStats.from_dict(data['overall'])
+        stats.groups = {group: {key: ErrorStats.from_dict(value) for key, value in data['groups'][group].items()}
+                        for group in GROUPS}
+        stats.days_to_sell = DaysToSellStats.from_dict(data['days_to_sell'])
+        return stats
+
+
+# ===========================================
+# DRIFT (daily cells and rolling windows)
+# ===========================================
+# Matches are summed once into one row per UTC day and group key (the day of
+# the outcome, not of the run). Sums add up, so new matches, even late ones
+# for old days, only add to their cells, and any window of days is a sum of
+# cells.
+
+def daily_cells(frame):
+    """
+    Per-day sums of matches (MATCH_COLUMNS) for every group key.
+
+    Returns:
+        DataFrame with day (datetime64), group, key and DAY_METRICS columns;
+        all matches together are group 'overall', key 'all'. Matches without
+        sold_at, or without the group's key, are left out.
+    """
+    import numpy as np
+    import pandas as pd
+
+    sold_at = frame['sold_at'].to_numpy(dtype=np.int64)
+    frame = frame[sold_at != NAT]
+    if not len(frame):
+        return pd.DataFrame(columns=CELL_COLUMNS)
+    pct_error = frame['pct_error'].to_numpy(dtype=float)
+    base = pd.DataFrame({
+        'day': pd.to_datetime(sold_at[sold_at != NAT] // _DAY_NS, unit='D'),
+        'count': 1,
+        'sum_error': frame['error'].to_numpy(dtype=float),
+        'sum_abs_error': frame['abs_error'].to_numpy(dtype=float),
+        'sum_pct_error': pct_error,
+        **{f'within_{band}': (pct_error <= band).astype(np.int64) for band in ACCURACY_BANDS},
+    })
+    keys = {
+        'overall': np.full(len(frame), 'all', dtype=object),
+        'category': frame['category'].to_numpy(dtype=object),
+        'condition': frame['condition'].to_numpy(dtype=object),
+        'price_bucket': np.asarray(price_buckets(frame['actual_price']).astype(object)),
+    }
+    parts = [base.assign(key=key).groupby(['day', 'key']).sum().reset_index().assign(group=group)
+             for group, key in keys.items()]
+    return pd.concat(parts, ignore_index=True)[CELL_COLUMNS]
+
+
+def merge_cells(*cells):
+    """Add up daily_cells() frames."""
+    import pandas as pd
+
+    cells = [frame for frame in cells if len(frame)]
+    if len(cells) < 2:
+        return cells[0] if cells else pd.DataFrame(columns=CELL_COLUMNS)
+    return pd.concat(cells, ignore_index=True).groupby(['day', 'group', 'key'], sort=True).sum().reset_index()
+
+
+def drift_series(cells, group='category', freq='D', window=30, start=None, end=None):
+    """
+    Rolling-window accuracy for every key of a group, from daily cells.
+
+    Args:
+        cells: daily_cells() rows (e.g. AccuracyLedger.daily)
+        group: 'overall', 'category', 'condition' or 'price_bucket'
+        freq: 'D' for days or 'W' for weeks (Monday to Sunday, UTC)
+        window: Periods per window, ending at each period (e.g. 30 days or
+            4 weeks); 1 for per-period metrics
+        start, end: First and last day reported (default: the 365 days to
+            the latest cell)
+
+    Returns:
+        DataFrame indexed by (key, period start) with count, mae, mape, bias
+        (mean of actual - AI price) and within_10/20/30 (shares, 0-1) over
+        the window; NaN for windows without matches
+    """
+    import numpy as np
+    import pandas as pd
+
+    rows = cells[cells['group'] == group]
+    columns = ['count', 'mae', 'mape', 'bias'] + [f'within_{band}' for band in ACCURACY_BANDS]
+    if not len(rows):
+        return pd.DataFrame(columns=columns,
+                            index=pd.MultiIndex.from_arrays([[], []], names=['key', 'period']))
+    day = pd.to_datetime(rows['day'])
+    end = pd.Timestamp(end) if end is not None else day.max()
+    start = pd.Timestamp(start) if start is not None else end - pd.Timedelta(days=364)
+    if freq == 'W':
+        period = day - pd.to_timedelta(day.dt.weekday, unit='D')
+        start, end = start - pd.Timedelta(days=start.weekday()), end - pd.Timedelta(days=end.weekday())
+        step = pd.Timedelta(weeks=1)
+    elif freq == 'D':
+        period = day
+        step = pd.Timedelta(days=1)
+    else:
+        raise ValueError(f"Unknown frequency: {freq}")
+
+    # Periods before start are included so the first windows are complete
+    periods = pd.date_range(start - step * (window - 1), end, freq=step)
+    sums = rows.assign(period=period).groupby(['period', 'key'])[DAY_METRICS].sum()
+    wide = sums.unstack('key', fill_value=0).reindex(periods, fill_value=0)
+    rolled = wide.rolling(window, min_periods=1).sum().loc[start:]
+    stacked = rolled.stack('key')
+    stacked.index = stacked.index.set_names(['period', 'key'])
+
+    count = stacked['count'].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        series = pd.DataFrame({
+            'count': stacked['count'].astype(np.int64),
+            'mae': stacked['sum_abs_error'] / count,
+            'mape': stacked['sum_pct_error'] / count,
+            'bias': stacked['sum_error'] / count,
+            **{f'within_{band}': stacked[f'within_{band}'] / count for band in ACCURACY_BANDS},
+        }, index=stacked.index)
+    return series.swaplevel().sort_index()[columns]
+
+
+class AccuracyLedger:
+    """
+    The match ledger, outcome statuses, accumulators and daily cells of earlier runs.
+
+    Args:
+        path: Snapshot directory (default: snapshot.snapshot_dir())
+    """
+
+    def __init__(self, path=None):
+        self.directory = state_path(STORE_NAME, path)
+        os.makedirs(os.path.join(self.directory, 'matches'), exist_ok=True)
+        self.stats = AccuracyStats()
+        self.parts = []
+        # When the listings of the last run were fetched (ISO 8601), or None
+        self.listings_fetched_at = None
+        # {(source, outcome id): status}
+        self.outcomes = {}
+        # {'source/status': outcomes}
+        self.status_counts = {}
+        self.outcome_parts = []
+        # {'source/match': ledger rows}
+        self.match_counts = {}
+        # Listing ids matched by sold feedback events
+        self.feedback_listings = set()
+        self.daily = merge_cells()
+        self.files = {}
+        self._new_rows = []
+        # Statuses set or changed by this run: {(source, outcome id): status}
+        self._new_statuses = {}
+        self._load()
+
+    def _load(self):
+        import pyarrow.parquet as pq
+
+        meta_path = os.path.join(self.directory, META_NAME)
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('version') != LEDGER_VERSION:
+            # Written by another version: start again from the outcomes
+            shutil.rmtree(self.directory)
+            os.makedirs(os.path.join(self.directory, 'matches'))
+            return
+        self.stats = AccuracyStats.from_dict(meta['stats'])
+        # Parts not listed in meta.json were written by a run that didn't finish
+        self.parts = meta['parts']
+        self.listings_fetched_at = meta['listings_fetched_at']
+        self.match_counts = meta['match_counts']
+        self.status_counts = meta['status_counts']
+        self.outcome_parts = meta['outcome_parts']
+        self.files = meta['files']
+        for part in self.outcome_parts:
+            table = pq.read_table(os.path.join(self.directory, 'outcomes', part)).to_pydict()
+            self.outcomes.update(zip(zip(table['source'], table['id']), table['status']))
+        table = pq.read_table(os.path.join(self.directory, self.files['feedback_listings']))
+        self.feedback_listings = set(table.column('listing_id').to_pylist())
+        daily = pq.read_table(os.path.join(self.directory, self.files['daily'])).to_pandas()
+        self.daily = daily.assign(day=daily['day'].astype('datetime64[ns]'))
+
+    def pending(self, source, outcome_id, retry=False):
+        """
+        Whether an outcome document still has to be examined.
+
+        retry: also return unmatched and name_only outcomes (the listings changed,
+            see retry_needed())
+        """
+        status = self.outcomes.get((source, outcome_id))
+        if status is None:
+            return True
+        return retry and status in (UNMATCHED, NAME_ONLY)
+
+    def pending_mask(self, source, outcome_ids, retry=False):
+        """Boolean array: pending() for each of a source's outcome ids."""
+        import numpy as np
+
+        get = self.outcomes.get
+        retried = (UNMATCHED, NAME_ONLY) if retry else ()
+        statuses = [get((source, outcome_id)) for outcome_id in outcome_ids]
+        return np.array([status is None or status in retried for status in statuses], dtype=bool)
+
+    def retry_needed(self, listings_fetched_at):
+        """
+        Whether unmatched outcomes should be tried again: the listings were
+        fetched again since the last run (or when is unknown).
+
+        Args:
+            listings_fetched_at: When this run's listings were fetched (a
+                datetime; None if unknown)
+        """
+        if listings_fetched_at is None:
+            return True
+        return self.listings_fetched_at != listings_fetched_at.isoformat()
+
+    def set_status(self, source, outcome_id, status):
+        key = (source, outcome_id)
+        previous = self.outcomes.get(key)
+        if previous == status:
+            return
+        if previous is not None:
+            self.status_counts[f"{source}/{previous}"] -= 1
+        count_key = f"{source}/{status}"
+        self.status_counts[count_key] = self.status_counts.get(count_key, 0) + 1
+        self.outcomes[key] = status
+        self._new_statuses[key] = status
+
+    def set_statuses(self, source, outcome_ids, status):
+        for outcome_id in outcome_ids:
+            self.set_status(source, outcome_id, status)
+
+    def status_count(self, source, status):
+        """Outcomes of a source with a status."""
+        return self.status_counts.get(f"{source}/{status}", 0)
+
+    def add_matches(self, frame):
+        """Fold new matches (MATCH_COLUMNS) into the ledger and accumulators."""
+        import pandas as pd
+
+        if not len(frame):
+            return
+        frame = frame[MATCH_COLUMNS].assign(days_to_sell=pd.to_numeric(frame['days_to_sell'], errors='coerce'),
+                                            sold_at=frame['sold_at'].astype('int64'))
+        self._new_rows.append(frame)
+        self.stats.add_frame(frame)
+        self.daily = merge_cells(self.daily, daily_cells(frame))
+        for source, outcome_id in zip(frame['source'], frame['outcome_id']):
+            self.set_status(source, outcome_id, MATCHED)
+        for (source, match), count in frame.groupby(['source', 'match']).size().items():
+            key = f"{source}/{match}"
+            self.match_counts[key] = self.match_counts.get(key, 0) + int(count)
+        self.feedback_listings.update(frame.loc[frame['source'] == 'feedback', 'listing_id'])
+
+    def match_count(self, source, match):
+        """Ledger rows of a source matched one way ('id' or 'exact')."""
+        return self.match_counts.get(f"{source}/{match}", 0)
+
+    def columns(self, names, where=None):
+        """
+        Ledger columns over the stored and new matches, as NumPy arrays.
+
+        Args:
+            names: Columns to read
+            where: Optional (column, values): only rows whose column is one of
+                values are read (a Parquet filter, so other row groups are
+                skipped)
+
+        Returns:
+            {name: array}
+        """
+        import numpy as np
+        import pyarrow.parquet as pq
+
+        filters = [(where[0], 'in', list(where[1]))] if where is not None else None
+        arrays = {name: [] for name in names}
+        for part in self.parts:
+            table = pq.read_table(os.path.join(self.directory, 'matches', part), columns=list(names),
+                                  filters=filters)
+            for name in names:
+                arrays[name].append(table.column(name).to_numpy(zero_copy_only=False))
+        for frame in self._new_rows:
+            if where is not None:
+                frame = frame[frame[where[0]].isin(list(where[1]))]
+            for name in names:
+                arrays[name].append(frame[name].to_numpy())
+        return {name: np.concatenate(parts) if parts else np.zeros(0) for name, parts in arrays.items()}
+
+    def save(self, listings_fetched_at):
+        """
+        Write this run's matches and statuses.
+
+        Args:
+            listings_fetched_at: When this run's listings were fetched (a
+                datetime, or None if unknown)
+        """
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._new_rows:
+            name = f"part-{len(self.parts):05d}.parquet"
+            frame = pd.concat(self._new_rows, ignore_index=True)
+            pq.write_table(pa.Table.from_pandas(frame, preserve_index=False),
+                           os.path.join(self.directory, 'matches', name), compression='zstd')
+            self.parts.append(name)
+            self._new_rows = []
+
+        # This run's statuses are appended as a new part; with too many parts,
+        # all statuses are written to one instead
+        previous_parts = list(self.outcome_parts)
+        statuses = self._new_statuses
+        if len(self.outcome_parts) >= OUTCOME_PARTS_MAX:
+            statuses, self.outcome_parts = self.outcomes, []
+        if statuses:
+            number = int(previous_parts[-1][5:10]) + 1 if previous_parts else 0
+            name = f"part-{number:05d}.parquet"
+            os.makedirs(os.path.join(self.directory, 'outcomes'), exist_ok=True)
+            pq.write_table(pa.table({
+                'source': pa.array([source for source, _ in statuses], type=pa.string()),
+                'id': pa.array([outcome_id for _, outcome_id in statuses], type=pa.string()),
+                'status': pa.array(list(statuses.values()), type=pa.string()),
+            }), os.path.join(self.directory, 'outcomes', name), compression='zstd')
+            self.outcome_parts.append(name)
+            self._new_statuses = {}
+
+        # Cells and listing ids go to new files each run; meta.json, written
+        # last, says which are current
+        previous = dict(self.files)
+        tables = {
+            'daily': pa.Table.from_pandas(self.daily, preserve_index=False),
+            'feedback_listings': pa.table({
+                'listing_id': pa.array(sorted(self.feedback_listings), type=pa.string()),
+            }),
+        }
+        for kind, table in tables.items():
+            self.files[kind] = f"{kind}-{len(self.parts):05d}-{os.getpid()}.parquet"
+            pq.write_table(table, os.path.join(self.directory, self.files[kind]), compression='zstd')
+
+        self.listings_fetched_at = listings_fetched_at.isoformat() if listings_fetched_at is not None else None
+        meta_path = os.path.join(self.directory, META_NAME)
+        with open(f"{meta_path}.tmp", 'w') as f:
+            json.dump({'version': LEDGER_VERSION, 'parts': self.parts, 'files': self.files,
+                       'outcome_parts': self.outcome_parts, 'listings_fetched_at': self.listings_fetched_at,
+                       'match_counts': self.match_counts, 'status_counts': self.status_counts,
+                       'stats': self.stats.to_dict()}, f)
+        os.replace(f"{meta_path}.tmp", meta_path)
+        for kind, name in previous.items():
+            if name != self.files.get(kind):
+                os.remove(os.path.join(self.directory, name))
+        for name in set(previous_parts) - set(self.outcome_parts):
+            os.remove(os.path.join(self.directory, 'outcomes', name))
@@ -0,0 +1,243 @@
+# active_users.py
+"""
+Daily, weekly and monthly active users from persisted per-day sketches.
+
+For every UTC day the store keeps two HyperLogLog sketches (sketches.py):
+the userIds of registered users with a session that day, and the ids of
+guest sessions (no userId, or isGuest). Distinct users over any range of
+days is a register-wise max of those days' sketches, so DAU, rolling
+WAU/MAU and stickiness for a whole year come from a few array operations
+instead of a scan of sessions per window.
+
+A day is built once. Each run rebuilds only the days missing from the
+store and the last REOPEN_DAYS days, which can still gain sessions; older
+days are sealed. The store is one Parquet file under the snapshot
+directory (state/active_users.parquet), about 32 KB per day.
+
+Days are UTC calendar days; a session counts on the day of its startTime
+(lastActivity if it has none), as in the engagement report.
+"""
+
+from datetime import date, datetime, timedelta, timezone
+import os
+
+from pp_analytics.columns import NAT
+from pp_analytics.sketches import HLL_PRECISION, hash_strings, hll_estimate, hll_positions
+from pp_analytics.snapshot import state_path
+
+STORE_NAME = 'active_users.parquet'
+HISTORY_DAYS = 365
+REOPEN_DAYS = 2
+
+_DAY_NS = 86_400 * 1_000_000_000
+_EPOCH_DAY = date(1970, 1, 1)
+
+
+def utc_today():
+    return datetime.now(timezone.utc).date()
+
+
+def _day_number(day):
+    return (day - _EPOCH_DAY).days
+
+
+class ActiveUserStore:
+    """
+    Per-day sketches of registered users and guest sessions.
+
+    Args:
+        path: Snapshot directory (default: snapshot.snapshot_dir())
+        precision: HyperLogLog precision (2**precision registers per sketch)
+    """
+
+    def __init__(self, path=None, precision=HLL_PRECISION):
+        self.file = state_path(STORE_NAME, path)
+        self.precision = precision
+        # {date: {'users': registers, 'guests': registers, 'sessions': int, 'sealed': bool}}
+        self.days = {}
+        if os.path.exists(self.file):
+            self._load()
+
+    def _load(self):
+        import numpy as np
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(self.file).to_pydict()
+        for i, day in enumerate(table['day']):
+            users = np.frombuffer(table['users'][i], dtype=np.uint8)
+            if len(users) != 1 << self.precision:
+                # Written with another precision: rebuild rather than mix
+                self.days = {}
+                return
+            self.days[date.fromisoformat(day)] = {
+                'users': users,
+                'guests': np.frombuffer(table['guests'][i], dtype=np.uint8),
+                'sessions': table['sessions'][i],
+                'sealed': table['sealed'][i],
+            }
+
+    def save(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        days = sorted(self.days)
+        table = pa.table({
+            'day': [day.isoformat() for day in days],
+            'users': pa.array([self.days[day]['users'].tobytes() for day in days], type=pa.binary()),
+            'guests': pa.array([self.days[day]['guests'].tobytes() for day in days], type=pa.binary()),
+            'sessions': pa.array([self.days[day]['sessions'] for day in days], type=pa.int64()),
+            'sealed': pa.array([self.days[day]['sealed'] for day in days], type=pa.bool_()),
+        })
+        tmp_path = f"{self.file}.tmp"
+        pq.write_table(table, tmp_path, compression='zstd')
+        os.replace(tmp_path, self.file)
+
+    def open_days(self, first_day, last_day):
+        """Days in [first_day, last_day] that still have to be built."""
+        days = []
+        day = first_day
+        while day <= last_day:
+            entry = self.days.get(day)
+            if entry is None or not entry['sealed']:
+                days.append(day)
+            day += timedelta(days=1)
+        return days
+
+    def update(self, ids, users, guest, times, first_day, last_day, today=None):
+        """
+        Build the open days in [first_day, last_day] from one pass over sessions.
+
+        The sessions must include every session of those days.
+
+        Args:
+            ids: Session document ids
+            users: Categorical of userIds (missing: no userId)
+            guest: Boolean array, isGuest
+            times: int64 epoch ns session times (NAT: none)
+            first_day, last_day: UTC dates covered by the sessions
+            today: UTC date that is still open (default: today)
+
+        Returns:
+            The days that were (re)built
+        """
+        import numpy as np
+
+        today = today or utc_today()
+        days = self.open_days(first_day, last_day)
+        if not days:
+            return []
+        size = 1 << self.precision
+        slots = np.full(_day_number(last_day) - _day_number(first_day) + 1, -1, dtype=np.int64)
+        for slot, day in enumerate(days):
+            slots[_day_number(day) - _day_number(first_day)] = slot
+
+        times = np.asarray(times)
+        day_offset = np.where(times != NAT, times // _DAY_NS - _day_number(first_day), -1)
+        in_range = (day_offset >= 0) & (day_offset < len(slots))
+        slot = np.where(in_range, slots[np.clip(day_offset, 0, len(slots) - 1)], -1)
+        keep = slot >= 0
+
+        codes = np.asarray(users.codes)
+        registered = (codes >= 0) & ~np.asarray(guest, dtype=bool)
+        user_hashes = hash_strings(users.categories) if len(users.categories) else np.zeros(0, np.uint64)
+
+        user_registers = np.zeros((len(days), size), dtype=np.uint8)
+        guest_registers = np.zeros((len(days), size), dtype=np.uint8)
+        rows = keep & registered
+        if rows.any():
+            index, rank = hll_positions(user_hashes[codes[rows]], self.precision)
+            np.maximum.at(user_registers, (slot[rows], index), rank)
+        rows = keep & ~registered
+        if rows.any():
+            index, rank = hll_positions(hash_strings(np.asarray(ids, dtype=object)[rows]), self.precision)
+            np.maximum.at(guest_registers, (slot[rows], index), rank)
+        sessions = np.bincount(slot[keep], minlength=len(days))
+
+        reopen_from = today - timedelta(days=REOPEN_DAYS - 1)
+        for i, day in enumerate(days):
+            self.days[day] = {
+                'users': user_registers[i],
+                'guests': guest_registers[i],
+                'sessions': int(sessions[i]),
+                'sealed': day < reopen_from,
+            }
+        return days
+
+    def _registers(self, kind, first_day, last_day):
+        """(days, 2**precision) register matrix for the days in range; zeros for days not built."""
+        import numpy as np
+
+        count = _day_number(last_day) - _day_number(first_day) + 1
+        matrix = np.zeros((max(count, 0), 1 << self.precision), dtype=np.uint8)
+        for day, entry in self.days.items():
+            offset = _day_number(day) - _day_number(first_day)
+            if 0 <= offset < count:
+                matrix[offset] = entry[kind]
+        return matrix
+
+    def distinct(self, first_day, last_day, kind='users'):
+        """Approximate distinct registered users (or guest sessions) over [first_day, last_day]."""
+        registers = self._registers(kind, first_day, last_day)
+        if not len(registers):
+            return 0
+        return int(round(float(hll_estimate(registers.max(axis=0)))))
+
+    def series(self, first_day, last_day):
+        """
+        Daily active-user series for [first_day, last_day].
+
+        Returns:
+            DataFrame indexed by day: dau, wau (7 days ending that day), mau
+            (30 days ending that day), stickiness (dau / mau), guest_sessions,
+            sessions; days not in the store are NaN
+        """
+        import numpy as np
+        import pandas as pd
+        from numpy.lib.stride_tricks import sliding_window_view
+
+        # 29 extra days so the first day's 30-day window is complete
+        history_start = first_day - timedelta(days=29)
+        users = self._registers('users', history_start, last_day)
+        guests = self._registers('guests', history_start, last_day)
+        built = np.array([history_start + timedelta(days=i) in self.days for i in range(len(users))])
+
+        def rolling(width):
+            windows = sliding_window_view(users, width, axis=0)[30 - width:]
+            return hll_estimate(windows.max(axis=-1))
+
+        days = pd.date_range(first_day, last_day, freq='D')
+        frame = pd.DataFrame({
+            'dau': hll_estimate(users[29:]),
+            'wau': rolling(7),
+            'mau': rolling(30),
+            'guest_sessions': hll_estimate(guests[29:]),
+            'sessions': [self.days[day.date()]['sessions'] if day.date() in self.days else np.nan for day in days],
+        }, index=days.date)
+        frame.index.name = 'day'
+        frame[['dau', 'wau', 'mau', 'guest_sessions']] = frame[['dau', 'wau', 'mau', 'guest_sessions']].round()
+        frame.loc[~built[29:], ['dau', 'wau', 'mau', 'guest_sessions']] = np.nan
+        with np.errstate(divide='ignore', invalid='ignore'):
+            frame['stickiness'] = np.where(frame['mau'] > 0, frame['dau'] / frame['mau'], np.nan)
+        return frame
+
+
+def update_active_users(ids, users, guest, times, first_day=None, history_days=HISTORY_DAYS, path=None,
+                        today=None):
+    """
+    Bring the store up to date from sessions and return it.
+
+    Args:
+        ids, users, guest, times: Session columns (see ActiveUserStore.update())
+        first_day: Earliest UTC day the sessions fully cover (default: history_days ago)
+        history_days: Days of history kept
+        path: Snapshot directory
+        today: UTC date (default: today)
+    """
+    today = today or utc_today()
+    oldest = today - timedelta(days=history_days - 1)
+    store = ActiveUserStore(path)
+    store.update(ids, users, guest, times, max(first_day or oldest, oldest), today, today=today)
+    for day in [day for day in store.days if day < oldest - timedelta(days=29)]:
+        del store.days[day]
+    store.save()
+    return store
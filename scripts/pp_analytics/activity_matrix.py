@@ -0,0 +1,154 @@
+# activity_matrix.py
+"""
+Activity counts per user and activity type, as one integer matrix.
+
+Users and activity types are integer-encoded in order of first appearance
+(so ties sort the way a dict filled in document order would), and counts
+are int32, one column per type. A column is a list of fixed chunks of
+CHUNK_USERS users: new users get new chunks and nothing is ever copied to
+grow it. Memory is at most 4 bytes x types x users, rounded up to a whole
+chunk (256 KB per type), plus each user's dictionary entry, whatever the
+number of activities. The report needs a handful of types. Activities are
+added a columns.py batch at a time, so they can be streamed.
+
+Per-type "users who did this at least once" sets are bitsets (NumPy-packed,
+one bit per user), so funnel stages and drop-off sets are bitwise ANDs and
+popcounts.
+
+NumPy is imported on first use, like columns.py.
+"""
+
+from pp_analytics.columns import DICTIONARY
+
+# Typed columns read from each activity document
+ACTIVITY_COLUMNS = {
+    'user': ('userId', DICTIONARY),
+    'type': ('activityType', DICTIONARY),
+}
+
+GUEST = 'guest'
+UNKNOWN_TYPE = 'unknown'
+
+# Users per chunk of a count column (int32: 256 KB)
+CHUNK_USERS = 65_536
+
+
+def popcount(bits):
+    """Number of set bits in a bitset."""
+    import numpy as np
+
+    if hasattr(np, 'bitwise_count'):
+        return int(np.bitwise_count(bits).sum())
+    return int(np.unpackbits(bits).sum())
+
+
+class _Encoder:
+    """Values -> dense integer codes, in order of first appearance."""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def encode(self, categorical, missing):
+        """Table-wide codes for a batch's Categorical; missing (-1) values become `missing`."""
+        import numpy as np
+
+        values = list(categorical.categories)
+        codes = np.asarray(categorical.codes)
+        if (codes < 0).any():
+            values.append(missing)
+            codes = np.where(codes < 0, len(values) - 1, codes)
+        for value in values:
+            if value not in self.codes:
+                self.codes[value] = len(self.values)
+                self.values.append(value)
+        mapping = np.array([self.codes[value] for value in values], dtype=np.int64)
+        return mapping[codes]
+
+
+class ActivityMatrix:
+    """
+    Counts of activities per (user, activity type).
+
+    Activities without a userId are counted under the single user 'guest',
+    and those without an activityType under 'unknown'.
+    """
+
+    def __init__(self):
+        self.users = _Encoder()
+        self.types = _Encoder()
+        self._chunks = []  # per type code: int32 arrays of CHUNK_USERS counts
+        self.activity_count = 0
+
+    @property
+    def user_count(self):
+        return len(self.users)
+
+    def _reserve(self, users, types):
+        """Add zeroed chunks so there are counts for at least users x types."""
+        import numpy as np
+
+        chunks = -(-users // CHUNK_USERS)
+        while len(self._chunks) < types:
+            self._chunks.append([])
+        for column in self._chunks:
+            while len(column) < chunks:
+                column.append(np.zeros(CHUNK_USERS, dtype=np.int32))
+
+    def add(self, frame):
+        """Count a to_columns() frame of ACTIVITY_COLUMNS."""
+        import numpy as np
+
+        if not len(frame):
+            return
+        users = self.users.encode(frame['user'].array, GUEST)
+        types = self.types.encode(frame['type'].array, UNKNOWN_TYPE)
+        self._reserve(len(self.users), len(self.types))
+
+        # One += per distinct (user, type) pair in the batch, grouped by
+        # (type, chunk); the pairs of a group hit distinct rows
+        pairs, counts = np.unique(types * len(self.users) + users, return_counts=True)
+        pair_types, pair_users = np.divmod(pairs, len(self.users))
+        groups = pair_types * len(self._chunks[0]) + pair_users // CHUNK_USERS
+        bounds = np.flatnonzero(np.diff(groups)) + 1
+        for first, last in zip(np.r_[0, bounds].tolist(), np.r_[bounds, len(pairs)].tolist()):
+            chunk = self._chunks[pair_types[first]][pair_users[first] // CHUNK_USERS]
+            chunk[pair_users[first:last] % CHUNK_USERS] += counts[first:last].astype(np.int32)
+        self.activity_count += len(frame)
+
+    def _column(self, activity_type):
+        import numpy as np
+
+        code = self.types.codes.get(activity_type)
+        if code is None:
+            return np.zeros(self.user_count, dtype=np.int32)
+        return np.concatenate(self._chunks[code])[:self.user_count]
+
+    def type_totals(self):
+        """{activity type: count}, in order of first appearance."""
+        return {activity_type: sum(int(chunk.sum()) for chunk in column)
+                for activity_type, column in zip(self.types.values, self._chunks)}
+
+    def users_with(self, activity_type):
+        """Bitset of the users with at least one activity of this type."""
+        import numpy as np
+
+        return np.packbits(self._column(activity_type) > 0)
+
+    def tiers(self, activity_type, edges):
+        """
+        Registered users per band of activity counts.
+
+        edges [1, 3, 10] -> counts of users with 1-2, 3-9 and 10+ activities
+        of the type (users with none are not counted).
+        """
+        import numpy as np
+
+        column = self._column(activity_type)
+        if GUEST in self.users.codes:
+            column = np.delete(column, self.users.codes[GUEST])
+        bands = np.searchsorted(np.asarray(edges), column, side='right')
+        return np.bincount(bands, minlength=len(edges) + 1)[1:].tolist()
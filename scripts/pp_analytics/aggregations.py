@@ -0,0 +1,167 @@
+# aggregations.py
+"""
+Collection totals without downloading documents.
+
+Headline numbers ("Total Listings", "Total Analyses Across All Users") don't
+need per-document work, so they are answered, cheapest first, by:
+
+1. the local snapshot, when it is fresh (no Firestore reads at all; counts
+   come straight from the manifest)
+2. Firestore aggregation queries (count / sum / avg), which are billed per
+   1,000 index entries instead of per document
+3. a projected stream of just the needed fields, if the aggregation query
+   fails (old client library, emulator without support)
+"""
+
+import numbers
+
+from pp_analytics.client import CredentialsNotFound, field_filter
+from pp_analytics.snapshot import PROCESS_STARTED_AT, is_fresh, project_query, read_manifest, read_snapshot
+from pp_analytics.trace import estimate_bytes, record_read, span, tracing
+
+_OPERATORS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+    'in': lambda a, b: a in b,
+}
+
+
+def _get_path(data, field):
+    for part in field.split('.'):
+        if not isinstance(data, dict) or part not in data:
+            return None
+        data = data[part]
+    return data
+
+
+def _is_number(value):
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+
+def matches_filters(data, filters):
+    """True if data matches every (field, op, value) filter, as a Firestore query would."""
+    for field, op, value in filters:
+        field_value = _get_path(data, field)
+        if field_value is None:
+            return False
+        try:
+            if not _OPERATORS[op](field_value, value):
+                return False
+        except TypeError:
+            return False
+    return True
+
+
+def _aggregate_docs(docs, sums, avgs, filters):
+    """Compute count/sum/avg over documents in Python, with Firestore's semantics."""
+    count = 0
+    totals = {field: 0 for field in set(sums) | set(avgs)}
+    numeric_counts = dict.fromkeys(totals, 0)
+    for doc in docs:
+        data = doc.to_dict() or {}
+        if filters and not matches_filters(data, filters):
+            continue
+        count += 1
+        for field in totals:
+            value = _get_path(data, field)
+            # sum() and avg() skip non-numeric values
+            if _is_number(value):
+                totals[field] += value
+                numeric_counts[field] += 1
+
+    result = {'count': count}
+    for field in sums:
+        result[f'sum:{field}'] = totals[field]
+    for field in avgs:
+        result[f'avg:{field}'] = totals[field] / numeric_counts[field] if numeric_counts[field] else None
+    return result
+
+
+def aggregate_collection(db, collection, sums=(), avgs=(), filters=(), refresh=False, ttl_hours=None, path=None,
+                         tables=None):
+    """
+    Count documents and sum/average numeric fields of a collection.
+
+    Args:
+        db: Firestore client
+        collection: Collection name
+        sums: Field paths to sum
+        avgs: Field paths to average
+        filters: (field, op, value) conditions documents must all match
+        refresh, ttl_hours: Snapshot freshness (see snapshot.load_collection)
+        tables: Optional Tables; a collection held there is aggregated in memory
+
+    Returns:
+        Dict with 'count', 'sum:<field>' and 'avg:<field>' (None if no
+        document had a numeric value)
+    """
+    sums, avgs, filters = list(sums), list(avgs), list(filters)
+    needed = sorted(set(sums) | set(avgs) | {field for field, _, _ in filters})
+
+    shared = tables.lookup(collection, needed) if tables is not None else None
+    if shared is not None:
+        if not sums and not avgs and not filters:
+            return {'count': len(shared)}
+        return _aggregate_docs(shared, sums, avgs, filters)
+
+    not_before = PROCESS_STARTED_AT if refresh else None
+    if is_fresh(collection, ttl_hours, path, not_before=not_before, fields=needed):
+        if not sums and not avgs and not filters:
+            return {'count': read_manifest(path)[collection]['doc_count']}
+        return _aggregate_docs(read_snapshot(collection, path=path), sums, avgs, filters)
+
+    with span(f"aggregate {collection}", kind='query'):
+        return _query_aggregate(db, collection, sums, avgs, filters, needed)
+
+
+def _query_aggregate(db, collection, sums, avgs, filters, needed):
+    """Run an aggregation query, or stream the needed fields if that fails."""
+    try:
+        query = db.collection(collection)
+        for field, op, value in filters:
+            query = query.where(filter=field_filter(db, field, op, value))
+        aggregation = query.count(alias='count')
+        aliases = {'count': 'count'}
+        for i, field in enumerate(sums):
+            aggregation = aggregation.sum(field, alias=f'sum_{i}')
+            aliases[f'sum_{i}'] = f'sum:{field}'
+        for i, field in enumerate(avgs):
+            aggregation = aggregation.avg(field, alias=f'avg_{i}')
+            aliases[f'avg_{i}'] = f'avg:{field}'
+
+        result = {}
+        for row in aggregation.get():
+            for item in row:
+                result[aliases[item.alias]] = item.value
+        result['count'] = int(result['count'])
+        return result
+    except CredentialsNotFound:
+        raise
+    except Exception as e:
+        print(f"  Aggregation query failed for '{collection}' ({e}); streaming {needed or 'ids'} instead")
+        docs = list(project_query(db, collection, needed).stream())
+        if tracing():
+            record_read(collection, len(docs), estimate_bytes(docs))
+        return _aggregate_docs(docs, sums, avgs, filters)
+
+
+def count_documents(db, collection, refresh=False, ttl_hours=None, path=None, filters=(), tables=None):
+    """Return the number of documents in a collection (matching filters, if given)."""
+    return aggregate_collection(db, collection, filters=filters, refresh=refresh,
+                                ttl_hours=ttl_hours, path=path, tables=tables)['count']
+
+
+def sum_field(db, collection, field, refresh=False, ttl_hours=None, path=None):
+    """Return the sum of a numeric field over a collection."""
+    return aggregate_collection(db, collection, sums=[field], refresh=refresh,
+                                ttl_hours=ttl_hours, path=path)[f'sum:{field}']
+
+
+def avg_field(db, collection, field, refresh=False, ttl_hours=None, path=None):
+    """Return the average of a numeric field over a collection (None if empty)."""
+    return aggregate_collection(db, collection, avgs=[field], refresh=refresh,
+                                ttl_hours=ttl_hours, path=path)[f'avg:{field}']
@@ -0,0 +1,222 @@
+# antijoin.py
+"""
+Id-only anti-joins: find rows whose key is not the id of any document in
+one or more collections (feedback events pointing at deleted listings).
+
+Only ids of the referenced collections are read (see
+snapshot.iter_document_ids()), and rows are streamed in batches against an
+index of them:
+
+- exact (default): the ids as one sorted array of fixed-width bytes,
+  probed with np.searchsorted. About id length bytes per id, against ~70
+  for a Python set of strings.
+- bloom (more ids than PP_ANTIJOIN_EXACT_LIMIT): a Bloom filter, about 1.2
+  bytes per id at a 1% false positive rate. A key the filter rejects is
+  certainly missing. The distinct keys it accepts are then verified
+  exactly with a second id-only pass, and the rows of any false positive
+  are picked up with a second pass over the rows, so results are the same
+  as the exact index.
+
+Rows are to_columns() frames whose key is a DICTIONARY column, so each
+batch probes its distinct keys only.
+
+Settings:
+- PP_ANTIJOIN_EXACT_LIMIT: largest number of ids indexed exactly
+  (default: 20,000,000)
+"""
+
+import math
+import os
+
+DEFAULT_EXACT_LIMIT = 20_000_000
+DEFAULT_FALSE_POSITIVE_RATE = 0.01
+
+# Two independent 64-bit hashes per key (pandas' SipHash keys are 16 bytes)
+_HASH_KEYS = ('pp-antijoin-h1-0', 'pp-antijoin-h2-0')
+
+
+def exact_limit(value=None):
+    """Return the largest id count indexed exactly, honouring PP_ANTIJOIN_EXACT_LIMIT."""
+    if value is not None:
+        return value
+    env_value = os.environ.get('PP_ANTIJOIN_EXACT_LIMIT')
+    return int(env_value) if env_value else DEFAULT_EXACT_LIMIT
+
+
+def _encode(keys):
+    import numpy as np
+
+    if isinstance(keys, np.ndarray) and keys.dtype.kind == 'S':
+        return keys
+    return np.array([str(key).encode('utf-8') for key in keys], dtype=bytes)
+
+
+class ExactIdSet:
+    """A set of ids as a sorted array of fixed-width byte strings."""
+
+    def __init__(self):
+        self._batches = []
+        self._ids = None
+
+    def add(self, ids):
+        """Add ids (strings, or an array of encoded ids)."""
+        if len(ids):
+            self._batches.append(_encode(ids))
+
+    def finish(self):
+        import numpy as np
+
+        self._ids = np.unique(np.concatenate(self._batches)) if self._batches else np.array([], dtype=bytes)
+        self._batches = None
+        return self
+
+    def __len__(self):
+        return len(self._ids)
+
+    @property
+    def encoded(self):
+        """The ids, sorted, as UTF-8 byte strings."""
+        return self._ids
+
+    @property
+    def nbytes(self):
+        return self._ids.nbytes
+
+    def contains(self, keys):
+        """Boolean array: which keys are ids in the set."""
+        import numpy as np
+
+        keys = _encode(keys)
+        if not len(self._ids) or not len(keys):
+            return np.zeros(len(keys), dtype=bool)
+        positions = np.minimum(np.searchsorted(self._ids, keys), len(self._ids) - 1)
+        return self._ids[positions] == keys
+
+
+class BloomFilter:
+    """A Bloom filter over strings, built and probed a batch at a time."""
+
+    def __init__(self, capacity, false_positive_rate=DEFAULT_FALSE_POSITIVE_RATE):
+        import numpy as np
+
+        capacity = max(int(capacity), 1)
+        bits = math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)
+        self.size = max(64, (bits + 7) // 8 * 8)
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = np.zeros(self.size // 8, dtype=np.uint8)
+
+    @property
+    def nbytes(self):
+        return self._bits.nbytes
+
+    def _positions(self, keys):
+        import numpy as np
+        import pandas as pd
+
+        values = np.array([str(key) for key in keys], dtype=object)
+        h1, h2 = (pd.util.hash_array(values, hash_key=key, categorize=False) for key in _HASH_KEYS)
+        # Double hashing: position i is h1 + i * h2 (mod size); an odd h2
+        # never cycles early
+        h2 |= np.uint64(1)
+        rounds = np.arange(self.hash_count, dtype=np.uint64)
+        return (h1[:, None] + rounds * h2[:, None]) % np.uint64(self.size)
+
+    def add(self, keys):
+        import numpy as np
+
+        if not len(keys):
+            return
+        positions = self._positions(keys).ravel()
+        np.bitwise_or.at(self._bits, positions >> np.uint64(3),
+                         np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+
+    def might_contain(self, keys):
+        """Boolean array: False where a key is certainly not in the filter."""
+        import numpy as np
+
+        if not len(keys):
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(keys)
+        hits = (self._bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return hits.all(axis=1)
+
+
+def _missing_rows(frame, key, missing_codes):
+    import numpy as np
+
+    codes = np.asarray(frame[key].array.codes)
+    return frame[np.isin(codes, missing_codes)]
+
+
+def anti_join(frames, key, id_sources, expected_ids=None, exact_limit_ids=None,
+              false_positive_rate=DEFAULT_FALSE_POSITIVE_RATE):
+    """
+    Return the rows whose key is not an id in any of the id sources.
+
+    Args:
+        frames: Callable returning an iterable of DataFrames (see columns.py);
+            called a second time only in bloom mode, if there were false positives
+        key: Name of the DICTIONARY column holding the referenced id; rows
+            without one are skipped
+        id_sources: Callables each returning an iterable of id lists (see
+            snapshot.iter_document_ids())
+        expected_ids: Approximate total number of ids, which picks the index:
+            exact up to exact_limit_ids, bloom above it (default: exact)
+        exact_limit_ids: Default: PP_ANTIJOIN_EXACT_LIMIT or 20,000,000
+        false_positive_rate: Bloom filter false positive rate
+
+    Returns:
+        (DataFrame of missing rows, stats dict: 'mode', 'ids', 'index_bytes',
+        'rows', and in bloom mode 'candidates' and 'false_positives')
+    """
+    import numpy as np
+    import pandas as pd
+
+    bloom = expected_ids is not None and expected_ids > exact_limit(exact_limit_ids)
+    if bloom:
+        index = BloomFilter(expected_ids, false_positive_rate)
+    else:
+        index = ExactIdSet()
+    id_count = 0
+    for source in id_sources:
+        for ids in source():
+            id_count += len(ids)
+            index.add(ids)
+    if not bloom:
+        index.finish()
+    stats = {'mode': 'bloom' if bloom else 'exact', 'ids': id_count, 'index_bytes': index.nbytes, 'rows': 0}
+
+    missing = []
+    candidates = ExactIdSet()
+    for frame in frames():
+        stats['rows'] += len(frame)
+        keys = frame[key].array.categories
+        if bloom:
+            present = index.might_contain(keys)
+            candidates.add(list(keys[present]))
+        else:
+            present = index.contains(keys)
+        missing.append(_missing_rows(frame, key, np.flatnonzero(~present)))
+
+    if bloom:
+        # Verify the keys the filter let through against the ids themselves
+        candidates.finish()
+        found = ExactIdSet()
+        for source in id_sources:
+            for ids in source():
+                found.add([ids[i] for i in np.flatnonzero(candidates.contains(ids))])
+        found.finish()
+        false_positives = candidates.encoded[~found.contains(candidates.encoded)]
+        stats['candidates'] = len(candidates)
+        stats['false_positives'] = len(false_positives)
+        if len(false_positives):
+            false_positive_set = ExactIdSet()
+            false_positive_set.add(false_positives)
+            false_positive_set.finish()
+            for frame in frames():
+                keys = frame[key].array.categories
+                missing.append(_missing_rows(frame, key, np.flatnonzero(false_positive_set.contains(keys))))
+
+    missing = [frame for frame in missing if len(frame)]
+    result = pd.concat(missing, ignore_index=True) if missing else pd.DataFrame()
+    return result, stats
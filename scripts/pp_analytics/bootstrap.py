@@ -0,0 +1,159 @@
+# bootstrap.py
+"""
+Bootstrap confidence intervals for per-group error statistics.
+
+For each group (category, ...) of n matches, a resample is n draws with
+replacement. A block of resamples is one (resamples, n) NumPy index matrix:
+MAE and MAPE of every resample in the block are a fancy-index and a mean
+along axis 1. The group's matches are sorted by percentage error first, so
+with each row of indices sorted (an int32 sort, much cheaper than a median
+over the values) the median's matches are the middle columns. Intervals are
+the percentile kind: the (1 - confidence) / 2 and (1 + confidence) / 2
+quantiles of the resampled statistic.
+
+Blocks hold about BLOCK_CELLS indices, so a large group is split into
+several blocks and many small groups are many small blocks. They run in a
+process pool once there are more than PARALLEL_MIN_CELLS indices in all;
+below that, pool start-up costs more than it saves.
+
+Each block draws from its own seed, derived from the base seed, the group
+key and the block number. Intervals are therefore the same from run to run
+and for any number of workers, and adding a group does not change the
+intervals of the others.
+
+Settings:
+- PP_BOOTSTRAP_WORKERS: worker processes (default: one per CPU)
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+import zlib
+
+from pp_analytics.trace import span
+
+DEFAULT_RESAMPLES = 2000
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_SEED = 0
+
+# Indices per block (int32: 4 bytes each) and the least work worth a pool
+BLOCK_CELLS = 2_000_000
+PARALLEL_MIN_CELLS = 8_000_000
+
+STATISTICS = ('mae', 'mape', 'median')
+
+
+def bootstrap_workers(value=None):
+    """Return the number of worker processes, honouring PP_BOOTSTRAP_WORKERS."""
+    if value is not None:
+        return value
+    env_value = os.environ.get('PP_BOOTSTRAP_WORKERS')
+    return int(env_value) if env_value else (os.cpu_count() or 1)
+
+
+def _key_seed(seed, key, block):
+    import numpy as np
+
+    return np.random.SeedSequence(seed, spawn_key=(zlib.crc32(str(key).encode('utf-8')), block))
+
+
+def _resample_block(task):
+    """(key, abs_error, pct_error, resamples, seed) -> (key, {statistic: array of resampled values})."""
+    import numpy as np
+
+    key, abs_error, pct_error, resamples, seed = task
+    n = len(pct_error)
+    rng = np.random.default_rng(seed)
+    # Matches are sorted by percentage error, so once each row of indices is
+    # sorted its middle indices are the median's
+    index = np.sort(rng.integers(0, n, size=(resamples, n), dtype=np.int32), axis=1)
+    return key, {
+        'mae': abs_error[index].mean(axis=1),
+        'mape': pct_error[index].mean(axis=1),
+        'median': (pct_error[index[:, (n - 1) // 2]] + pct_error[index[:, n // 2]]) / 2,
+    }
+
+
+def bootstrap_intervals(keys, abs_error, pct_error, resamples=DEFAULT_RESAMPLES, confidence=DEFAULT_CONFIDENCE,
+                        seed=DEFAULT_SEED, workers=None, name=None):
+    """
+    Bootstrap intervals for MAE, MAPE and median percentage error per key.
+
+    Args:
+        keys: Group key of each match (missing keys are left out, as groupby does)
+        abs_error, pct_error: Absolute error ($) and percentage error of each match
+        resamples: Resamples per key
+        confidence: Interval coverage
+        seed: Base seed
+        workers: Worker processes (default: PP_BOOTSTRAP_WORKERS or one per CPU)
+        name: Name of the returned index
+
+    Returns:
+        DataFrame indexed by key (sorted): count, and for each statistic
+        (mae, mape, median) its value over all matches plus <stat>_low and
+        <stat>_high interval bounds
+    """
+    import numpy as np
+    import pandas as pd
+
+    keys = pd.Series(np.asarray(keys, dtype=object))
+    abs_error = np.asarray(abs_error, dtype=np.float64)
+    pct_error = np.asarray(pct_error, dtype=np.float64)
+
+    rows = {}
+    tasks = []
+    for key, positions in keys.groupby(keys, sort=True).indices.items():
+        positions = positions[np.argsort(pct_error[positions], kind='stable')]
+        group_abs, group_pct = abs_error[positions], pct_error[positions]
+        rows[key] = {'count': len(positions), 'mae': group_abs.mean(), 'mape': group_pct.mean(),
+                     'median': float(np.median(group_pct))}
+        per_block = max(1, BLOCK_CELLS // len(positions))
+        for block, start in enumerate(range(0, resamples, per_block)):
+            tasks.append((key, group_abs, group_pct, min(per_block, resamples - start), _key_seed(seed, key, block)))
+
+    workers = bootstrap_workers(workers)
+    cells = sum(len(task[2]) * task[3] for task in tasks)
+    samples = {key: {stat: [] for stat in STATISTICS} for key in rows}
+    with span(f"bootstrap {len(rows)} groups x {resamples}"):
+        if workers > 1 and cells > PARALLEL_MIN_CELLS:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_resample_block, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+        else:
+            results = [_resample_block(task) for task in tasks]
+    for key, block in results:
+        for stat in STATISTICS:
+            samples[key][stat].append(block[stat])
+
+    tail = (1 - confidence) / 2
+    for key, row in rows.items():
+        for stat in STATISTICS:
+            low, high = np.quantile(np.concatenate(samples[key][stat]), [tail, 1 - tail])
+            row[f'{stat}_low'], row[f'{stat}_high'] = float(low), float(high)
+
+    columns = ['count'] + [f'{stat}{suffix}' for stat in STATISTICS for suffix in ('', '_low', '_high')]
+    frame = pd.DataFrame.from_dict(rows, orient='index', columns=columns)
+    frame.index.name = name
+    return frame
+
+
+def rank_against(intervals, reference, stat='mape', limit=None):
+    """
+    Groups whose interval for `stat` lies entirely above or entirely below a
+    reference value (e.g. the overall MAPE).
+
+    Args:
+        intervals: DataFrame with <stat>_low / <stat>_high columns (from bootstrap_intervals())
+        reference: Value the intervals are compared with
+        stat: Statistic whose interval is compared
+        limit: Rows kept of each (default: all)
+
+    Returns:
+        (above, below): rows with <stat>_low > reference, highest low bound
+        first, and rows with <stat>_high < reference, lowest high bound
+        first. No group is in both.
+    """
+    low, high = f'{stat}_low', f'{stat}_high'
+    above = intervals[intervals[low] > reference].sort_values([low, stat], ascending=False)
+    below = intervals[intervals[high] < reference].sort_values([high, stat])
+    if limit is not None:
+        above, below = above.head(limit), below.head(limit)
+    return above, below
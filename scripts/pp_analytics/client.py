@@ -0,0 +1,154 @@
+# client.py
+"""
+Lazily created, shared Firestore client.
+
+Importing a report module must not talk to Firestore (or even import
+google.cloud.firestore): a scheduler or notebook should be able to import
+validate_ai_predictions cheaply, and a run served entirely from local
+snapshots never needs a client at all.
+
+- get_client() builds the client on first use, from serviceAccountKey.json
+  in the project root (or PP_SERVICE_ACCOUNT_KEY), and returns the same
+  client to every caller in the process, so all reports share one
+  connection pool.
+- set_client(db) injects a client instead (tests, notebooks, another
+  project's credentials).
+- `client` is a stand-in that calls get_client() the first time one of its
+  attributes is used; the report functions default to it.
+
+PP_FIRESTORE_BACKEND=local switches get_client() to the in-process backend
+in local.py, reading fixtures from PP_LOCAL_DATA instead of Firestore; no
+credentials are needed then.
+"""
+
+import os
+import threading
+
+from pp_analytics.snapshot import PROJECT_DIR
+
+DEFAULT_KEY_PATH = os.path.join(PROJECT_DIR, 'serviceAccountKey.json')
+BACKENDS = ('firestore', 'local')
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class CredentialsNotFound(FileNotFoundError):
+    """The service account key file doesn't exist."""
+
+    def __init__(self, key_path):
+        super().__init__(f"Service account key not found at: {key_path}")
+        self.key_path = key_path
+
+
+def key_path():
+    """Path of the service account key (PP_SERVICE_ACCOUNT_KEY or <project>/serviceAccountKey.json)."""
+    return os.environ.get('PP_SERVICE_ACCOUNT_KEY') or DEFAULT_KEY_PATH
+
+
+def backend():
+    """Return the configured backend: 'firestore' (default) or 'local' (PP_FIRESTORE_BACKEND)."""
+    value = (os.environ.get('PP_FIRESTORE_BACKEND') or 'firestore').lower()
+    if value not in BACKENDS:
+        raise ValueError(f"PP_FIRESTORE_BACKEND must be one of {', '.join(BACKENDS)}, not {value!r}")
+    return value
+
+
+def local_data_dir():
+    """Fixture directory of the local backend (PP_LOCAL_DATA)."""
+    path = os.environ.get('PP_LOCAL_DATA')
+    if not path:
+        raise ValueError("PP_FIRESTORE_BACKEND=local needs PP_LOCAL_DATA set to a fixture directory")
+    return path
+
+
+def create_client(path=None):
+    """Create a new client: Firestore from a service account key file, or the local backend."""
+    if backend() == 'local':
+        from pp_analytics.local import LocalClient
+        return LocalClient(local_data_dir())
+
+    path = path or key_path()
+    if not os.path.exists(path):
+        raise CredentialsNotFound(path)
+
+    from google.cloud import firestore
+    from google.oauth2 import service_account
+
+    credentials = service_account.Credentials.from_service_account_file(path)
+    return firestore.Client(credentials=credentials, project=credentials.project_id)
+
+
+def get_client():
+    """Return the process-wide Firestore client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = create_client()
+    return _client
+
+
+def set_client(db):
+    """Use db as the process-wide client (None resets to lazy creation)."""
+    global _client
+    with _client_lock:
+        _client = db
+
+
+class LazyClient:
+    """Stand-in for the shared client that creates it on first attribute access."""
+
+    def __getattr__(self, name):
+        return getattr(get_client(), name)
+
+    def __repr__(self):
+        return f"<LazyClient {'connected' if _client is not None else 'not yet created'}>"
+
+
+client = LazyClient()
+
+
+def field_filter(db, field, op, value):
+    """A where(filter=...) argument for db; the local backend builds its own, without google.cloud."""
+    make = getattr(db, 'field_filter', None)
+    if make is not None:
+        return make(field, op, value)
+    from google.cloud.firestore import FieldFilter
+    return FieldFilter(field, op, value)
+
+
+def array_union(db, values):
+    """An ArrayUnion transform for db: adds values missing from an array field."""
+    make = getattr(db, 'array_union', None)
+    if make is not None:
+        return make(values)
+    from google.cloud.firestore import ArrayUnion
+    return ArrayUnion(values)
+
+
+def retryable_errors():
+    """Exception types worth retrying: contention, quota and transient server errors."""
+    try:
+        from google.api_core import exceptions
+    except ImportError:
+        # Local backend without the Firestore client installed: nothing to retry
+        return ()
+    return (
+        exceptions.Aborted,
+        exceptions.DeadlineExceeded,
+        exceptions.InternalServerError,
+        exceptions.ResourceExhausted,
+        exceptions.ServiceUnavailable,
+        exceptions.TooManyRequests,
+    )
+
+
+def print_credentials_help(error):
+    """Print how to get a service account key (for the scripts' __main__)."""
+    print(f"ERROR: {error}")
+    print("\nTo fix this:")
+    print("1. Go to Firebase Console → Project Settings → Service Accounts")
+    print("2. Click 'Generate new private key'")
+    print("3. Save the file as 'serviceAccountKey.json' in your project root")
+    print(f"   Expected location: {error.key_path}")
@@ -0,0 +1,306 @@
+# cohorts.py
+"""
+Weekly cohort retention (signup week x weeks since signup), kept up to date
+incrementally.
+
+A user's cohort is the UTC week (Monday to Sunday) of their users.createdAt,
+or, for users without one, the week of their first session. Cell (c, k) is
+the number of users of cohort c with at least one session in week c + k;
+week 0 is the signup week itself.
+
+The store persists, under the snapshot directory's state/cohorts/ folder:
+
+- users/<monday>.parquet: the users of each cohort
+- weeks/<monday>.parquet: the distinct users active in each week
+- retention.parquet: the non-zero cells
+- meta.json: the latest session time folded in
+
+Each run folds in only sessions from REOPEN_DAYS before that watermark on
+(sessions still being written or synced late), plus users not seen before.
+New (user, week) pairs are checked against the stored active users of the
+weeks they fall in, so sessions seen twice are not counted twice, and only
+those weeks' files are rewritten. Work and writes follow new activity; the
+users are read once per run to look up cohorts.
+"""
+
+from datetime import date, timedelta
+import json
+import os
+
+from pp_analytics.columns import NAT
+from pp_analytics.snapshot import state_path
+
+STORE_NAME = 'cohorts'
+META_NAME = 'meta.json'
+RETENTION_NAME = 'retention.parquet'
+REOPEN_DAYS = 2
+
+_DAY_NS = 86_400 * 1_000_000_000
+_EPOCH_DAY = date(1970, 1, 1)
+
+
+def week_number(times):
+    """Monday-based UTC week numbers of epoch ns times (week 0 starts 1969-12-29)."""
+    return (times // _DAY_NS + 3) // 7
+
+
+def date_week(day):
+    """Week number of a date."""
+    return ((day - _EPOCH_DAY).days + 3) // 7
+
+
+def week_start(week):
+    """The Monday a week number starts on."""
+    return _EPOCH_DAY + timedelta(days=int(week) * 7 - 3)
+
+
+class CohortStore:
+    """
+    Persisted cohort retention counts.
+
+    Args:
+        path: Snapshot directory (default: snapshot.snapshot_dir())
+    """
+
+    def __init__(self, path=None):
+        import numpy as np
+        import pandas as pd
+
+        self.directory = state_path(STORE_NAME, path)
+        for sub in ('users', 'weeks'):
+            os.makedirs(os.path.join(self.directory, sub), exist_ok=True)
+        self.sessions_through = None
+        # userId -> cohort week
+        self.users = pd.Series(np.zeros(0, np.int64), index=pd.Index([], dtype=object))
+        # {(cohort week, weeks since signup): users active}
+        self.cells = {}
+        self._changed_cohorts = set()
+        self._weeks = {}
+        self._changed_weeks = set()
+        self._load()
+
+    def _file(self, sub, week):
+        return os.path.join(self.directory, sub, f"{week_start(week).isoformat()}.parquet")
+
+    def _load(self):
+        import numpy as np
+        import pandas as pd
+        import pyarrow.parquet as pq
+
+        meta_path = os.path.join(self.directory, META_NAME)
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path) as f:
+            self.sessions_through = json.load(f).get('sessions_through')
+
+        ids, cohorts = [], []
+        users_dir = os.path.join(self.directory, 'users')
+        for name in sorted(os.listdir(users_dir)):
+            if name.endswith('.parquet'):
+                table = pq.read_table(os.path.join(users_dir, name)).to_pydict()
+                ids.extend(table['user'])
+                cohorts.extend(table['cohort'])
+        self.users = pd.Series(np.array(cohorts, dtype=np.int64), index=pd.Index(ids, dtype=object))
+
+        retention_path = os.path.join(self.directory, RETENTION_NAME)
+        if os.path.exists(retention_path):
+            table = pq.read_table(retention_path).to_pydict()
+            self.cells = {(cohort, offset): active for cohort, offset, active
+                          in zip(table['cohort'], table['weeks_since_signup'], table['active'])}
+
+    def _active(self, week):
+        """Sorted array of the userIds active in a week."""
+        import numpy as np
+        import pyarrow.parquet as pq
+
+        if week not in self._weeks:
+            path = self._file('weeks', week)
+            users = pq.read_table(path).column('user').to_pylist() if os.path.exists(path) else []
+            self._weeks[week] = np.array(users, dtype=object)
+        return self._weeks[week]
+
+    @property
+    def fold_from(self):
+        """Earliest session time (epoch ns) the next add_sessions() folds in; None for all."""
+        if self.sessions_through is None:
+            return None
+        return self.sessions_through - REOPEN_DAYS * _DAY_NS
+
+    def add_users(self, ids, created):
+        """
+        Assign cohorts to users not seen before.
+
+        Args:
+            ids: userIds
+            created: int64 epoch ns of users.createdAt (NAT: unknown, left
+                to the user's first session)
+
+        Returns:
+            Number of users added
+        """
+        import numpy as np
+        import pandas as pd
+
+        ids = np.asarray(ids, dtype=object)
+        created = np.asarray(created)
+        new = (self.users.index.get_indexer(ids) < 0) & (created != NAT)
+        if not new.any():
+            return 0
+        cohorts = week_number(created[new])
+        self.users = pd.concat([self.users, pd.Series(cohorts, index=pd.Index(ids[new], dtype=object))])
+        self._changed_cohorts.update(np.unique(cohorts).tolist())
+        return int(new.sum())
+
+    def add_sessions(self, users, guest, times, now=None):
+        """
+        Fold in the sessions from REOPEN_DAYS before the watermark on.
+
+        Sessions dated after now (clock skew) are left out until their time
+        comes, so they can't push the watermark past sessions still to come.
+
+        Args:
+            users: Categorical of userIds (missing: no userId)
+            guest: Boolean array, isGuest
+            times: int64 epoch ns session times (NAT: none)
+            now: int64 epoch ns of the run (default: the current time)
+
+        Returns:
+            Number of new (user, week) pairs counted
+        """
+        import time
+
+        import numpy as np
+        import pandas as pd
+
+        if now is None:
+            now = time.time_ns()
+        codes = np.asarray(users.codes)
+        times = np.asarray(times)
+        rows = (codes >= 0) & ~np.asarray(guest, dtype=bool) & (times != NAT) & (times <= now)
+        if self.fold_from is not None:
+            rows &= times >= self.fold_from
+        if not rows.any():
+            return 0
+
+        # Distinct (user, week) pairs, week-major
+        weeks = week_number(times[rows])
+        width = len(users.categories)
+        keys = np.unique(weeks * width + codes[rows])
+        pair_weeks = keys // width
+        pair_users = np.asarray(users.categories, dtype=object)[keys % width]
+
+        # Users with no createdAt (or no users document) join the cohort of
+        # their first session; pairs are week-major, so that is their first pair
+        unknown = self.users.index.get_indexer(pair_users) < 0
+        if unknown.any():
+            first_ids, first = np.unique(pair_users[unknown], return_index=True)
+            first_weeks = pair_weeks[unknown][first]
+            self.users = pd.concat([self.users, pd.Series(first_weeks, index=pd.Index(first_ids, dtype=object))])
+            self._changed_cohorts.update(np.unique(first_weeks).tolist())
+
+        added = 0
+        cohorts = self.users.to_numpy()[self.users.index.get_indexer(pair_users)]
+        for week in np.unique(pair_weeks).tolist():
+            in_week = pair_weeks == week
+            active = self._active(week)
+            ids = pair_users[in_week]
+            new = ~np.isin(ids, active)
+            if not new.any():
+                continue
+            self._weeks[week] = np.sort(np.concatenate([active, ids[new]]))
+            self._changed_weeks.add(week)
+            offsets = week - cohorts[in_week][new]
+            # Sessions dated before signup (clock skew) are not retention
+            for offset, count in zip(*np.unique(offsets[offsets >= 0], return_counts=True)):
+                cell = (week - int(offset), int(offset))
+                self.cells[cell] = self.cells.get(cell, 0) + int(count)
+            added += int(new.sum())
+
+        latest = int(times[rows].max())
+        self.sessions_through = max(self.sessions_through or latest, latest)
+        return added
+
+    def save(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        def write(table, path):
+            tmp_path = f"{path}.tmp"
+            pq.write_table(table, tmp_path, compression='zstd')
+            os.replace(tmp_path, path)
+
+        changed = self.users[self.users.isin(list(self._changed_cohorts))]
+        for cohort, members in changed.groupby(changed.to_numpy()):
+            write(pa.table({'user': pa.array(members.index.tolist(), type=pa.string()),
+                            'cohort': pa.array(members.to_numpy(), type=pa.int64())}),
+                  self._file('users', cohort))
+        for week in sorted(self._changed_weeks):
+            write(pa.table({'user': pa.array(self._weeks[week].tolist(), type=pa.string())}),
+                  self._file('weeks', week))
+        cells = sorted(self.cells)
+        write(pa.table({
+            'cohort': pa.array([cohort for cohort, _ in cells], type=pa.int64()),
+            'weeks_since_signup': pa.array([offset for _, offset in cells], type=pa.int64()),
+            'active': pa.array([self.cells[cell] for cell in cells], type=pa.int64()),
+        }), os.path.join(self.directory, RETENTION_NAME))
+        # Written last: a run that stops early is folded in again next time
+        meta_path = os.path.join(self.directory, META_NAME)
+        with open(f"{meta_path}.tmp", 'w') as f:
+            json.dump({'sessions_through': self.sessions_through}, f)
+        os.replace(f"{meta_path}.tmp", meta_path)
+        self._changed_cohorts = set()
+        self._changed_weeks = set()
+
+    def table(self, first_cohort=None, last_week=None):
+        """
+        Retention cells, long format.
+
+        Args:
+            first_cohort: Earliest cohort (a date in its week; default: all)
+            last_week: Date in the latest week to report (default: the week
+                of the latest session folded in)
+
+        Returns:
+            DataFrame with cohort_week (Monday), users (cohort size),
+            weeks_since_signup, active_users and retention (active / users),
+            one row per cohort and week up to last_week
+        """
+        import numpy as np
+        import pandas as pd
+
+        columns = ['cohort_week', 'users', 'weeks_since_signup', 'active_users', 'retention']
+        if not len(self.users):
+            return pd.DataFrame(columns=columns)
+        if last_week is not None:
+            end = date_week(last_week)
+        elif self.sessions_through is not None:
+            end = int(week_number(self.sessions_through))
+        else:
+            end = int(self.users.max())
+        start = date_week(first_cohort) if first_cohort else None
+        sizes = self.users.value_counts()
+        rows = []
+        for cohort in sorted(sizes.index):
+            if (start is not None and cohort < start) or cohort > end:
+                continue
+            for offset in range(end - cohort + 1):
+                active = self.cells.get((cohort, offset), 0)
+                rows.append((week_start(cohort), int(sizes[cohort]), offset, active, active / sizes[cohort]))
+        return pd.DataFrame(rows, columns=columns).astype({'retention': np.float64})
+
+
+def update_cohorts(user_ids, created, users, guest, times, path=None, now=None):
+    """
+    Fold new users and sessions into the store, save it and return it.
+
+    Args:
+        user_ids, created: users document ids and createdAt (epoch ns, NAT if none)
+        users, guest, times: Session columns (see CohortStore.add_sessions())
+        path: Snapshot directory
+        now: int64 epoch ns of the run (default: the current time)
+    """
+    store = CohortStore(path)
+    store.add_users(user_ids, created)
+    store.add_sessions(users, guest, times, now=now)
+    store.save()
+    return store
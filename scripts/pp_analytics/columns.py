@@ -0,0 +1,205 @@
+# columns.py
+"""
+Columnar views of Firestore documents.
+
+Reports used to branch per document (hasattr(x, 'timestamp'), nested
+.get('location', {}).get('parsed', {}), ...). to_columns() instead makes
+one pass over a batch of documents and returns a DataFrame of typed
+columns, so checks and bucketing can be NumPy expressions over whole
+columns:
+
+- TIMESTAMP: int64 epoch nanoseconds, NAT for missing/unparseable values
+  (Firestore timestamps, datetimes and ISO strings are all accepted)
+- FLOAT: float64, NaN for missing or non-numeric values
+- DICTIONARY: pandas Categorical (integer codes plus a dictionary of
+  values, in order of first appearance); falsy values are missing (-1)
+- PRESENT: bool, True where the value is truthy
+- MAP: bool, True where the value is a map (dict), whatever its contents
+
+A column spec maps column name -> (field path, kind); field paths may be
+dotted ('location.parsed.metro').
+
+Documents are read a chunk at a time, one column at a time: snapshot
+documents of a chunk are decoded with a single json.loads() call, leaving
+timestamps tagged (only the values read into columns that need them are
+decoded), and each field path is one list comprehension over the chunk,
+with shared parent paths ('value' for 'value.actualPrice') walked once.
+
+NumPy and pandas are imported on first use, so importing this module (for
+the kind constants) stays cheap.
+"""
+
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+import math
+import numbers
+
+from pp_analytics.snapshot import SnapshotDocument, decode_tagged, decode_value
+
+TIMESTAMP = 'timestamp'
+FLOAT = 'float'
+DICTIONARY = 'dictionary'
+PRESENT = 'present'
+MAP = 'map'
+
+# Kinds whose result differs for a tagged value ({'__timestamp__': ...})
+_DECODED_KINDS = (TIMESTAMP, DICTIONARY, MAP)
+
+# Documents decoded at once by to_columns()
+DECODE_CHUNK_SIZE = 10_000
+
+# FLOAT values NumPy converts exactly as _float() does (None -> NaN)
+_PLAIN_NUMBER_TYPES = {float, int, type(None)}
+
+NAT = -2 ** 63  # int64 min, as in NumPy/pandas
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _extract(records, path, extracted):
+    """Values at a (dotted) field path, one per record; parent paths are walked once."""
+    if path not in extracted:
+        parent, _, leaf = path.rpartition('.')
+        if parent:
+            extracted[path] = [value.get(leaf) if isinstance(value, dict) else None
+                               for value in _extract(records, parent, extracted)]
+        else:
+            extracted[path] = [record.get(leaf) for record in records]
+    return extracted[path]
+
+
+def epoch_ns(value):
+    """Epoch nanoseconds for a timestamp-like value, or NAT.
+
+    Naive datetimes are taken as local time, like datetime.fromtimestamp().
+    """
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return NAT
+    if not isinstance(value, datetime):
+        return NAT
+    if value.tzinfo is None:
+        value = value.astimezone()
+    return (value - _EPOCH) // _MICROSECOND * 1000
+
+
+def _float(value):
+    if isinstance(value, numbers.Number) and not isinstance(value, complex):
+        return float(value)
+    return math.nan
+
+
+def _column(values, kind):
+    import numpy as np
+    import pandas as pd
+
+    if kind == TIMESTAMP:
+        return np.array([epoch_ns(v) if v else NAT for v in values], dtype=np.int64)
+    if kind == FLOAT:
+        if set(map(type, values)) <= _PLAIN_NUMBER_TYPES:
+            return np.array(values, dtype=np.float64)
+        return np.array([np.nan if v is None else _float(v) for v in values], dtype=np.float64)
+    if kind == DICTIONARY:
+        codes, uniques = pd.factorize(np.array([v if v else None for v in values], dtype=object))
+        return pd.Categorical.from_codes(codes, categories=uniques)
+    if kind == PRESENT:
+        return np.array([bool(v) for v in values], dtype=bool)
+    if kind == MAP:
+        return np.array([isinstance(v, dict) for v in values], dtype=bool)
+    raise ValueError(f"Unknown column kind: {kind}")
+
+
+def to_columns(docs, spec):
+    """
+    Turn documents into a DataFrame of typed columns.
+
+    Args:
+        docs: Documents with .id and .to_dict()
+        spec: {column name: (field path, kind)}
+
+    Returns:
+        DataFrame with an 'id' column plus one column per spec entry
+    """
+    import numpy as np
+    import pandas as pd
+
+    ids = []
+    tagged = False
+    raw = {name: [] for name in spec}
+    docs = iter(docs)
+    while True:
+        chunk = list(islice(docs, DECODE_CHUNK_SIZE))
+        if not chunk:
+            break
+        ids.extend([doc.id for doc in chunk])
+        if all(type(doc) is SnapshotDocument for doc in chunk):
+            records = decode_tagged(chunk)
+            tagged = True
+        else:
+            records = [doc.to_dict() or {} for doc in chunk]
+        extracted = {}
+        for name, (path, _) in spec.items():
+            raw[name].extend(_extract(records, path, extracted))
+
+    columns = {'id': np.array(ids, dtype=object)}
+    for name, (_, kind) in spec.items():
+        values = raw[name]
+        if tagged and kind in _DECODED_KINDS and dict in set(map(type, values)):
+            values = [decode_value(v) for v in values]
+        columns[name] = _column(values, kind)
+    return pd.DataFrame(columns)
+
+
+def iter_column_batches(docs, spec, batch_size=None):
+    """Yield to_columns() DataFrames of up to batch_size documents (None = all at once)."""
+    docs = iter(docs)
+    while True:
+        chunk = list(islice(docs, batch_size)) if batch_size else list(docs)
+        if not chunk:
+            return
+        yield to_columns(chunk, spec)
+        if not batch_size:
+            return
+
+
+# ===========================================
+# DICTIONARY COLUMN HELPERS
+# ===========================================
+# Results are in order of first appearance, so tie-breaks in sorted output
+# match a per-document loop that inserted into a dict.
+
+def dictionary_counts(column, mask=None):
+    """Return [(value, count)] for the non-missing values of a DICTIONARY column."""
+    import numpy as np
+    import pandas as pd
+
+    codes = np.asarray(column.codes)
+    if mask is not None:
+        codes = codes[mask]
+    codes = codes[codes >= 0]
+    order = pd.unique(codes)
+    counts = np.bincount(codes, minlength=len(column.categories))
+    return [(column.categories[code], int(counts[code])) for code in order]
+
+
+def group_values(column, values, mask=None):
+    """Return [(value, values array)] grouping `values` by a DICTIONARY column."""
+    import numpy as np
+    import pandas as pd
+
+    codes = np.asarray(column.codes)
+    keep = codes >= 0
+    if mask is not None:
+        keep &= mask
+    codes = codes[keep]
+    values = np.asarray(values)[keep]
+    if not len(codes):
+        return []
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    boundaries = np.flatnonzero(np.diff(sorted_codes)) + 1
+    groups = dict(zip(sorted_codes[np.r_[0, boundaries]].tolist(), np.split(values[order], boundaries)))
+    return [(column.categories[code], groups[code]) for code in pd.unique(codes)]
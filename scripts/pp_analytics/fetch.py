@@ -0,0 +1,93 @@
+# fetch.py
+"""
+Concurrent collection fetching.
+
+The reports need several independent collections before they can start.
+fetch_collections() loads them in a thread pool (the Firestore client is
+thread-safe and each stream() is mostly waiting on the network), so a run
+takes about as long as its slowest collection instead of the sum of all of
+them. Every collection still goes through snapshot.load_collection() (or
+windows.load_window() for a time slice), so snapshots, --refresh and
+--incremental behave the same. Within a collection, a full fetch is split
+into id ranges that are streamed in parallel too (scans.py).
+
+Settings:
+- PP_FETCH_CONCURRENCY: max collections fetched at once (default: all)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+
+from pp_analytics.snapshot import load_collection
+from pp_analytics.trace import span
+from pp_analytics.windows import load_window
+
+
+def fetch_concurrency(value=None):
+    """Return the concurrency limit, honouring PP_FETCH_CONCURRENCY."""
+    if value is not None:
+        return value
+    env_value = os.environ.get('PP_FETCH_CONCURRENCY')
+    return int(env_value) if env_value else None
+
+
+def fetch_collections(db, collections, max_workers=None, refresh=False, ttl_hours=None,
+                      incremental=None, fields=None, windows=None, tables=None, verbose=True):
+    """
+    Load several collections concurrently.
+
+    Args:
+        db: Firestore client
+        collections: Collection names to load
+        max_workers: Max collections in flight (default: PP_FETCH_CONCURRENCY,
+            else one worker per collection)
+        refresh, ttl_hours, incremental: Passed to load_collection()
+        fields: Optional {collection: field paths} projection (see fields.py)
+        windows: Optional {collection: clauses} to load only a time slice of
+            those collections (see windows.py)
+        tables: Optional Tables; collections held there aren't fetched again
+        verbose: Print per-collection timing
+
+    Returns:
+        (docs_by_collection, timings) where docs_by_collection maps name ->
+        list of documents and timings maps name -> {'seconds', 'docs'}
+    """
+    collections = list(dict.fromkeys(collections))
+    max_workers = fetch_concurrency(max_workers) or len(collections) or 1
+
+    def load(name):
+        started = time.perf_counter()
+        options = {'refresh': refresh, 'ttl_hours': ttl_hours, 'incremental': incremental,
+                   'fields': (fields or {}).get(name), 'tables': tables}
+        with span(f"fetch {name}"):
+            if windows and name in windows:
+                docs = load_window(db, name, windows[name], **options)
+            else:
+                docs = load_collection(db, name, **options)
+        return docs, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fetch') as pool:
+        futures = {name: pool.submit(load, name) for name in collections}
+        results = {name: future.result() for name, future in futures.items()}
+    elapsed = time.perf_counter() - started
+
+    docs_by_collection = {name: docs for name, (docs, _) in results.items()}
+    timings = {name: {'seconds': seconds, 'docs': len(docs)} for name, (docs, seconds) in results.items()}
+
+    if verbose:
+        for name in collections:
+            timing = timings[name]
+            print(f"  {name}: {timing['docs']} docs in {timing['seconds']:.2f}s")
+        print(f"  Fetched {len(collections)} collections in {elapsed:.2f}s "
+              f"({min(max_workers, len(collections))} concurrent)")
+
+    return docs_by_collection, timings
+
+
+def add_fetch_arguments(parser):
+    """Add the --fetch-concurrency option."""
+    parser.add_argument('--fetch-concurrency', type=int, default=None, metavar='N',
+                        help="Max collections fetched at once (default: PP_FETCH_CONCURRENCY or all)")
+    return parser
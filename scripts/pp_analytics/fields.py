@@ -0,0 +1,61 @@
+# fields.py
+"""
+Per-report field manifest.
+
+Lists, for every report, the collections it reads and the field paths it
+actually uses, so fetches can select() just those instead of whole
+documents (our listing documents carry images and full AI responses).
+
+Values:
+- list of field paths: fetch only these (dotted paths select nested fields)
+- ID_ONLY ([]): the report only needs document ids
+- AGGREGATE: the report only needs counts/sums/averages, which come from
+  aggregation queries (see aggregations.py) instead of a fetch
+
+Keep these in sync with the report code: a field missing here reads as
+absent in the report.
+"""
+
+ID_ONLY = []
+AGGREGATE = 'aggregate'
+
+REPORT_FIELDS = {
+    'user_engagement': {
+        'sessions': ['startTime', 'lastActivity', 'userId', 'isGuest', 'duration',
+                     'deviceInfo.type', 'deviceInfo.browser'],
+        'activities': ['activityType', 'userId', 'timestamp'],
+        'users': ['createdAt'],
+        'user_stats': AGGREGATE,
+    },
+    'pricing_data_quality': {
+        'soldPrices': ['actualSoldPrice', 'category', 'condition', 'itemName',
+                       'location.parsed', 'timestamp', 'daysToSell'],
+        'listings': AGGREGATE,
+        'feedback_events': AGGREGATE,
+    },
+    'ai_accuracy_validator': {
+        'listings': ['id', 'pricingStrategy.listingPrice', 'pricingStrategy.optimal',
+                     'itemIdentification.name', 'itemIdentification.category',
+                     'itemIdentification.observedCondition', 'itemName', 'category', 'condition'],
+        'listings_temp': ['wasSold', 'actualPrice', 'itemName', 'daysToSell', 'createdAt', 'updatedAt'],
+        'feedback_events': ['listingId', 'purpose', 'stage', 'value', 'metadata', 'createdAt'],
+        'soldPrices': AGGREGATE,
+    },
+    'data_cleanup': {
+        'listings_temp': ['createdAt', 'updatedAt', 'lastFeedbackAt', 'stage'],
+        'soldPrices': ['actualSoldPrice', 'category', 'condition', 'itemName', 'location.parsed'],
+        'sessions': ['userId', 'startTime', 'lastActivity', 'duration', 'isGuest'],
+        'feedback_events': ['listingId', 'purpose'],
+        'listings': ['pricingStrategy'],
+    },
+}
+
+
+def report_fields(report):
+    """Return {collection: field list} for the collections a report streams."""
+    return {name: fields for name, fields in REPORT_FIELDS[report].items() if fields != AGGREGATE}
+
+
+def report_aggregates(report):
+    """Return the collections a report only aggregates."""
+    return [name for name, fields in REPORT_FIELDS[report].items() if fields == AGGREGATE]
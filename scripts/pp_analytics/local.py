@@ -0,0 +1,474 @@
+# local.py
+"""
+In-process stand-in for the Firestore client, backed by local fixtures.
+
+Implements the part of google.cloud.firestore.Client the scripts use:
+collection().stream(), where(filter=...), select(), order_by('__name__')
+with document id cursors, collection_group().get_partitions(),
+count()/sum()/avg() aggregations, document() references, get_all() and
+batch() writes (applied all or nothing, with ArrayUnion transforms), on
+documents held in memory. Nothing here imports google.cloud, so reports,
+snapshots and benchmarks run with no credentials or network at all.
+
+Select it with PP_FIRESTORE_BACKEND=local and PP_LOCAL_DATA=<dir> (see
+client.py), or pass LocalClient(dir) as db=. The directory holds one file
+per collection:
+
+- <collection>.parquet: an `id` and a `data` column, the document encoded
+  by snapshot.encode_document(). Snapshot directories and synthetic
+  datasets (synthetic.py) are in this format and can be used directly.
+- <collection>.jsonl: one {"id": ..., "data": {...}} object per line, with
+  timestamps written as {"__timestamp__": "<ISO 8601>"}.
+
+A collection is read the first time it is used and kept encoded, one JSON
+string per document; documents are only decoded when a filter, projection
+or to_dict() needs them. Writes change the in-memory copy only, never the
+fixture files.
+"""
+
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+import json
+import os
+import threading
+
+from pp_analytics.aggregations import matches_filters
+from pp_analytics.snapshot import decode_document, encode_document
+
+# Firestore's limit on writes per batch
+MAX_BATCH_WRITES = 500
+
+FieldFilter = namedtuple('FieldFilter', ['field_path', 'op_string', 'value'])
+AggregationResult = namedtuple('AggregationResult', ['alias', 'value'])
+QueryPartition = namedtuple('QueryPartition', ['start_at', 'end_at'])
+
+
+class ArrayUnion:
+    """Stand-in for google.cloud.firestore.ArrayUnion: adds values missing from an array."""
+
+    __slots__ = ('values',)
+
+    def __init__(self, values):
+        self.values = list(values)
+
+    def apply(self, current):
+        array = list(current) if isinstance(current, list) else []
+        return array + [value for value in self.values if value not in array]
+
+
+def _get_path(data, parts):
+    for part in parts:
+        if not isinstance(data, dict) or part not in data:
+            return False, None
+        data = data[part]
+    return True, data
+
+
+def _project(data, fields):
+    """Keep only the given (possibly dotted) field paths, as select() does."""
+    projected = {}
+    for path in fields:
+        parts = path.split('.')
+        found, value = _get_path(data, parts)
+        if not found:
+            continue
+        target = projected
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return projected
+
+
+def _cursor_id(values):
+    """Document id of a cursor on '__name__': {'__name__': reference or id}, a reference or a snapshot."""
+    if isinstance(values, dict):
+        values = values['__name__']
+    return values if isinstance(values, str) else values.id
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class LocalDocument:
+    """A document read from a LocalClient (.id, .exists, .reference, .to_dict())."""
+
+    __slots__ = ('id', 'exists', '_client', '_collection', '_payload', '_data')
+
+    def __init__(self, client, collection, doc_id, payload=None, data=None, exists=True):
+        self.id = doc_id
+        self.exists = exists
+        self._client = client
+        self._collection = collection
+        self._payload = payload
+        self._data = data
+
+    def to_dict(self):
+        if not self.exists:
+            return None
+        if self._data is None:
+            return decode_document(self._payload)
+        return self._data
+
+    @property
+    def reference(self):
+        return LocalDocumentReference(self._client, self._collection, self.id)
+
+
+class LocalDocumentReference:
+    """A reference to one document; what .reference and document() return."""
+
+    def __init__(self, client, collection, doc_id):
+        self._client = client
+        self._collection = collection
+        self.id = doc_id
+
+    @property
+    def path(self):
+        return f"{self._collection}/{self.id}"
+
+    @property
+    def parent(self):
+        return LocalQuery(self._client, self._collection)
+
+    def get(self, field_paths=None):
+        payload = self._client._rows(self._collection).get(self.id)
+        if payload is None:
+            return LocalDocument(self._client, self._collection, self.id, exists=False)
+        if field_paths is None:
+            return LocalDocument(self._client, self._collection, self.id, payload=payload)
+        return LocalDocument(self._client, self._collection, self.id,
+                             data=_project(decode_document(payload), field_paths))
+
+    def set(self, data):
+        self._client._apply([('set', self, data)])
+
+    def update(self, data):
+        self._client._apply([('update', self, data)])
+
+    def delete(self):
+        self._client._apply([('delete', self)])
+
+    def __eq__(self, other):
+        return isinstance(other, LocalDocumentReference) and self.path == other.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def __repr__(self):
+        return f"<LocalDocumentReference {self.path}>"
+
+
+class LocalQuery:
+    """A collection, optionally filtered and projected; queries are immutable like Firestore's."""
+
+    def __init__(self, client, collection, filters=(), fields=None, start=None, end=None):
+        self._client = client
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._fields = fields
+        # Id cursors: (doc id, inclusive) or None
+        self._start = start
+        self._end = end
+        self.id = collection
+
+    def _derive(self, **changes):
+        options = {'filters': self._filters, 'fields': self._fields, 'start': self._start, 'end': self._end}
+        options.update(changes)
+        return LocalQuery(self._client, self._collection, **options)
+
+    def document(self, doc_id):
+        return LocalDocumentReference(self._client, self._collection, doc_id)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is None:
+            filter = FieldFilter(field_path, op_string, value)
+        clause = (filter.field_path, filter.op_string, filter.value)
+        return self._derive(filters=self._filters + (clause,))
+
+    def select(self, field_paths):
+        return self._derive(fields=list(field_paths))
+
+    def order_by(self, field_path, direction='ASCENDING'):
+        # Documents always stream in id order, the only order supported here
+        if field_path != '__name__' or direction != 'ASCENDING':
+            raise NotImplementedError("The local backend only orders by document id ('__name__')")
+        return self
+
+    def start_at(self, values):
+        return self._derive(start=(_cursor_id(values), True))
+
+    def start_after(self, values):
+        return self._derive(start=(_cursor_id(values), False))
+
+    def end_at(self, values):
+        return self._derive(end=(_cursor_id(values), True))
+
+    def end_before(self, values):
+        return self._derive(end=(_cursor_id(values), False))
+
+    def _id_range(self, ids):
+        low, high = 0, len(ids)
+        if self._start is not None:
+            doc_id, inclusive = self._start
+            low = (bisect_left if inclusive else bisect_right)(ids, doc_id)
+        if self._end is not None:
+            doc_id, inclusive = self._end
+            high = (bisect_right if inclusive else bisect_left)(ids, doc_id)
+        return ids[low:high]
+
+    def stream(self):
+        client, collection = self._client, self._collection
+        rows = client._rows(collection)
+        filters, fields = self._filters, self._fields
+        # Iterate over a copy of the ids so writes during the stream don't break it
+        for doc_id in self._id_range(client._ordered_ids(collection)):
+            payload = rows.get(doc_id)
+            if payload is None:
+                continue
+            if not filters:
+                if fields is None:
+                    yield LocalDocument(client, collection, doc_id, payload=payload)
+                    continue
+                if not fields:
+                    # select([]): ids only, nothing to decode
+                    yield LocalDocument(client, collection, doc_id, data={})
+                    continue
+            data = decode_document(payload)
+            if filters and not matches_filters(data, filters):
+                continue
+            if fields is not None:
+                data = _project(data, fields)
+            yield LocalDocument(client, collection, doc_id, data=data)
+
+    def get(self):
+        return list(self.stream())
+
+    def count(self, alias=None):
+        return LocalAggregationQuery(self).count(alias)
+
+    def sum(self, field_path, alias=None):
+        return LocalAggregationQuery(self).sum(field_path, alias)
+
+    def avg(self, field_path, alias=None):
+        return LocalAggregationQuery(self).avg(field_path, alias)
+
+
+class LocalCollectionGroup(LocalQuery):
+    """collection_group(): the top-level collection of that name, which can be partitioned."""
+
+    def get_partitions(self, partition_count):
+        """Up to partition_count ranges of about as many documents each, like Firestore's partition query."""
+        ids = self._client._ordered_ids(self._collection)
+        points = sorted({ids[len(ids) * i // partition_count] for i in range(1, partition_count)} if ids else set())
+        bounds = [None] + [self.document(point) for point in points] + [None]
+        for start_at, end_at in zip(bounds[:-1], bounds[1:]):
+            yield QueryPartition(start_at, end_at)
+
+
+class LocalAggregationQuery:
+    """count() / sum() / avg() over a LocalQuery, with Firestore's semantics."""
+
+    def __init__(self, query, aggregations=()):
+        self._query = query
+        self._aggregations = tuple(aggregations)
+
+    def _add(self, kind, field_path, alias):
+        alias = alias or f"field_{len(self._aggregations) + 1}"
+        return LocalAggregationQuery(self._query, self._aggregations + ((kind, field_path, alias),))
+
+    def count(self, alias=None):
+        return self._add('count', None, alias)
+
+    def sum(self, field_path, alias=None):
+        return self._add('sum', field_path, alias)
+
+    def avg(self, field_path, alias=None):
+        return self._add('avg', field_path, alias)
+
+    def get(self):
+        fields = sorted({field for kind, field, _ in self._aggregations if field})
+        docs = self._query.select(fields).stream()
+        count = 0
+        totals = dict.fromkeys(fields, 0)
+        numeric = dict.fromkeys(fields, 0)
+        for doc in docs:
+            count += 1
+            data = doc.to_dict()
+            for field in fields:
+                _, value = _get_path(data, field.split('.'))
+                # sum() and avg() skip non-numeric values
+                if _is_number(value):
+                    totals[field] += value
+                    numeric[field] += 1
+
+        row = []
+        for kind, field, alias in self._aggregations:
+            if kind == 'count':
+                value = count
+            elif kind == 'sum':
+                value = totals[field]
+            else:
+                value = totals[field] / numeric[field] if numeric[field] else None
+            row.append(AggregationResult(alias, value))
+        return [row]
+
+
+class LocalWriteBatch:
+    """Writes applied together on commit(), like a Firestore WriteBatch."""
+
+    def __init__(self, client):
+        self._client = client
+        self._operations = []
+
+    def _add(self, operation):
+        if len(self._operations) >= MAX_BATCH_WRITES:
+            raise ValueError(f"A batch can hold at most {MAX_BATCH_WRITES} writes")
+        self._operations.append(operation)
+
+    def set(self, reference, data):
+        self._add(('set', reference, data))
+
+    def update(self, reference, data):
+        self._add(('update', reference, data))
+
+    def delete(self, reference):
+        self._add(('delete', reference))
+
+    def commit(self):
+        self._client._apply(self._operations)
+        operations, self._operations = self._operations, []
+        return operations
+
+
+class LocalClient:
+    """
+    Firestore client stand-in over a directory of fixtures.
+
+    Args:
+        path: Directory of <collection>.parquet / <collection>.jsonl files
+    """
+
+    def __init__(self, path):
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"Local Firestore data directory not found: {path}")
+        self.path = path
+        self._collections = {}
+        self._sorted = {}
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        return f"<LocalClient {self.path}>"
+
+    def collection(self, name):
+        return LocalQuery(self, name)
+
+    def collection_group(self, name):
+        return LocalCollectionGroup(self, name)
+
+    def batch(self):
+        return LocalWriteBatch(self)
+
+    def get_all(self, references, field_paths=None):
+        for reference in references:
+            yield reference.get(field_paths=field_paths)
+
+    def field_filter(self, field_path, op_string, value):
+        return FieldFilter(field_path, op_string, value)
+
+    def array_union(self, values):
+        return ArrayUnion(values)
+
+    # Storage: {collection: {doc_id: encoded document}}, loaded on first use
+
+    def _load(self, name):
+        parquet_path = os.path.join(self.path, f"{name}.parquet")
+        jsonl_path = os.path.join(self.path, f"{name}.jsonl")
+        if os.path.exists(parquet_path):
+            import pyarrow.parquet as pq
+            table = pq.read_table(parquet_path, columns=['id', 'data'])
+            return dict(zip(table.column('id').to_pylist(), table.column('data').to_pylist()))
+        rows = {}
+        if os.path.exists(jsonl_path):
+            with open(jsonl_path) as f:
+                for line_number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        record = decode_document(line)
+                    except ValueError as e:
+                        raise ValueError(f"{jsonl_path}:{line_number}: {e}") from e
+                    rows[str(record['id'])] = encode_document(record.get('data'))
+        return rows
+
+    def _rows(self, name):
+        rows = self._collections.get(name)
+        if rows is None:
+            with self._lock:
+                rows = self._collections.get(name)
+                if rows is None:
+                    rows = self._load(name)
+                    self._collections[name] = rows
+                    self._sorted[name] = None
+        return rows
+
+    def _ordered_ids(self, name):
+        """Document ids in id order, as Firestore streams them."""
+        rows = self._rows(name)
+        with self._lock:
+            ids = self._sorted.get(name)
+            if ids is None:
+                ids = self._sorted[name] = sorted(rows)
+            return ids
+
+    def _apply(self, operations):
+        # Staged first, so a failing write (an update of a missing document)
+        # leaves every document as it was, as a failed commit does
+        with self._lock:
+            staged = {}
+            for operation in operations:
+                kind, reference = operation[0], operation[1]
+                key = (reference._collection, reference.id)
+                if kind == 'delete':
+                    staged[key] = None
+                    continue
+                if key in staged:
+                    data = staged[key]
+                else:
+                    payload = self._rows(reference._collection).get(reference.id)
+                    data = None if payload is None else decode_document(payload)
+                if kind == 'set':
+                    data = {}
+                elif data is None:
+                    raise KeyError(f"No document to update: {reference.path}")
+                for field, value in operation[2].items():
+                    target = data
+                    parts = field.split('.') if kind == 'update' else [field]
+                    for part in parts[:-1]:
+                        target = target.setdefault(part, {})
+                    if isinstance(value, ArrayUnion):
+                        value = value.apply(target.get(parts[-1]))
+                    target[parts[-1]] = value
+                staged[key] = data
+            for (collection, doc_id), data in staged.items():
+                rows = self._rows(collection)
+                if data is None:
+                    rows.pop(doc_id, None)
+                    continue
+                if doc_id not in rows:
+                    self._sorted[collection] = None
+                rows[doc_id] = encode_document(data)
+
+
+def write_fixture(path, collection, documents):
+    """
+    Write {doc_id: data} (or (doc_id, data) pairs) as <path>/<collection>.jsonl.
+
+    Handy for small hand-made fixtures; use synthetic.write_dataset() for
+    large ones.
+    """
+    items = documents.items() if isinstance(documents, dict) else documents
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, f"{collection}.jsonl"), 'w') as f:
+        for doc_id, data in items:
+            f.write(json.dumps({'id': doc_id, 'data': json.loads(encode_document(data))}) + '\n')
@@ -0,0 +1,248 @@
+# scans.py
+"""
+Partitioned, parallel full scans of a collection.
+
+A plain stream() reads a collection through one connection, a page at a
+time, and a long enough stream fails on its deadline. scan_collection()
+instead splits the collection into ranges of document ids and streams the
+ranges from a thread pool, so a full scan keeps several connections busy
+and no single stream runs for long.
+
+Split points come from a partition query (CollectionGroup.get_partitions()),
+which Firestore balances by document count. Where the client can't run
+one, the space of auto-generated ids (20 random characters of [0-9A-Za-z])
+is cut into equal slices instead. Either way the ranges are disjoint and
+cover every possible id, so each document is read exactly once whatever
+ids the collection holds; only the balance depends on the split points.
+
+A range whose stream fails with a transient error (deadline, unavailable,
+quota) starts again after the last document it returned, with backoff, up
+to DEFAULT_MAX_RETRIES times in a row.
+
+Results come back one per range, in id order, whichever range finishes
+first, so concatenating them gives the documents of a stream(), in the
+same order. A collection whose last snapshot held fewer than
+MIN_PARTITION_DOCS documents per partition is split into fewer ranges,
+down to a single stream.
+
+Settings (configure_scans() and --scan-partitions / --scan-concurrency
+take precedence):
+- PP_SCAN_PARTITIONS: id ranges per full scan (default: 16; 1 = one stream)
+- PP_SCAN_CONCURRENCY: ranges streamed at once (default: 8)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import random
+import time
+
+from pp_analytics.client import retryable_errors
+from pp_analytics.snapshot import project_query
+from pp_analytics.trace import span
+
+DEFAULT_SCAN_PARTITIONS = 16
+DEFAULT_SCAN_CONCURRENCY = 8
+DEFAULT_MAX_RETRIES = 6
+MIN_PARTITION_DOCS = 10_000
+
+# Characters of auto-generated document ids, in id (byte) order
+AUTO_ID_ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+_settings = {}
+
+
+def configure_scans(partitions=None, concurrency=None):
+    """Set scan options for this process (overrides PP_SCAN_PARTITIONS / PP_SCAN_CONCURRENCY)."""
+    for key, value in (('partitions', partitions), ('concurrency', concurrency)):
+        if value is not None:
+            _settings[key] = value
+
+
+def _setting(key, env_name, default, value):
+    if value is not None:
+        return value
+    if key in _settings:
+        return _settings[key]
+    env_value = os.environ.get(env_name)
+    return int(env_value) if env_value else default
+
+
+def scan_partitions(value=None):
+    """Return the number of id ranges per full scan, honouring PP_SCAN_PARTITIONS."""
+    return max(1, _setting('partitions', 'PP_SCAN_PARTITIONS', DEFAULT_SCAN_PARTITIONS, value))
+
+
+def scan_concurrency(value=None):
+    """Return the number of ranges streamed at once, honouring PP_SCAN_CONCURRENCY."""
+    return max(1, _setting('concurrency', 'PP_SCAN_CONCURRENCY', DEFAULT_SCAN_CONCURRENCY, value))
+
+
+def partition_count(partitions=None, expected_docs=None):
+    """Ranges for a scan: scan_partitions(), fewer if the collection is known to be small."""
+    partitions = scan_partitions(partitions)
+    if expected_docs is not None:
+        partitions = min(partitions, max(1, expected_docs // MIN_PARTITION_DOCS))
+    return partitions
+
+
+# ===========================================
+# SPLIT POINTS
+# ===========================================
+
+def _partition_query_errors():
+    # A client without partition queries, or a server that refuses one
+    try:
+        from google.api_core import exceptions
+    except ImportError:
+        return (AttributeError, NotImplementedError)
+    return (AttributeError, NotImplementedError, exceptions.GoogleAPICallError)
+
+
+def partition_query_points(db, collection, partitions):
+    """
+    Split ids from a partition query, or None if the client can't run one.
+
+    Partition queries run over collection groups, so a point may come from a
+    same-named subcollection elsewhere. Only its id is kept, which still
+    splits the top-level collection, if less evenly.
+    """
+    try:
+        return [partition.end_at.id for partition in db.collection_group(collection).get_partitions(partitions)
+                if partition.end_at is not None]
+    except _partition_query_errors():
+        return None
+
+
+def auto_id_points(partitions):
+    """partitions - 1 ids cutting the space of auto-generated ids into equal slices."""
+    base = len(AUTO_ID_ALPHABET)
+    points = []
+    for i in range(1, partitions):
+        position = i * base * base // partitions
+        points.append(AUTO_ID_ALPHABET[position // base] + AUTO_ID_ALPHABET[position % base])
+    return points
+
+
+def split_points(db, collection, partitions):
+    """Sorted, distinct ids splitting a collection into at most `partitions` ranges."""
+    if partitions <= 1:
+        return []
+    points = partition_query_points(db, collection, partitions)
+    if points is None:
+        points = auto_id_points(partitions)
+    return sorted(set(points))
+
+
+def id_ranges(points):
+    """[(start, end)] id ranges between split points; None is unbounded."""
+    bounds = [None] + list(points) + [None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+# ===========================================
+# SCANS
+# ===========================================
+
+def range_query(db, collection, start=None, end=None, fields=None, after=None):
+    """
+    Query for the documents with start <= id < end (None: unbounded).
+
+    Args:
+        fields: Field paths to project to (None: whole documents)
+        after: Resume after this id instead of starting at `start`
+    """
+    query = project_query(db, collection, fields)
+    if start is None and end is None and after is None:
+        return query
+    reference = db.collection(collection).document
+    query = query.order_by('__name__')
+    if after is not None:
+        query = query.start_after({'__name__': reference(after)})
+    elif start is not None:
+        query = query.start_at({'__name__': reference(start)})
+    if end is not None:
+        query = query.end_before({'__name__': reference(end)})
+    return query
+
+
+def stream_range(db, collection, start=None, end=None, fields=None, max_retries=DEFAULT_MAX_RETRIES,
+                 base_delay=0.5, max_delay=30.0):
+    """
+    Yield the documents of one id range in id order.
+
+    On a transient error the range is queried again from after the last
+    document yielded, so nothing is yielded twice.
+    """
+    retryable = retryable_errors()
+    last = None
+    attempt = 0
+    while True:
+        try:
+            for doc in range_query(db, collection, start, end, fields, after=last).stream():
+                last = doc.id
+                attempt = 0
+                yield doc
+            return
+        except retryable:
+            if attempt >= max_retries:
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt)
+            time.sleep(delay * random.uniform(0.5, 1.0))
+            attempt += 1
+
+
+def scan_collection(db, collection, fields=None, partitions=None, max_workers=None, expected_docs=None,
+                    consume=None):
+    """
+    Read a whole collection as id ranges streamed in parallel.
+
+    Args:
+        db: Firestore client
+        collection: Collection name
+        fields: Field paths to project to (None: whole documents)
+        partitions: Id ranges (default: PP_SCAN_PARTITIONS or 16)
+        max_workers: Ranges streamed at once (default: PP_SCAN_CONCURRENCY or 8)
+        expected_docs: Documents the collection is expected to hold (e.g. in
+            its last snapshot), to split a small collection into fewer ranges
+        consume: consume(index, docs) is called from a worker thread for
+            each range with an iterator over its documents, in id order.
+            Default: list the documents.
+
+    Returns:
+        The consume() results, one per range, in id order
+    """
+    ranges = id_ranges(split_points(db, collection, partition_count(partitions, expected_docs)))
+
+    def read(index):
+        start, end = ranges[index]
+        docs = stream_range(db, collection, start, end, fields)
+        with span(f"scan {collection} {index + 1}/{len(ranges)}"):
+            return consume(index, docs) if consume else list(docs)
+
+    if len(ranges) == 1:
+        return [read(0)]
+    workers = min(scan_concurrency(max_workers), len(ranges))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scan') as pool:
+        return list(pool.map(read, range(len(ranges))))
+
+
+def scan_documents(db, collection, fields=None, partitions=None, max_workers=None, expected_docs=None):
+    """All documents of a collection, read by scan_collection(), in id order (as stream() returns them)."""
+    parts = scan_collection(db, collection, fields, partitions=partitions, max_workers=max_workers,
+                            expected_docs=expected_docs)
+    return [doc for part in parts for doc in part]
+
+
+def add_scan_arguments(parser):
+    """Add the --scan-partitions / --scan-concurrency options."""
+    parser.add_argument('--scan-partitions', type=int, default=None, metavar='N',
+                        help=f"Id ranges per full collection scan "
+                             f"(default: PP_SCAN_PARTITIONS or {DEFAULT_SCAN_PARTITIONS}; 1 = one stream)")
+    parser.add_argument('--scan-concurrency', type=int, default=None, metavar='N',
+                        help=f"Ranges streamed at once (default: PP_SCAN_CONCURRENCY or {DEFAULT_SCAN_CONCURRENCY})")
+    return parser
+
+
+def configure_scans_from_args(args):
+    """Apply the options added by add_scan_arguments()."""
+    configure_scans(partitions=args.scan_partitions, concurrency=args.scan_concurrency)
@@ -0,0 +1,247 @@
+# sessions.py
+"""
+Rapid-fire (likely duplicate) session detection over columns.
+
+A session that starts less than a gap threshold after the same user's
+previous session is usually a duplicate: a double launch, a reconnect, a
+reload. Instead of grouping sessions per user in dicts and walking each
+user's list pairwise, SessionTable keeps the few fields involved as NumPy
+columns, sorts all sessions once by (user, start time), and finds
+neighbours closer than the gap with one vectorized diff. The sort is reused
+for every threshold asked for.
+
+Neighbours within the gap are reported both as pairs and as bursts: a
+burst is a maximal chain of one user's sessions, each starting within the
+gap of the previous one. merge_operations() turns bursts into writes that
+fold each burst into its first (canonical) session.
+
+Memory per session is a user code, three numbers and the document id (kept
+in an Arrow string array), so tens of millions of sessions fit.
+"""
+
+from datetime import datetime, timezone
+
+from pp_analytics.client import array_union
+from pp_analytics.columns import DICTIONARY, FLOAT, NAT, TIMESTAMP, iter_column_batches
+from pp_analytics.snapshot import ROW_GROUP_SIZE
+from pp_analytics.writes import MAX_BATCH_SIZE
+
+DEFAULT_GAP_SECONDS = 60
+
+# Typed columns read from each session document (see columns.py)
+SESSION_COLUMNS = {
+    'user': ('userId', DICTIONARY),
+    'start': ('startTime', TIMESTAMP),
+    'last_activity': ('lastActivity', TIMESTAMP),
+    'duration': ('duration', FLOAT),
+}
+
+_NS_PER_SECOND = 1_000_000_000
+_NS_PER_MS = 1_000_000
+
+
+class SessionTable:
+    """
+    Sessions as columns, built one batch of documents at a time.
+
+    Attributes (after finish()):
+        ids: pyarrow ChunkedArray of document ids
+        user: int32 user codes (-1: no userId); user_ids[code] is the userId
+        start: int64 start times, epoch ns (NAT if missing)
+        end: int64 latest known end (lastActivity or start + duration), epoch ns
+        duration: float64 duration in ms (NaN if missing)
+    """
+
+    def __init__(self):
+        self.user_ids = []
+        self._user_codes = {}
+        self._chunks = {'ids': [], 'user': [], 'start': [], 'end': [], 'duration': []}
+        self._order = None
+
+    def __len__(self):
+        return len(self.start)
+
+    def add(self, frame):
+        """Append a to_columns() frame of SESSION_COLUMNS."""
+        import numpy as np
+        import pyarrow as pa
+
+        # Batch dictionary codes -> table-wide codes, in order of first appearance
+        user = frame['user'].array
+        for value in user.categories:
+            if value not in self._user_codes:
+                self._user_codes[value] = len(self.user_ids)
+                self.user_ids.append(value)
+        mapping = np.array([self._user_codes[value] for value in user.categories] + [-1], dtype=np.int32)
+        # Code -1 (no userId) picks the trailing -1
+        self._chunks['user'].append(mapping[np.asarray(user.codes)])
+
+        start = frame['start'].to_numpy()
+        duration = frame['duration'].to_numpy()
+        with np.errstate(invalid='ignore'):
+            end = np.where((start != NAT) & ~np.isnan(duration),
+                           start + np.nan_to_num(duration).astype(np.int64) * _NS_PER_MS, NAT)
+        end = np.maximum(end, frame['last_activity'].to_numpy())
+
+        self._chunks['ids'].append(pa.array(frame['id'].to_numpy(), type=pa.string()))
+        self._chunks['start'].append(start)
+        self._chunks['end'].append(end)
+        self._chunks['duration'].append(duration)
+
+    def finish(self):
+        import numpy as np
+        import pyarrow as pa
+
+        chunks = self._chunks
+        self.ids = pa.chunked_array(chunks['ids'], type=pa.string())
+        self.user = np.concatenate(chunks['user']) if chunks['user'] else np.empty(0, np.int32)
+        for name, dtype in (('start', np.int64), ('end', np.int64), ('duration', np.float64)):
+            setattr(self, name, np.concatenate(chunks[name]) if chunks[name] else np.empty(0, dtype))
+        self._chunks = None
+        return self
+
+    def id_list(self, positions):
+        import numpy as np
+
+        return self.ids.take(np.asarray(positions, dtype=np.int64)).to_pylist()
+
+    def sorted_positions(self):
+        """Positions of the sessions with a user and a start time, sorted by (user, start)."""
+        import numpy as np
+
+        if self._order is None:
+            candidates = np.flatnonzero((self.user >= 0) & (self.start != NAT))
+            # lexsort is stable: sessions starting at the same time keep document order
+            self._order = candidates[np.lexsort((self.start[candidates], self.user[candidates]))]
+        return self._order
+
+    def bursts(self, gap_seconds=DEFAULT_GAP_SECONDS):
+        """Return the Bursts of sessions starting less than gap_seconds after the previous one."""
+        import numpy as np
+
+        order = self.sorted_positions()
+        user = self.user[order]
+        start = self.start[order]
+        gaps = np.diff(start)
+        linked = (user[1:] == user[:-1]) & (gaps < int(gap_seconds * _NS_PER_SECOND))
+        return Bursts(self, gap_seconds, order, linked, gaps)
+
+
+def load_sessions(docs, batch_size=ROW_GROUP_SIZE):
+    """Build a SessionTable from session documents, batch_size documents at a time."""
+    table = SessionTable()
+    for frame in iter_column_batches(docs, SESSION_COLUMNS, batch_size=batch_size):
+        table.add(frame)
+    return table.finish()
+
+
+class Bursts:
+    """
+    Rapid-fire sessions at one gap threshold.
+
+    Edge i links sorted sessions i and i + 1 (positions order[i], order[i + 1])
+    when they belong to the same user and start less than the gap apart.
+    """
+
+    def __init__(self, table, gap_seconds, order, linked, gaps):
+        import numpy as np
+
+        self.table = table
+        self.gap_seconds = gap_seconds
+        self._order = order
+        self._edges = np.flatnonzero(linked)
+        self._gaps = gaps[self._edges]
+
+        # A burst is a maximal run of linked edges: it spans sorted positions
+        # run_start .. run_end + 1
+        previous = np.r_[False, linked[:-1]]
+        following = np.r_[linked[1:], False]
+        self._run_start = np.flatnonzero(linked & ~previous)
+        self._run_end = np.flatnonzero(linked & ~following)
+
+    @property
+    def pair_count(self):
+        """Neighbouring sessions within the gap; also the sessions a merge would remove."""
+        return len(self._edges)
+
+    @property
+    def burst_count(self):
+        return len(self._run_start)
+
+    @property
+    def session_count(self):
+        """Sessions that are part of a burst."""
+        return int((self._run_end - self._run_start + 2).sum())
+
+    def max_size(self):
+        return int((self._run_end - self._run_start + 2).max()) if self.burst_count else 0
+
+    def pairs(self, limit=None):
+        """Yield {'user_id', 'session1', 'session2', 'gap_seconds'} in (user, start) order."""
+        edges = self._edges[:limit]
+        first = self.table.id_list(self._order[edges])
+        second = self.table.id_list(self._order[edges + 1])
+        users = self.table.user[self._order[edges]]
+        for i, edge_gap in enumerate(self._gaps[:limit].tolist()):
+            yield {
+                'user_id': self.table.user_ids[users[i]],
+                'session1': first[i],
+                'session2': second[i],
+                'gap_seconds': edge_gap / _NS_PER_SECOND,
+            }
+
+    def groups(self, limit=None, largest_first=False):
+        """Yield the positions of each burst's sessions, earliest first."""
+        import numpy as np
+
+        run_start, run_end = self._run_start, self._run_end
+        if largest_first:
+            by_size = np.argsort(run_start - run_end, kind='stable')
+            run_start, run_end = run_start[by_size], run_end[by_size]
+        for first, last in zip(run_start[:limit].tolist(), run_end[:limit].tolist()):
+            yield self._order[first:last + 2]
+
+    def describe(self, limit=None, largest_first=False):
+        """Yield {'user_id', 'session_ids', 'span_seconds'} per burst."""
+        table = self.table
+        for positions in self.groups(limit, largest_first):
+            yield {
+                'user_id': table.user_ids[table.user[positions[0]]],
+                'session_ids': table.id_list(positions),
+                'span_seconds': (table.start[positions[-1]] - table.start[positions[0]]) / _NS_PER_SECOND,
+            }
+
+
+def _timestamp(ns):
+    return datetime.fromtimestamp(ns / _NS_PER_SECOND, tz=timezone.utc)
+
+
+def merge_operations(db, bursts, collection='sessions', max_sessions=MAX_BATCH_SIZE):
+    """
+    Yield write groups (see writes.py) that merge each burst into its first session.
+
+    The first session is kept and extended to cover the burst: lastActivity
+    becomes the latest end of any session in it, duration runs from its start
+    to that end, and the sessions folded into it are added to its
+    mergedSessionIds (so activities that still reference them can be
+    resolved). The other sessions are deleted. Each burst is one group, so
+    the update and the deletes commit together or not at all.
+
+    A burst of more than max_sessions sessions (one batch) is merged as
+    consecutive runs of max_sessions, each into its own first session.
+    """
+    table = bursts.table
+    sessions = db.collection(collection)
+    for burst in bursts.groups():
+        for offset in range(0, len(burst), max_sessions):
+            positions = burst[offset:offset + max_sessions]
+            if len(positions) < 2:
+                continue
+            ids = table.id_list(positions)
+            start = int(table.start[positions[0]])
+            end = int(max(table.end[positions].max(), start))
+            yield [('update', sessions.document(ids[0]), {
+                'lastActivity': _timestamp(end),
+                'duration': (end - start) // _NS_PER_MS,
+                'mergedSessionIds': array_union(db, ids[1:]),
+            })] + [('delete', sessions.document(doc_id)) for doc_id in ids[1:]]
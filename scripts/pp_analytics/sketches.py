@@ -0,0 +1,364 @@
+# sketches.py
+"""
+Mergeable summaries for streaming aggregation.
+
+- QuantileSketch: relative-error quantile sketch (DDSketch-style log
+  buckets). Memory depends on the range of values, not how many were
+  added: prices from $0.01 to $1M at 1% accuracy fit in ~1,200 buckets.
+- ValueSummary: count / sum / mean / std / min / max of a stream of numbers
+  plus quantiles, either exact (keeps every value) or sketched.
+- HyperLogLog: approximate distinct count of strings (user ids) in a fixed
+  16 KB, ~0.8% standard error at the default precision.
+
+All support merge() so partial summaries (per batch, per worker, per day)
+can be combined, and add_many() to add a NumPy array in one vectorized step
+(NumPy is only imported when add_many() is used, or for HyperLogLog).
+"""
+
+import base64
+import bisect
+import math
+
+
+class QuantileSketch:
+    """
+    Quantile sketch for non-negative values with bounded relative error.
+
+    A value x lands in bucket ceil(log_gamma(x)) where
+    gamma = (1 + alpha) / (1 - alpha); any quantile read back is within
+    alpha (relative) of a true value at that rank. Values at or below
+    min_value are counted as zero.
+    """
+
+    def __init__(self, relative_accuracy=0.01, min_value=1e-9):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.min_value = min_value
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value, weight=1):
+        if value <= self.min_value:
+            self.zero_count += weight
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[index] = self.bins.get(index, 0) + weight
+        self.count += weight
+
+    def add_many(self, values):
+        import numpy as np
+
+        values = np.asarray(values, dtype=np.float64)
+        zero = values <= self.min_value
+        self.zero_count += int(zero.sum())
+        indexes, counts = np.unique(np.ceil(np.log(values[~zero]) / self._log_gamma).astype(np.int64),
+                                    return_counts=True)
+        for index, count in zip(indexes.tolist(), counts.tolist()):
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.count += len(values)
+        return self
+
+    def merge(self, other):
+        if other.gamma != self.gamma:
+            raise ValueError("Can't merge sketches with different relative accuracy")
+        for index, weight in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + weight
+        self.zero_count += other.zero_count
+        self.count += other.count
+        return self
+
+    def _bucket_value(self, index):
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def quantile(self, q):
+        """Approximate q-quantile (0 <= q <= 1), or NaN if empty."""
+        if self.count == 0:
+            return float('nan')
+        return self.value_at_rank(q * (self.count - 1))
+
+    def value_at_rank(self, rank):
+        """Approximate value of the element at 0-based rank in sorted order."""
+        if self.count == 0:
+            return float('nan')
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                return self._bucket_value(index)
+        return self._bucket_value(max(self.bins))
+
+    def to_dict(self):
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'bins': {str(k): v for k, v in self.bins.items()},
+            'zero_count': self.zero_count,
+            'count': self.count,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['relative_accuracy'])
+        sketch.bins = {int(k): v for k, v in data['bins'].items()}
+        sketch.zero_count = data['zero_count']
+        sketch.count = data['count']
+        return sketch
+
+
+class ValueSummary:
+    """
+    Running statistics of a stream of numbers.
+
+    With exact=True every value is kept, so quantiles are exact (pandas-style
+    linear interpolation); otherwise a QuantileSketch bounds memory and
+    quantiles are approximate. count, sum, mean, std, min and max are exact
+    either way.
+    """
+
+    def __init__(self, exact=False, relative_accuracy=0.01):
+        self.count = 0
+        self.total = 0.0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self.min = None
+        self.max = None
+        self.values = [] if exact else None
+        self.sketch = None if exact else QuantileSketch(relative_accuracy)
+
+    @property
+    def exact(self):
+        return self.values is not None
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        # Welford's update keeps the variance stable over long streams
+        delta = value - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (value - self._mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if self.values is not None:
+            self.values.append(value)
+        else:
+            self.sketch.add(value)
+
+    def add_many(self, values):
+        """Add an array of values (same result as add() for each, up to float rounding)."""
+        import numpy as np
+
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return self
+        batch = ValueSummary(exact=self.exact)
+        batch.count = len(values)
+        batch.total = float(values.sum())
+        batch._mean = batch.total / batch.count
+        batch._m2 = float(((values - batch._mean) ** 2).sum())
+        batch.min = float(values.min())
+        batch.max = float(values.max())
+        if batch.values is not None:
+            batch.values = values.tolist()
+        else:
+            batch.sketch = QuantileSketch(self.sketch.relative_accuracy).add_many(values)
+        return self.merge(batch)
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            mean, m2 = other._mean, other._m2
+        else:
+            count = self.count + other.count
+            delta = other._mean - self._mean
+            mean = self._mean + delta * other.count / count
+            m2 = self._m2 + other._m2 + delta * delta * self.count * other.count / count
+        self.count += other.count
+        self.total += other.total
+        self._mean, self._m2 = mean, m2
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        if self.values is not None and other.values is not None:
+            self.values.extend(other.values)
+        else:
+            if self.values is not None:
+                # Exact summaries merged with sketched ones become sketched
+                self.sketch = QuantileSketch(other.sketch.relative_accuracy)
+                for value in self.values:
+                    self.sketch.add(value)
+                self.values = None
+            if other.values is not None:
+                for value in other.values:
+                    self.sketch.add(value)
+            else:
+                self.sketch.merge(other.sketch)
+        return self
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else float('nan')
+
+    def std(self):
+        """Sample standard deviation (ddof=1, like pandas)."""
+        if self.count < 2:
+            return float('nan')
+        return math.sqrt(self._m2 / (self.count - 1))
+
+    def quantile(self, q):
+        if self.values is None:
+            return self.sketch.quantile(q)
+        if not self.values:
+            return float('nan')
+        values = sorted(self.values)
+        position = q * (len(values) - 1)
+        lower = math.floor(position)
+        upper = min(lower + 1, len(values) - 1)
+        return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+    def median(self):
+        return self.quantile(0.5)
+
+    def upper_median(self):
+        """Element at index n // 2 of the sorted values."""
+        if self.values is None:
+            return self.sketch.value_at_rank(self.count // 2)
+        if not self.values:
+            return float('nan')
+        return sorted(self.values)[len(self.values) // 2]
+
+
+class BucketCounter:
+    """Exact counts of values in (edges[i], edges[i+1]] buckets."""
+
+    def __init__(self, edges):
+        self.edges = list(edges)
+        self.counts = [0] * (len(self.edges) - 1)
+
+    def add(self, value):
+        index = bisect.bisect_left(self.edges, value) - 1
+        if 0 <= index < len(self.counts):
+            self.counts[index] += 1
+
+    def add_many(self, values):
+        import numpy as np
+
+        indexes = np.searchsorted(self.edges, np.asarray(values, dtype=np.float64), side='left') - 1
+        indexes = indexes[(indexes >= 0) & (indexes < len(self.counts))]
+        self.counts = [a + int(b) for a, b in zip(self.counts, np.bincount(indexes, minlength=len(self.counts)))]
+        return self
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        return self
+
+
+# ===========================================
+# DISTINCT COUNTS
+# ===========================================
+
+HLL_PRECISION = 14
+_HLL_HASH_KEY = 'pp-hyperloglog-0'  # pandas' SipHash key (16 bytes)
+
+
+def hash_strings(values):
+    """64-bit hashes of strings, stable across runs and machines (SipHash)."""
+    import numpy as np
+    import pandas as pd
+
+    values = np.asarray([str(value) for value in values], dtype=object)
+    return pd.util.hash_array(values, hash_key=_HLL_HASH_KEY, categorize=False)
+
+
+def hll_positions(hashes, precision=HLL_PRECISION):
+    """(register index, rank) for each 64-bit hash."""
+    import numpy as np
+
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    index = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    # The bits below the index, left-aligned, with a sentinel bit so the rank
+    # is at most 64 - precision + 1
+    rest = (hashes << np.uint64(precision)) | np.uint64(1 << (precision - 1))
+    # bit_length(rest) = bit_length(rest >> 11) + 11; rest >> 11 < 2**53 is
+    # exact as a float, so frexp's exponent is its bit length
+    _, bit_length = np.frexp((rest >> np.uint64(11)).astype(np.float64))
+    rank = 64 - (bit_length + 11) + 1
+    return index, rank.astype(np.uint8)
+
+
+def hll_estimate(registers):
+    """Distinct count estimate from HLL registers (one sketch, or one per row of a 2-D array)."""
+    import numpy as np
+
+    registers = np.asarray(registers)
+    m = registers.shape[-1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.power(2.0, -registers.astype(np.float64)).sum(axis=-1)
+    zeros = (registers == 0).sum(axis=-1)
+    # Small-range correction (linear counting) while empty registers remain
+    with np.errstate(divide='ignore'):
+        linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+
+class HyperLogLog:
+    """
+    Approximate distinct count (HyperLogLog, 2**precision 1-byte registers).
+
+    Adding the same value twice changes nothing, and merge() is a register-wise
+    max, so sketches of overlapping sets (days of a rolling window) combine
+    without double counting.
+    """
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        import numpy as np
+
+        self.precision = precision
+        if registers is None:
+            registers = np.zeros(1 << precision, dtype=np.uint8)
+        self.registers = registers
+
+    def add(self, value):
+        return self.add_many([value])
+
+    def add_many(self, values):
+        return self.add_hashes(hash_strings(values))
+
+    def add_hashes(self, hashes):
+        import numpy as np
+
+        if len(hashes):
+            index, rank = hll_positions(hashes, self.precision)
+            np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        import numpy as np
+
+        if other.precision != self.precision:
+            raise ValueError("Can't merge HyperLogLogs with different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        return float(hll_estimate(self.registers))
+
+    def __len__(self):
+        return round(self.count())
+
+    def to_dict(self):
+        return {
+            'precision': self.precision,
+            'registers': base64.b64encode(self.registers.tobytes()).decode('ascii'),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        import numpy as np
+
+        registers = np.frombuffer(base64.b64decode(data['registers']), dtype=np.uint8).copy()
+        return cls(data['precision'], registers)
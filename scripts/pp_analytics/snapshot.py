@@ -0,0 +1,693 @@
+# snapshot.py
+"""
+Local snapshot cache of Firestore collections.
+
+Each collection is dumped to a Parquet file (one row per document: the doc
+id plus the document encoded as JSON) and recorded in manifest.json with
+the time it was fetched and its document count. Scripts call
+load_collection() instead of db.collection(...).stream(); it serves the
+local copy while it is younger than the TTL and goes back to Firestore when
+the snapshot is stale, missing, or refresh=True.
+
+Settings:
+- PP_SNAPSHOT_DIR: where snapshots live (default: <project>/.snapshots)
+- PP_SNAPSHOT_TTL_HOURS: how long a snapshot stays fresh (default: 12)
+- PP_SNAPSHOT_INCREMENTAL: update stale snapshots with a delta sync instead
+  of a full re-fetch (see sync.py)
+"""
+
+from datetime import datetime, timezone
+import base64
+import json
+import os
+import threading
+
+from pp_analytics.trace import record_read, tracing
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_DIR = os.path.dirname(SCRIPTS_DIR)
+
+DEFAULT_SNAPSHOT_DIR = os.path.join(PROJECT_DIR, '.snapshots')
+DEFAULT_TTL_HOURS = 12.0
+MANIFEST_NAME = 'manifest.json'
+STATE_DIR = 'state'
+
+# Rows per Parquet row group; iter_collection() holds one group at a time
+ROW_GROUP_SIZE = 50_000
+
+# refresh=True accepts snapshots taken after this, so a collection is only
+# re-fetched once per run even if a script loads it more than once.
+PROCESS_STARTED_AT = datetime.now(timezone.utc)
+
+# Collections may be loaded from several threads at once (see fetch.py);
+# manifest updates are read-modify-write, so they are serialized.
+_manifest_lock = threading.Lock()
+
+
+def snapshot_dir(path=None):
+    """
+    Return the snapshot directory, honouring PP_SNAPSHOT_DIR.
+
+    With the local backend (PP_FIRESTORE_BACKEND=local, see client.py) the
+    default is PP_LOCAL_DATA/.snapshots, so fixture data never lands in the
+    snapshots of the real database.
+    """
+    path = path or os.environ.get('PP_SNAPSHOT_DIR')
+    if path:
+        return path
+    local_data = os.environ.get('PP_LOCAL_DATA')
+    if local_data and (os.environ.get('PP_FIRESTORE_BACKEND') or '').lower() == 'local':
+        return os.path.join(local_data, '.snapshots')
+    return DEFAULT_SNAPSHOT_DIR
+
+
+def state_path(name, path=None):
+    """
+    Path of a file of persisted report state (sketches, ledgers) under the
+    snapshot directory's state/ folder, which is created if needed.
+    """
+    directory = os.path.join(snapshot_dir(path), STATE_DIR)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, name)
+
+
+def default_ttl_hours():
+    """Return the snapshot TTL in hours, honouring PP_SNAPSHOT_TTL_HOURS."""
+    value = os.environ.get('PP_SNAPSHOT_TTL_HOURS')
+    return float(value) if value else DEFAULT_TTL_HOURS
+
+
+# ===========================================
+# VALUE ENCODING
+# ===========================================
+# Firestore values that JSON can't hold are tagged so they round-trip:
+# timestamps come back as timezone-aware datetimes (so the scripts'
+# hasattr(x, 'timestamp') checks still work), bytes come back as bytes.
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.astimezone()
+        return {'__timestamp__': value.isoformat()}
+    if isinstance(value, bytes):
+        return {'__bytes__': base64.b64encode(value).decode('ascii')}
+    if isinstance(value, dict):
+        return {k: _encode_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode_value(v) for v in value]
+    if hasattr(value, 'latitude') and hasattr(value, 'longitude'):
+        return {'latitude': value.latitude, 'longitude': value.longitude}
+    if hasattr(value, 'path') and hasattr(value, 'parent'):
+        # DocumentReference
+        return value.path
+    return value
+
+
+def _decode_object(obj):
+    if len(obj) == 1:
+        if '__timestamp__' in obj:
+            return datetime.fromisoformat(obj['__timestamp__'])
+        if '__bytes__' in obj:
+            return base64.b64decode(obj['__bytes__'])
+    return obj
+
+
+def encode_document(data):
+    """Serialize a document dict to a JSON string."""
+    return json.dumps(_encode_value(data or {}), separators=(',', ':'))
+
+
+def decode_document(payload):
+    """Deserialize a JSON string produced by encode_document()."""
+    return json.loads(payload, object_hook=_decode_object)
+
+
+def decode_tagged(docs):
+    """
+    Dicts of several SnapshotDocuments from one json.loads() call, with
+    timestamps and bytes left tagged: cheaper than to_dict() when only a
+    few fields are read. decode_value() decodes the values that are.
+    """
+    return json.loads('[' + ','.join([doc._payload for doc in docs]) + ']')
+
+
+def decode_value(value):
+    """Decode one value of a document from decode_tagged()."""
+    return _decode_object(value) if isinstance(value, dict) else value
+
+
+class SnapshotDocument:
+    """
+    Stand-in for a Firestore DocumentSnapshot read from a local snapshot.
+
+    Supports the parts the scripts use: .id, .to_dict(), .exists and
+    .reference (built from the client on demand, for deletes).
+    """
+
+    __slots__ = ('id', '_payload', '_collection', '_db')
+
+    exists = True
+
+    def __init__(self, doc_id, payload, collection, db=None):
+        self.id = doc_id
+        self._payload = payload
+        self._collection = collection
+        self._db = db
+
+    def to_dict(self):
+        return decode_document(self._payload)
+
+    @property
+    def reference(self):
+        if self._db is None:
+            raise RuntimeError(f"No Firestore client attached to snapshot of '{self._collection}'")
+        return self._db.collection(self._collection).document(self.id)
+
+
+def may_contain(docs, strings):
+    """
+    Boolean array, one per document: False where the document certainly has
+    none of `strings` as a field name or string value.
+
+    A snapshot payload is JSON, which spells a string the same way wherever
+    it appears, so a document whose payload doesn't hold the encoded string
+    can't have it, and is ruled out without being decoded. Other documents
+    are always True.
+    """
+    import numpy as np
+
+    snapshot = np.array([isinstance(doc, SnapshotDocument) for doc in docs], dtype=bool)
+    payloads = [doc._payload if is_snapshot else '' for doc, is_snapshot in zip(docs, snapshot)]
+    found = ~snapshot
+    for needle in [json.dumps(string) for string in strings]:
+        found |= np.fromiter([needle in payload for payload in payloads], dtype=bool, count=len(payloads))
+    return found
+
+
+# ===========================================
+# MANIFEST
+# ===========================================
+
+def read_manifest(path=None):
+    """Return {collection: {'file', 'fetched_at', 'doc_count'}}."""
+    manifest_path = os.path.join(snapshot_dir(path), MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def _write_manifest(manifest, path=None):
+    directory = snapshot_dir(path)
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def snapshot_fetched_at(collection, path=None):
+    """When a collection's snapshot was fetched, or None if there is none."""
+    entry = read_manifest(path).get(collection)
+    if not entry:
+        return None
+    if not os.path.exists(os.path.join(snapshot_dir(path), entry['file'])):
+        return None
+    return datetime.fromisoformat(entry['fetched_at'])
+
+
+def snapshot_fields(collection, path=None):
+    """Field paths a collection's snapshot was projected to (None = whole documents)."""
+    return read_manifest(path).get(collection, {}).get('fields')
+
+
+def snapshot_doc_count(collection, path=None):
+    """Documents in a collection's last snapshot, or None if there is none."""
+    return read_manifest(path).get(collection, {}).get('doc_count')
+
+
+def is_fresh(collection, ttl_hours=None, path=None, not_before=None, fields=None):
+    """
+    True if a snapshot exists, is younger than ttl_hours, was fetched after
+    not_before and holds at least the requested field paths.
+    """
+    if ttl_hours is None:
+        ttl_hours = default_ttl_hours()
+    fetched_at = snapshot_fetched_at(collection, path)
+    if fetched_at is None:
+        return False
+    if not_before is not None and fetched_at < not_before:
+        return False
+    if not covers_fields(snapshot_fields(collection, path), fields):
+        return False
+    age_hours = (datetime.now(timezone.utc) - fetched_at).total_seconds() / 3600
+    return age_hours <= ttl_hours
+
+
+# ===========================================
+# FIELD PROJECTIONS
+# ===========================================
+# A field list of None means whole documents; [] means ids only. Paths may
+# be dotted ('location.parsed'), and a path covers everything below it.
+
+def _path_covered(have, want):
+    return any(want == h or want.startswith(h + '.') for h in have)
+
+
+def covers_fields(have, want):
+    """True if a snapshot projected to `have` holds every path in `want`."""
+    if have is None:
+        return True
+    if want is None:
+        return False
+    return all(_path_covered(have, w) for w in want)
+
+
+def merge_fields(a, b):
+    """Smallest field list covering both a and b (None if either is None)."""
+    if a is None or b is None:
+        return None
+    merged = []
+    for path in sorted(set(a) | set(b), key=lambda p: (p.count('.'), p)):
+        if not _path_covered(merged, path):
+            merged.append(path)
+    return sorted(merged)
+
+
+def project_query(db, collection, fields=None):
+    """Return a query over a collection, projected to fields if given."""
+    query = db.collection(collection)
+    if fields is not None:
+        query = query.select(fields)
+    return query
+
+
+# ===========================================
+# READ / WRITE
+# ===========================================
+
+def _record_snapshot(collection, file_name, fetched_at, doc_count, path=None, **entry_fields):
+    with _manifest_lock:
+        manifest = read_manifest(path)
+        manifest[collection] = {
+            'file': file_name,
+            'fetched_at': (fetched_at or datetime.now(timezone.utc)).isoformat(),
+            'doc_count': doc_count,
+            **entry_fields,
+        }
+        _write_manifest(manifest, path)
+
+
+def write_row_batches(collection, batches, path=None, fetched_at=None, **entry_fields):
+    """
+    Write batches of encoded documents to <dir>/<collection>.parquet and update the manifest.
+
+    Only one batch is held at a time, so collections larger than memory can
+    be written (see synthetic.py).
+
+    Args:
+        collection: Collection name
+        batches: Iterable of (ids, payloads) pairs; payloads come from
+            encode_document() and are parallel to ids
+        fetched_at: When the documents were read (default: now)
+        **entry_fields: Extra manifest fields to record for the collection
+
+    Returns:
+        Number of documents written
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    directory = snapshot_dir(path)
+    os.makedirs(directory, exist_ok=True)
+
+    file_name = f"{collection}.parquet"
+    file_path = os.path.join(directory, file_name)
+    tmp_path = f"{file_path}.{threading.get_ident()}.tmp"
+    schema = pa.schema([('id', pa.string()), ('data', pa.string())])
+
+    doc_count = 0
+    try:
+        with pq.ParquetWriter(tmp_path, schema, compression='zstd') as writer:
+            for ids, payloads in batches:
+                writer.write_table(pa.table([ids, payloads], schema=schema), row_group_size=ROW_GROUP_SIZE)
+                doc_count += len(ids)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, file_path)
+
+    _record_snapshot(collection, file_name, fetched_at, doc_count, path, **entry_fields)
+    return doc_count
+
+
+def write_rows(collection, ids, payloads, path=None, fetched_at=None, **entry_fields):
+    """
+    Write encoded documents to <dir>/<collection>.parquet and update the manifest.
+
+    Args:
+        collection: Collection name
+        ids: Document ids
+        payloads: JSON payloads from encode_document(), parallel to ids
+        fetched_at: When the documents were read (default: now)
+        **entry_fields: Extra manifest fields to record for the collection
+
+    Returns:
+        Number of documents written
+    """
+    return write_row_batches(collection, [(ids, payloads)], path=path, fetched_at=fetched_at, **entry_fields)
+
+
+def read_rows(collection, path=None):
+    """Return (ids, payloads) lists from a collection's snapshot."""
+    import pyarrow.parquet as pq
+
+    entry = read_manifest(path)[collection]
+    table = pq.read_table(os.path.join(snapshot_dir(path), entry['file']))
+    ids, payloads = table.column('id').to_pylist(), table.column('data').to_pylist()
+    if tracing():
+        record_read(collection, len(ids), sum(map(len, payloads)))
+    return ids, payloads
+
+
+def write_snapshot(collection, docs, path=None, fetched_at=None, **entry_fields):
+    """
+    Write documents to <dir>/<collection>.parquet and update the manifest.
+
+    Args:
+        collection: Collection name
+        docs: Iterable of objects with .id and .to_dict()
+        fetched_at: When the documents were read (default: now)
+        **entry_fields: Extra manifest fields to record for the collection
+
+    Returns:
+        Number of documents written
+    """
+    ids = []
+    payloads = []
+    for doc in docs:
+        ids.append(doc.id)
+        payloads.append(encode_document(doc.to_dict()))
+    return write_rows(collection, ids, payloads, path=path, fetched_at=fetched_at, **entry_fields)
+
+
+def read_snapshot(collection, db=None, path=None):
+    """Return the snapshot of a collection as a list of SnapshotDocuments."""
+    ids, payloads = read_rows(collection, path)
+    return [SnapshotDocument(doc_id, payload, collection, db) for doc_id, payload in zip(ids, payloads)]
+
+
+def _fetch_fields(collection, fields, path=None):
+    """
+    Field list to fetch when a snapshot doesn't cover the request.
+
+    Fields kept by the previous snapshot are fetched too, so reports with
+    different projections of one collection don't keep evicting each other.
+    """
+    if fields is None or snapshot_fetched_at(collection, path) is None:
+        return fields
+    return merge_fields(snapshot_fields(collection, path), fields)
+
+
+def _ensure_snapshot(db, collection, refresh, ttl_hours, path, incremental, fields):
+    """
+    Make sure a usable snapshot exists, syncing it if incremental.
+
+    Returns the field list that still has to be fetched in full, or
+    False if the snapshot on disk can be read as is.
+    """
+    not_before = PROCESS_STARTED_AT if refresh else None
+    if is_fresh(collection, ttl_hours, path, not_before=not_before, fields=fields):
+        return False
+
+    fetch_fields = _fetch_fields(collection, fields, path)
+    if incremental is None:
+        incremental = incremental_enabled()
+    if incremental:
+        from pp_analytics.sync import WATERMARK_FIELDS, sync_collection
+        if collection in WATERMARK_FIELDS:
+            sync_collection(db, collection, path=path, fields=fetch_fields)
+            return False
+    return fetch_fields
+
+
+def _scan_to_snapshot(db, collection, fields, path=None):
+    """
+    Fetch a collection into its snapshot with a partitioned scan.
+
+    Each range is written to a part file as it streams, a row group at a
+    time, and the parts are then joined in id order.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    from pp_analytics.scans import scan_collection
+
+    directory = snapshot_dir(path)
+    os.makedirs(directory, exist_ok=True)
+    part_prefix = os.path.join(directory, f"{collection}.parquet.{threading.get_ident()}")
+    schema = pa.schema([('id', pa.string()), ('data', pa.string())])
+    parts = []
+
+    def write_part(index, docs):
+        part_path = f"{part_prefix}.{index}.part"
+        parts.append(part_path)
+        ids = []
+        payloads = []
+        with pq.ParquetWriter(part_path, schema, compression='zstd') as writer:
+            for doc in docs:
+                ids.append(doc.id)
+                payloads.append(encode_document(doc.to_dict()))
+                if len(ids) >= ROW_GROUP_SIZE:
+                    writer.write_table(pa.table([ids, payloads], schema=schema))
+                    ids, payloads = [], []
+            if ids:
+                writer.write_table(pa.table([ids, payloads], schema=schema))
+        return part_path
+
+    def batches(part_paths):
+        for part_path in part_paths:
+            for batch in pq.ParquetFile(part_path).iter_batches(batch_size=ROW_GROUP_SIZE):
+                yield batch.column(0).to_pylist(), batch.column(1).to_pylist()
+
+    fetched_at = datetime.now(timezone.utc)
+    try:
+        part_paths = scan_collection(db, collection, fields, expected_docs=snapshot_doc_count(collection, path),
+                                     consume=write_part)
+        write_row_batches(collection, batches(part_paths), path=path, fetched_at=fetched_at, fields=fields)
+    finally:
+        for part_path in parts:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+
+def iter_collection(db, collection, refresh=False, ttl_hours=None, path=None, incremental=None, fields=None,
+                    tables=None):
+    """
+    Yield the documents of a collection without holding them all in memory.
+
+    Same freshness rules as load_collection(). A fresh snapshot is read one
+    row group at a time; otherwise documents are streamed from Firestore and
+    written to a new snapshot as they go by. A scan split into several id
+    ranges (scans.py) is written to the snapshot first, each range to its
+    own part file, and then read like a fresh snapshot. Documents already
+    in `tables` are yielded from there.
+    """
+    shared = _from_tables(tables, collection, fields)
+    if shared is not None:
+        yield from shared
+        return
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    from pp_analytics.scans import partition_count, stream_range
+
+    fetch_fields = _ensure_snapshot(db, collection, refresh, ttl_hours, path, incremental, fields)
+    if fetch_fields is not False and partition_count(expected_docs=snapshot_doc_count(collection, path)) > 1:
+        _scan_to_snapshot(db, collection, fetch_fields, path)
+        fetch_fields = False
+    if fetch_fields is False:
+        entry = read_manifest(path)[collection]
+        parquet_file = pq.ParquetFile(os.path.join(snapshot_dir(path), entry['file']))
+        for batch in parquet_file.iter_batches(batch_size=ROW_GROUP_SIZE, columns=['id', 'data']):
+            ids, payloads = batch.column(0).to_pylist(), batch.column(1).to_pylist()
+            if tracing():
+                record_read(collection, len(ids), sum(map(len, payloads)))
+            for doc_id, payload in zip(ids, payloads):
+                yield SnapshotDocument(doc_id, payload, collection, db)
+        return
+
+    directory = snapshot_dir(path)
+    os.makedirs(directory, exist_ok=True)
+    file_name = f"{collection}.parquet"
+    file_path = os.path.join(directory, file_name)
+    tmp_path = f"{file_path}.{threading.get_ident()}.tmp"
+    schema = pa.schema([('id', pa.string()), ('data', pa.string())])
+
+    fetched_at = datetime.now(timezone.utc)
+    doc_count = 0
+    ids = []
+    payloads = []
+    try:
+        with pq.ParquetWriter(tmp_path, schema, compression='zstd') as writer:
+            for doc in stream_range(db, collection, fields=fetch_fields):
+                ids.append(doc.id)
+                payloads.append(encode_document(doc.to_dict()))
+                doc_count += 1
+                if len(ids) >= ROW_GROUP_SIZE:
+                    record_read(collection, len(ids), sum(map(len, payloads)))
+                    writer.write_table(pa.table([ids, payloads], schema=schema))
+                    ids, payloads = [], []
+                yield doc
+            if ids:
+                record_read(collection, len(ids), sum(map(len, payloads)))
+                writer.write_table(pa.table([ids, payloads], schema=schema))
+    except BaseException:
+        # Stopped early or failed: don't leave a partial snapshot behind
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, file_path)
+    _record_snapshot(collection, file_name, fetched_at, doc_count, path, fields=fetch_fields)
+
+
+# ===========================================
+# SHARED IN-MEMORY TABLES
+# ===========================================
+# When several reports run in one process (run_reports.py), each collection
+# is loaded once, with the union of the fields they need, and handed to
+# every report as a Tables object. The loaders below serve a collection from
+# it when it holds the requested fields, and fall back to snapshots/Firestore
+# otherwise.
+
+class Tables(dict):
+    """Loaded collections, {name: documents}, plus the fields each was projected to."""
+
+    def __init__(self, docs_by_collection=None, fields=None):
+        super().__init__(docs_by_collection or {})
+        self.fields = dict(fields or {})
+
+    def lookup(self, collection, fields=None):
+        """Documents of a collection if held with at least `fields`, else None."""
+        if collection not in self or not covers_fields(self.fields.get(collection), fields):
+            return None
+        return self[collection]
+
+
+def _from_tables(tables, collection, fields):
+    return tables.lookup(collection, fields) if tables is not None else None
+
+
+def incremental_enabled():
+    """True if PP_SNAPSHOT_INCREMENTAL is set to a truthy value."""
+    return os.environ.get('PP_SNAPSHOT_INCREMENTAL', '').lower() in ('1', 'true', 'yes')
+
+
+def load_collection(db, collection, refresh=False, ttl_hours=None, path=None, incremental=None, fields=None,
+                    tables=None):
+    """
+    Return all documents in a collection, from the local snapshot if fresh.
+
+    Args:
+        db: Firestore client (used when the snapshot is stale or missing)
+        collection: Collection name
+        refresh: If True, ignore snapshots taken before this run started and
+            re-fetch from Firestore
+        ttl_hours: Max snapshot age in hours (default: PP_SNAPSHOT_TTL_HOURS or 12)
+        incremental: If True, bring a stale snapshot up to date by fetching only
+            documents changed since its watermark (see sync.py) instead of the
+            whole collection. Default: PP_SNAPSHOT_INCREMENTAL.
+        fields: Field paths the caller reads (see fields.py). Only these are
+            fetched, with select(); [] reads ids only. None reads whole documents.
+        tables: Optional Tables already holding collections loaded this run
+
+    Returns:
+        List of documents with .id, .to_dict() and .reference
+    """
+    shared = _from_tables(tables, collection, fields)
+    if shared is not None:
+        return shared
+
+    fetch_fields = _ensure_snapshot(db, collection, refresh, ttl_hours, path, incremental, fields)
+    if fetch_fields is False:
+        return read_snapshot(collection, db=db, path=path)
+
+    from pp_analytics.scans import scan_documents
+
+    fetched_at = datetime.now(timezone.utc)
+    docs = scan_documents(db, collection, fetch_fields, expected_docs=snapshot_doc_count(collection, path))
+    payloads = [encode_document(doc.to_dict()) for doc in docs]
+    record_read(collection, len(docs), sum(map(len, payloads)))
+    write_rows(collection, [doc.id for doc in docs], payloads, path=path, fetched_at=fetched_at,
+               fields=fetch_fields)
+    return docs
+
+
+def iter_document_ids(db, collection, refresh=False, ttl_hours=None, path=None, incremental=None, tables=None,
+                      batch_size=ROW_GROUP_SIZE):
+    """
+    Yield the document ids of a collection in lists of up to batch_size.
+
+    Only ids are held: a fresh snapshot is read from its id column alone,
+    otherwise the collection is scanned with an empty projection
+    (select([])), so no field of any document is downloaded. Such a scan
+    leaves the snapshot as it was.
+    """
+    shared = _from_tables(tables, collection, [])
+    if shared is not None:
+        for start in range(0, len(shared), batch_size):
+            yield [doc.id for doc in shared[start:start + batch_size]]
+        return
+
+    if _ensure_snapshot(db, collection, refresh, ttl_hours, path, incremental, []) is False:
+        import pyarrow.parquet as pq
+
+        entry = read_manifest(path)[collection]
+        parquet_file = pq.ParquetFile(os.path.join(snapshot_dir(path), entry['file']))
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=['id']):
+            ids = batch.column(0).to_pylist()
+            record_read(collection, len(ids), sum(map(len, ids)))
+            yield ids
+        return
+
+    from pp_analytics.scans import partition_count, scan_collection, stream_range
+
+    expected_docs = snapshot_doc_count(collection, path)
+    if partition_count(expected_docs=expected_docs) > 1:
+        parts = scan_collection(db, collection, fields=[], expected_docs=expected_docs,
+                                consume=lambda index, docs: [doc.id for doc in docs])
+    else:
+        parts = [(doc.id for doc in stream_range(db, collection, fields=[]))]
+    ids = []
+    for part in parts:
+        for doc_id in part:
+            ids.append(doc_id)
+            if len(ids) >= batch_size:
+                record_read(collection, len(ids), sum(map(len, ids)))
+                yield ids
+                ids = []
+    if ids:
+        record_read(collection, len(ids), sum(map(len, ids)))
+        yield ids
+
+
+def list_document_ids(db, collection, refresh=False, ttl_hours=None, path=None, incremental=None, tables=None):
+    """Return the set of document ids in a collection (an id-only scan unless a snapshot is fresh)."""
+    ids = set()
+    for batch in iter_document_ids(db, collection, refresh=refresh, ttl_hours=ttl_hours, path=path,
+                                   incremental=incremental, tables=tables):
+        ids.update(batch)
+    return ids
+
+
+def add_snapshot_arguments(parser):
+    """Add the --refresh / --snapshot-ttl / --incremental options shared by every script."""
+    parser.add_argument('--refresh', action='store_true',
+                        help="Ignore local snapshots and re-fetch collections from Firestore")
+    parser.add_argument('--snapshot-ttl', type=float, default=None, metavar='HOURS',
+                        help=f"Max age of a local snapshot before re-fetching (default: {DEFAULT_TTL_HOURS:g})")
+    parser.add_argument('--incremental', action='store_true', default=None,
+                        help="Update stale snapshots with only the documents changed since the last fetch")
+    return parser
@@ -0,0 +1,261 @@
+# sync.py
+"""
+Incremental (delta) sync of local collection snapshots.
+
+A full fetch re-downloads every document. For collections that carry
+write timestamps, sync_collection() instead remembers the highest value
+seen for each timestamp field (the watermark) and on the next run only
+queries documents with field >= watermark, merging them into the local
+snapshot by document id. Reads then scale with daily churn rather than
+total history.
+
+Deletes can't be seen through a timestamp query, so every
+PP_SYNC_RECONCILE_HOURS (default: 168) the sync also runs an id-only scan
+of the collection, drops local documents that no longer exist and fetches
+any ids the deltas missed (e.g. documents written without a timestamp).
+
+Watermark fields per collection are listed in WATERMARK_FIELDS. A document
+is picked up if ANY of its fields moved past the watermark, so listing
+createdAt and updatedAt catches both inserts and updates.
+"""
+
+from datetime import datetime, timezone
+import os
+
+from pp_analytics.client import field_filter
+from pp_analytics.snapshot import (
+    covers_fields,
+    decode_document,
+    encode_document,
+    merge_fields,
+    project_query,
+    read_manifest,
+    read_rows,
+    snapshot_doc_count,
+    snapshot_fetched_at,
+    snapshot_fields,
+    write_rows,
+)
+from pp_analytics.scans import scan_collection
+from pp_analytics.trace import record_read
+
+# Timestamp fields written by the app on create/update, per collection
+WATERMARK_FIELDS = {
+    'listings': ['createdAt', 'updatedAt'],
+    'listings_temp': ['createdAt', 'updatedAt', 'lastFeedbackAt'],
+    'soldPrices': ['timestamp'],
+    'feedback_events': ['createdAt'],
+    'sessions': ['startTime', 'lastActivity', 'endTime'],
+    'activities': ['timestamp'],
+    'users': ['createdAt'],
+}
+
+DEFAULT_RECONCILE_HOURS = 168.0
+
+
+def reconcile_hours():
+    """Hours between id-only delete reconciliation scans (PP_SYNC_RECONCILE_HOURS)."""
+    value = os.environ.get('PP_SYNC_RECONCILE_HOURS')
+    return float(value) if value else DEFAULT_RECONCILE_HOURS
+
+
+# ===========================================
+# WATERMARKS
+# ===========================================
+# A field may hold Firestore timestamps in some documents and ISO strings in
+# others (the web app writes both), and Firestore only compares values of
+# the same type, so one watermark is kept per field per value type.
+
+def _value_kind(value):
+    if isinstance(value, datetime):
+        return 'timestamp'
+    if isinstance(value, str):
+        return 'string'
+    return None
+
+
+def update_watermarks(watermarks, data, fields):
+    """Raise watermarks ({field: {kind: value}}) to cover one document."""
+    for field in fields:
+        value = data.get(field)
+        kind = _value_kind(value)
+        if kind is None:
+            continue
+        marks = watermarks.setdefault(field, {})
+        current = marks.get(kind)
+        if current is None or value > current:
+            marks[kind] = value
+    return watermarks
+
+
+def merge_watermarks(watermarks, other):
+    """Raise watermarks to cover another set of watermarks."""
+    for field, marks in other.items():
+        merged = watermarks.setdefault(field, {})
+        for kind, value in marks.items():
+            current = merged.get(kind)
+            if current is None or value > current:
+                merged[kind] = value
+    return watermarks
+
+
+def _dump_watermarks(watermarks):
+    return {
+        field: {kind: (value.isoformat() if kind == 'timestamp' else value) for kind, value in marks.items()}
+        for field, marks in watermarks.items()
+    }
+
+
+def _load_watermarks(raw):
+    return {
+        field: {kind: (datetime.fromisoformat(value) if kind == 'timestamp' else value)
+                for kind, value in marks.items()}
+        for field, marks in (raw or {}).items()
+    }
+
+
+# ===========================================
+# SYNC
+# ===========================================
+
+def _projection(collection, fields):
+    """Projected fields plus the watermark fields the sync itself needs."""
+    return merge_fields(fields, WATERMARK_FIELDS.get(collection, []))
+
+
+def full_sync(db, collection, path=None, fields=None):
+    """Fetch a whole collection, write its snapshot and record fresh watermarks."""
+    mark_fields = WATERMARK_FIELDS.get(collection, [])
+    projection = _projection(collection, fields)
+    fetched_at = datetime.now(timezone.utc)
+
+    def read(index, docs):
+        ids = []
+        payloads = []
+        watermarks = {}
+        for doc in docs:
+            data = doc.to_dict() or {}
+            ids.append(doc.id)
+            payloads.append(encode_document(data))
+            update_watermarks(watermarks, data, mark_fields)
+        return ids, payloads, watermarks
+
+    # Id ranges are read in parallel (see scans.py) and joined in id order
+    ids = []
+    payloads = []
+    watermarks = {}
+    for part_ids, part_payloads, part_watermarks in scan_collection(
+            db, collection, projection, expected_docs=snapshot_doc_count(collection, path), consume=read):
+        ids.extend(part_ids)
+        payloads.extend(part_payloads)
+        merge_watermarks(watermarks, part_watermarks)
+    record_read(collection, len(ids), sum(map(len, payloads)))
+
+    write_rows(collection, ids, payloads, path=path, fetched_at=fetched_at, fields=projection,
+               watermarks=_dump_watermarks(watermarks),
+               reconciled_at=fetched_at.isoformat(),
+               last_sync={'mode': 'full', 'fetched': len(ids), 'deleted': 0})
+    return {'mode': 'full', 'fetched': len(ids), 'deleted': 0, 'doc_count': len(ids)}
+
+
+def fetch_changed(db, collection, watermarks, fields, since=None, projection=None):
+    """
+    Return {doc_id: data} for documents at or past any watermark.
+
+    Uses >= so writes sharing the watermark's timestamp aren't missed; the
+    merge by id makes re-reading them harmless. Fields with no timestamp
+    watermark yet (no local document had them) are queried from `since`.
+    """
+    changed = {}
+    for field in fields:
+        marks = dict(watermarks.get(field, {}))
+        if 'timestamp' not in marks and since is not None:
+            marks['timestamp'] = since
+        for value in marks.values():
+            query = project_query(db, collection, projection).where(filter=field_filter(db, field, '>=', value))
+            for doc in query.stream():
+                changed[doc.id] = doc.to_dict() or {}
+    return changed
+
+
+def list_remote_ids(db, collection, path=None):
+    """Return the set of document ids in a collection without reading any fields."""
+    parts = scan_collection(db, collection, fields=[], expected_docs=snapshot_doc_count(collection, path),
+                            consume=lambda index, docs: [doc.id for doc in docs])
+    return {doc_id for part in parts for doc_id in part}
+
+
+def sync_collection(db, collection, path=None, reconcile=None, fields=None):
+    """
+    Bring a collection's local snapshot up to date with the fewest reads.
+
+    Falls back to a full fetch when there is no snapshot yet. Watermarks for
+    a snapshot written by a plain full fetch are derived from the local data.
+
+    Args:
+        db: Firestore client
+        collection: Collection name (must be in WATERMARK_FIELDS)
+        reconcile: True/False to force/skip the id-only delete scan. Default:
+            run it when the last one is older than PP_SYNC_RECONCILE_HOURS.
+        fields: Field paths needed (None = whole documents). A snapshot that
+            doesn't hold them and the watermark fields is re-fetched in full.
+
+    Returns:
+        Dict with 'mode', 'fetched', 'deleted' and 'doc_count'
+    """
+    mark_fields = WATERMARK_FIELDS[collection]
+    if snapshot_fetched_at(collection, path) is None:
+        return full_sync(db, collection, path=path, fields=fields)
+    if not covers_fields(snapshot_fields(collection, path), _projection(collection, fields)):
+        # Missing requested or watermark fields: only a full fetch can fill them in
+        return full_sync(db, collection, path=path, fields=merge_fields(snapshot_fields(collection, path), fields))
+
+    entry = read_manifest(path)[collection]
+    projection = _projection(collection, entry.get('fields'))
+    ids, payloads = read_rows(collection, path)
+    rows = dict(zip(ids, payloads))
+
+    if 'watermarks' in entry:
+        watermarks = _load_watermarks(entry['watermarks'])
+    else:
+        watermarks = {}
+        for payload in payloads:
+            update_watermarks(watermarks, decode_document(payload), mark_fields)
+
+    fetched_at = datetime.now(timezone.utc)
+    changed = fetch_changed(db, collection, watermarks, mark_fields,
+                            since=datetime.fromisoformat(entry['fetched_at']), projection=projection)
+    for doc_id, data in changed.items():
+        rows[doc_id] = encode_document(data)
+        update_watermarks(watermarks, data, mark_fields)
+    fetched = len(changed)
+    record_read(collection, fetched, sum(len(rows[doc_id]) for doc_id in changed))
+
+    # A full fetch is as good as a reconciliation
+    reconciled_at = entry.get('reconciled_at', entry['fetched_at'])
+    if reconcile is None:
+        last = datetime.fromisoformat(reconciled_at)
+        reconcile = (fetched_at - last).total_seconds() / 3600 >= reconcile_hours()
+
+    deleted = 0
+    if reconcile:
+        remote_ids = list_remote_ids(db, collection, path)
+        for doc_id in [doc_id for doc_id in rows if doc_id not in remote_ids]:
+            del rows[doc_id]
+            deleted += 1
+
+        missing = [db.collection(collection).document(doc_id) for doc_id in remote_ids if doc_id not in rows]
+        for doc in db.get_all(missing, field_paths=projection):
+            if doc.exists:
+                data = doc.to_dict() or {}
+                rows[doc.id] = encode_document(data)
+                update_watermarks(watermarks, data, mark_fields)
+                record_read(collection, 1, len(rows[doc.id]))
+                fetched += 1
+        reconciled_at = fetched_at.isoformat()
+
+    last_sync = {'mode': 'reconcile' if reconcile else 'delta', 'fetched': fetched, 'deleted': deleted}
+    write_rows(collection, list(rows.keys()), list(rows.values()), path=path, fetched_at=fetched_at,
+               fields=projection, watermarks=_dump_watermarks(watermarks),
+               reconciled_at=reconciled_at, last_sync=last_sync)
+    return dict(last_sync, doc_count=len(rows))
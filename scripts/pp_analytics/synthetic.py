@@ -0,0 +1,362 @@
+# synthetic.py
+"""
+Seeded synthetic data for offline runs and benchmarks.
+
+Generates realistic documents for every collection the reports read
+(users, user_stats, sessions, activities, listings, listings_temp,
+feedback_events, soldPrices) and writes them as local snapshots
+(snapshot.py), so the reports can run against 10x or 100x today's data
+without touching Firestore.
+
+`size` is the number of listings / soldPrices documents; the other
+collections scale with it (see RATIOS). The same (size, seed, now) always
+produces the same documents. The data is shaped to exercise every code
+path: skewed categories and metros, missing and invalid fields, temp
+listings whose names only match a listing after normalization, feedback
+pointing at missing listings, rapid-fire duplicate sessions, and
+timestamps spread over a year but weighted to the last few weeks.
+
+Run: python -m pp_analytics.synthetic 100000 --path /tmp/pp-100k
+"""
+
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+import math
+import random
+
+from pp_analytics.snapshot import ROW_GROUP_SIZE, encode_document, read_manifest, write_row_batches
+
+# Documents per collection, per unit of size
+RATIOS = {
+    'users': 0.1,
+    'user_stats': 0.1,
+    'sessions': 1.0,
+    'activities': 3.0,
+    'listings': 1.0,
+    'listings_temp': 1.0,
+    'feedback_events': 1.5,
+    'soldPrices': 1.0,
+}
+
+CATEGORIES = [
+    'electronics', 'furniture', 'clothing', 'toys', 'tools', 'books', 'jewelry', 'sporting goods',
+    'home decor', 'kitchen', 'collectibles', 'musical instruments', 'outdoor', 'automotive', 'baby',
+    'art', 'cameras', 'video games', 'shoes', 'bags', 'watches', 'garden', 'pet supplies', 'office',
+    'vintage',
+]
+CONDITIONS = ['new', 'like new', 'excellent', 'good', 'fair', 'poor']
+METROS = [
+    ('Austin', 'TX'), ('Dallas', 'TX'), ('Houston', 'TX'), ('Denver', 'CO'), ('Phoenix', 'AZ'),
+    ('Seattle', 'WA'), ('Portland', 'OR'), ('Chicago', 'IL'), ('Atlanta', 'GA'), ('Miami', 'FL'),
+    ('Boston', 'MA'), ('New York', 'NY'), ('Los Angeles', 'CA'), ('San Diego', 'CA'),
+    ('Minneapolis', 'MN'), ('Nashville', 'TN'), ('Charlotte', 'NC'), ('Salt Lake City', 'UT'),
+    ('Kansas City', 'MO'), ('Columbus', 'OH'),
+]
+BRANDS = ['Apple', 'Samsung', 'IKEA', 'Sony', 'Nike', 'LEGO', 'DeWalt', 'KitchenAid', 'Fender',
+          'Canon', 'Herman Miller', 'Patagonia', 'Coach', 'Nintendo', 'Dyson', 'Weber']
+PRODUCTS = ['desk', 'chair', 'lamp', 'phone', 'tablet', 'camera', 'guitar', 'jacket', 'drill',
+            'mixer', 'console', 'speaker', 'backpack', 'sneakers', 'vacuum', 'grill', 'watch', 'set']
+ACTIVITY_TYPES = [('session_start', 30), ('page_view', 35), ('image_upload', 12), ('analysis', 13),
+                  ('feedback', 10)]
+PAGES = ['/', '/analyze', '/results', '/listings', '/feedback', '/account']
+STAGES = [('pre_listing', 30), ('active_listing', 30), ('sold', 25), ('abandoned', 15)]
+DEVICES = [('mobile', 60), ('desktop', 35), ('tablet', 5)]
+BROWSERS = [('chrome', 55), ('safari', 35), ('firefox', 6), ('edge', 4)]
+
+
+def collection_sizes(size):
+    """Return {collection: document count} for a dataset of the given size."""
+    return {name: max(1, int(size * ratio)) for name, ratio in RATIOS.items()}
+
+
+def doc_id(collection, index):
+    """Id of the index-th synthetic document of a collection (stable across runs)."""
+    return f"{collection}_{index:09d}"
+
+
+def _weighted(rng, choices):
+    values = [value for value, _ in choices]
+    cum_weights = list(accumulate(weight for _, weight in choices))
+    return lambda: rng.choices(values, cum_weights=cum_weights)[0]
+
+
+def _zipf(rng, values, s=1.1):
+    """Pick from values with Zipf-like weights, so some are common and many are sparse."""
+    return _weighted(rng, [(v, 1 / (rank + 1) ** s) for rank, v in enumerate(values)])
+
+
+def _ago(rng, now, mean_days=45, max_days=365):
+    """A timestamp before now, exponentially weighted towards recent days."""
+    return now - timedelta(days=min(rng.expovariate(1 / mean_days), max_days))
+
+
+def _catalog(rng, count):
+    """[(item name, typical price)] shared by listings, temp listings, feedback and sold prices."""
+    return [(f"{rng.choice(BRANDS)} {rng.choice(PRODUCTS)} {rng.randrange(1, 500)}", _price(rng))
+            for _ in range(count)]
+
+
+def _price(rng, median=60, spread=1.0):
+    return round(math.exp(rng.gauss(math.log(median), spread)), 2)
+
+
+def _users(rng, n, sizes, now):
+    for i in range(n):
+        yield doc_id('users', i), {
+            'createdAt': _ago(rng, now, mean_days=120),
+            'email': f"user{i}@example.com",
+        }
+
+
+def _user_stats(rng, n, sizes, now):
+    for i in range(n):
+        analyses = int(rng.expovariate(1 / 6))
+        yield doc_id('users', i), {
+            'totalAnalyses': analyses,
+            'totalImages': analyses + int(rng.expovariate(1 / 3)),
+            'lastActive': _ago(rng, now, mean_days=20),
+        }
+
+
+def _sessions(rng, n, sizes, now):
+    device = _weighted(rng, DEVICES)
+    browser = _weighted(rng, BROWSERS)
+    users = sizes['users']
+    previous = None
+    for i in range(n):
+        if previous is not None and rng.random() < 0.05:
+            # Rapid-fire duplicate: same user a few seconds after their last session
+            user_id = previous['userId']
+            start = previous['startTime'] + timedelta(seconds=rng.uniform(1, 30))
+            duration = rng.randint(0, 3000)
+        else:
+            user_id = doc_id('users', rng.randrange(users)) if rng.random() < 0.8 else None
+            start = _ago(rng, now, mean_days=30)
+            duration = int(math.exp(rng.gauss(math.log(180_000), 1.2)))
+        data = {
+            'userId': user_id,
+            'isGuest': user_id is None,
+            'startTime': start,
+            'lastActivity': start + timedelta(milliseconds=duration),
+            'duration': duration,
+            'deviceInfo': {'type': device(), 'browser': browser()},
+        }
+        previous = data
+        yield doc_id('sessions', i), data
+
+
+def _activities(rng, n, sizes, now):
+    activity_type = _weighted(rng, ACTIVITY_TYPES)
+    users = sizes['users']
+    for i in range(n):
+        yield doc_id('activities', i), {
+            'userId': doc_id('users', rng.randrange(users)) if rng.random() < 0.85 else None,
+            'activityType': activity_type(),
+            'timestamp': _ago(rng, now, mean_days=30),
+            'page': rng.choice(PAGES),
+            'metadata': {'sessionId': doc_id('sessions', rng.randrange(sizes['sessions']))},
+        }
+
+
+def _listings(rng, n, sizes, now, catalog):
+    category = _zipf(rng, CATEGORIES)
+    for i in range(n):
+        name, typical = catalog[i % len(catalog)]
+        optimal = _price(rng, typical, spread=0.2)
+        data = {
+            'itemIdentification': {
+                'name': name,
+                'category': category() if rng.random() < 0.95 else None,
+                'observedCondition': rng.choice(CONDITIONS) if rng.random() < 0.9 else None,
+            },
+            'itemName': name,
+            'pricingStrategy': {
+                'listingPrice': round(optimal * rng.uniform(0.95, 1.1), 2) if rng.random() < 0.8 else None,
+                'optimal': optimal,
+                'min': round(optimal * 0.7, 2),
+                'max': round(optimal * 1.4, 2),
+            },
+            'images': [f"https://storage.example.com/listings/{i}/{k}.jpg" for k in range(rng.randint(1, 4))],
+            'createdAt': _ago(rng, now, mean_days=60),
+        }
+        if rng.random() < 0.3:
+            data['id'] = f"lst-{i}"
+        yield doc_id('listings', i), data
+
+
+def _listings_temp(rng, n, sizes, now, catalog):
+    stage = _weighted(rng, STAGES)
+    for i in range(n):
+        roll = rng.random()
+        name, typical = rng.choice(catalog)
+        if roll < 0.2:
+            name = f"  {name.upper()} "   # matches after normalization
+        elif roll < 0.4:
+            name = f"{name} with box"     # only a fuzzy match
+        created = _ago(rng, now, mean_days=20)
+        updated = created + timedelta(days=rng.uniform(0, 5))
+        sold = rng.random() < 0.4
+        data = {
+            'itemName': name,
+            'sessionId': doc_id('sessions', rng.randrange(sizes['sessions'])),
+            'wasSold': sold,
+            'actualPrice': _price(rng, typical, spread=0.3) if sold else None,
+            'daysToSell': rng.randint(0, 45) if sold and rng.random() < 0.8 else None,
+            'stage': 'sold' if sold else stage(),
+            'createdAt': created,
+            'updatedAt': min(updated, now),
+        }
+        if rng.random() < 0.3:
+            data['lastFeedbackAt'] = min(updated + timedelta(days=rng.uniform(0, 3)), now)
+        yield doc_id('listings_temp', i), data
+
+
+def _feedback_events(rng, n, sizes, now, catalog):
+    listings = sizes['listings']
+    for i in range(n):
+        roll = rng.random()
+        index = rng.randrange(listings)
+        if roll < 0.85:
+            listing_id = doc_id('listings', index)
+        elif roll < 0.9:
+            listing_id = f"lst-{index}"
+        else:
+            listing_id = f"deleted_{index:09d}"  # orphaned
+        stage = rng.choices(['sold', 'SOLD', 'active', 'pre_listing'], [30, 5, 40, 25])[0]
+        actual = _price(rng, catalog[index % len(catalog)][1], spread=0.3)
+        yield doc_id('feedback_events', i), {
+            'listingId': listing_id,
+            'purpose': rng.choice(['price_accuracy', 'outcome', 'rating']),
+            'stage': stage,
+            'value': {'actualPrice': actual} if rng.random() < 0.6 else rng.randint(1, 5),
+            'metadata': {'soldPrice': actual} if rng.random() < 0.5 else {},
+            'createdAt': _ago(rng, now, mean_days=40),
+        }
+
+
+def _sold_prices(rng, n, sizes, now, catalog):
+    category = _zipf(rng, CATEGORIES)
+    metro = _zipf(rng, METROS, s=0.9)
+    for i in range(n):
+        name, typical = rng.choice(catalog)
+        price_roll = rng.random()
+        if price_roll < 0.03:
+            price = None
+        elif price_roll < 0.04:
+            price = rng.choice([0, -5, 75_000])  # invalid
+        else:
+            price = _price(rng, typical, spread=0.3)
+        days_roll = rng.random()
+        if days_roll < 0.1:
+            days_to_sell = None
+        elif days_roll < 0.12:
+            days_to_sell = rng.choice([-1, 500])  # invalid
+        else:
+            days_to_sell = rng.randint(0, 60)
+        city, state = metro()
+        yield doc_id('soldPrices', i), {
+            'itemName': name if rng.random() < 0.95 else None,
+            'category': category() if rng.random() < 0.92 else None,
+            'condition': rng.choice(CONDITIONS) if rng.random() < 0.9 else None,
+            'actualSoldPrice': price,
+            'daysToSell': days_to_sell,
+            'timestamp': _ago(rng, now, mean_days=90) if rng.random() < 0.97 else None,
+            'location': {'parsed': {
+                'city': city if rng.random() < 0.8 else None,
+                'state': state if rng.random() < 0.9 else None,
+                'metro': city if rng.random() < 0.75 else None,
+            }},
+        }
+
+
+_GENERATORS = {
+    'users': _users,
+    'user_stats': _user_stats,
+    'sessions': _sessions,
+    'activities': _activities,
+    'listings': _listings,
+    'listings_temp': _listings_temp,
+    'feedback_events': _feedback_events,
+    'soldPrices': _sold_prices,
+}
+_CATALOGED = {'listings', 'listings_temp', 'feedback_events', 'soldPrices'}
+
+
+def generate_documents(collection, size, seed=0, now=None):
+    """
+    Yield (doc_id, data) for one collection of a synthetic dataset.
+
+    Args:
+        collection: Collection name (a key of RATIOS)
+        size: Dataset size (listings / soldPrices documents)
+        seed: Random seed; each collection draws from its own stream
+        now: Reference time the timestamps are spread back from (default: now, UTC)
+    """
+    now = now or datetime.now(timezone.utc)
+    sizes = collection_sizes(size)
+    rng = random.Random(f"{seed}:{collection}")
+    args = (rng, sizes[collection], sizes, now)
+    if collection in _CATALOGED:
+        # One shared catalog (same seed for every collection) so names and prices line up
+        args += (_catalog(random.Random(f"{seed}:catalog"), max(50, sizes['listings'] // 4)),)
+    yield from _GENERATORS[collection](*args)
+
+
+def _batches(documents, batch_size=ROW_GROUP_SIZE):
+    ids, payloads = [], []
+    for doc_id_, data in documents:
+        ids.append(doc_id_)
+        payloads.append(encode_document(data))
+        if len(ids) >= batch_size:
+            yield ids, payloads
+            ids, payloads = [], []
+    if ids:
+        yield ids, payloads
+
+
+def dataset_info(path=None):
+    """Return {'size', 'seed'} of the synthetic dataset at path, or None."""
+    entries = read_manifest(path).values()
+    infos = [entry.get('synthetic') for entry in entries]
+    if not infos or any(info != infos[0] for info in infos) or infos[0] is None:
+        return None
+    return infos[0]
+
+
+def write_dataset(size, path=None, seed=0, collections=None, now=None, verbose=True):
+    """
+    Write a synthetic dataset as local snapshots (whole documents, fetched now).
+
+    Args:
+        size: Dataset size (listings / soldPrices documents)
+        path: Snapshot directory (default: PP_SNAPSHOT_DIR); use a scratch
+            directory, not the one holding real snapshots
+        seed: Random seed
+        collections: Collections to write (default: all of RATIOS)
+
+    Returns:
+        {collection: documents written}
+    """
+    now = now or datetime.now(timezone.utc)
+    written = {}
+    for collection in collections or RATIOS:
+        written[collection] = write_row_batches(
+            collection, _batches(generate_documents(collection, size, seed=seed, now=now)),
+            path=path, fetched_at=now, fields=None, synthetic={'size': size, 'seed': seed},
+        )
+        if verbose:
+            print(f"  {collection}: {written[collection]:,} docs")
+    return written
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write a synthetic dataset as local snapshots.")
+    parser.add_argument('size', type=int, help="Number of listings / soldPrices documents")
+    parser.add_argument('--path', required=True, help="Snapshot directory to write (PP_SNAPSHOT_DIR for the reports)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"Writing synthetic dataset (size {args.size:,}, seed {args.seed}) to {args.path}")
+    write_dataset(args.size, path=args.path, seed=args.seed)
@@ -0,0 +1,467 @@
+# trace.py
+"""
+Per-section instrumentation for the reports.
+
+Each report is one long function split into sections by its printed
+=====-framed headings. With tracing on, every section, every collection
+fetch and every count/aggregation query becomes a span recording:
+
+- wall time and CPU time (process CPU for report sections, which includes
+  fetch threads; thread CPU for fetches)
+- peak memory delta: how much the process's peak RSS grew during the span
+- documents read and approximate bytes deserialized (encoded JSON size),
+  from snapshots or from Firestore
+
+The spans are written as a JSON trace and/or a Chrome trace (open in
+chrome://tracing or https://ui.perfetto.dev) after the report finishes,
+and one named section can be run under cProfile or a sampling profiler.
+
+Reports opt in with the @traced_report decorator and a section() call next
+to each heading; both are no-ops unless tracing is configured, by the
+--trace / --chrome-trace / --profile-section options (add_trace_arguments)
+or by:
+- PP_TRACE: write the JSON trace to this path
+- PP_TRACE_CHROME: write a Chrome trace to this path
+- PP_PROFILE_SECTION: profile the first section whose heading contains this
+  text (case-insensitive)
+- PP_PROFILER: 'cprofile' (default) or 'sample'
+"""
+
+from datetime import datetime, timezone
+import functools
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROFILERS = ('cprofile', 'sample')
+SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+
+# Span kinds whose counters also collect reads made by other threads
+# (sections wait on the fetch threads they start)
+_INCLUSIVE_KINDS = ('report', 'section')
+
+_settings = {}
+_tracer = None
+
+
+def configure(trace=None, chrome_trace=None, profile_section=None, profiler=None):
+    """Set trace options for this process (overrides the PP_TRACE* environment variables)."""
+    for key, value in (('trace', trace), ('chrome_trace', chrome_trace),
+                       ('profile_section', profile_section), ('profiler', profiler)):
+        if value is not None:
+            _settings[key] = value
+
+
+def trace_settings():
+    """Return the effective {'trace', 'chrome_trace', 'profile_section', 'profiler'} options."""
+    settings = {
+        'trace': os.environ.get('PP_TRACE') or None,
+        'chrome_trace': os.environ.get('PP_TRACE_CHROME') or None,
+        'profile_section': os.environ.get('PP_PROFILE_SECTION') or None,
+        'profiler': os.environ.get('PP_PROFILER') or 'cprofile',
+    }
+    settings.update(_settings)
+    if settings['profiler'] not in PROFILERS:
+        raise ValueError(f"Profiler must be one of {', '.join(PROFILERS)}, not {settings['profiler']!r}")
+    return settings
+
+
+def _enabled(settings):
+    return bool(settings['trace'] or settings['chrome_trace'] or settings['profile_section'])
+
+
+def _peak_rss_bytes():
+    if resource is None:
+        return 0
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+# ===========================================
+# SPANS
+# ===========================================
+
+class Span:
+    """One timed region: a report, a section, a fetch or a query."""
+
+    def __init__(self, tracer, name, kind, parent=None):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.parent = parent
+        self.thread = threading.current_thread().name
+        self.thread_id = threading.get_ident()
+        self.docs = 0
+        self.bytes = 0
+        self.collections = {}
+        self._cpu_clock = time.process_time if kind in _INCLUSIVE_KINDS else time.thread_time
+        self.start = time.perf_counter()
+        self._cpu_start = self._cpu_clock()
+        self._rss_start = _peak_rss_bytes()
+        self.end = None
+        self.cpu = None
+        self.peak_rss_delta = None
+
+    def close(self):
+        self.end = time.perf_counter()
+        self.cpu = self._cpu_clock() - self._cpu_start
+        self.peak_rss_delta = _peak_rss_bytes() - self._rss_start
+
+    def depth(self):
+        return 0 if self.parent is None else self.parent.depth() + 1
+
+    def add_read(self, collection, docs, nbytes):
+        self.docs += docs
+        self.bytes += nbytes
+        self.collections[collection] = self.collections.get(collection, 0) + docs
+
+    def to_dict(self, origin):
+        return {
+            'name': self.name,
+            'kind': self.kind,
+            'parent': self.parent.name if self.parent else None,
+            'thread': self.thread,
+            'start_s': round(self.start - origin, 6),
+            'wall_s': round(self.end - self.start, 6),
+            'cpu_s': round(self.cpu, 6),
+            'peak_rss_delta_mb': round(self.peak_rss_delta / 2 ** 20, 3),
+            'docs_read': self.docs,
+            'bytes_read': self.bytes,
+            'reads_by_collection': self.collections,
+        }
+
+
+class Tracer:
+    """Collects the spans of one traced run."""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.started_at = datetime.now(timezone.utc)
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.profiles = []
+        self._open = []
+        self._reports = []  # stack of [report span, current section span]
+        self._profiler = None
+        self._lock = threading.Lock()
+
+    def open(self, name, kind, parent=None):
+        span = Span(self, name, kind, parent)
+        with self._lock:
+            self._open.append(span)
+        return span
+
+    def close(self, span):
+        span.close()
+        with self._lock:
+            self._open.remove(span)
+            self.spans.append(span)
+
+    def record_read(self, collection, docs, nbytes):
+        thread_id = threading.get_ident()
+        with self._lock:
+            for span in self._open:
+                if span.thread_id == thread_id or span.kind in _INCLUSIVE_KINDS:
+                    span.add_read(collection, docs, nbytes)
+
+    # Reports and their sections
+
+    def begin_report(self, name):
+        parent = (self._reports[-1][1] or self._reports[-1][0]) if self._reports else None
+        report = self.open(name, 'report', parent)
+        self._reports.append([report, None])
+        self.begin_section('load')
+
+    def begin_section(self, name):
+        report, current = self._reports[-1]
+        if current is not None:
+            self._end_section(current)
+        section = self.open(name, 'section', report)
+        self._reports[-1][1] = section
+        target = self.settings['profile_section']
+        if target and self._profiler is None and target.lower() in name.lower():
+            self._profiler = _start_profiler(self.settings['profiler'], section)
+
+    def _end_section(self, section):
+        profiler = self._profiler
+        if profiler is not None and profiler.section is section:
+            self._profiler = None
+            self.profiles.append(profiler.stop())
+        self.close(section)
+
+    def end_report(self):
+        report, current = self._reports.pop()
+        if current is not None:
+            self._end_section(current)
+        self.close(report)
+
+    # Output
+
+    def to_dict(self):
+        spans = sorted(self.spans, key=lambda span: span.start)
+        return {
+            'started_at': self.started_at.isoformat(),
+            'python': sys.version.split()[0],
+            'argv': sys.argv,
+            'spans': [span.to_dict(self.origin) for span in spans],
+        }
+
+    def to_chrome_trace(self):
+        """Chrome trace-event format: one complete ('X') event per span."""
+        pid = os.getpid()
+        events = []
+        threads = {span.thread_id: span.thread for span in self.spans}
+        for thread_id, thread_name in threads.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread_id,
+                           'args': {'name': thread_name}})
+        for span in sorted(self.spans, key=lambda span: span.start):
+            data = span.to_dict(self.origin)
+            events.append({
+                'name': span.name,
+                'cat': span.kind,
+                'ph': 'X',
+                'ts': round(data['start_s'] * 1e6, 1),
+                'dur': round(data['wall_s'] * 1e6, 1),
+                'pid': pid,
+                'tid': span.thread_id,
+                'args': {key: data[key] for key in ('cpu_s', 'peak_rss_delta_mb', 'docs_read', 'bytes_read',
+                                                    'reads_by_collection')},
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write(self):
+        settings = self.settings
+        written = []
+        if settings['trace']:
+            _write_json(settings['trace'], self.to_dict())
+            written.append(settings['trace'])
+        if settings['chrome_trace']:
+            _write_json(settings['chrome_trace'], self.to_chrome_trace())
+            written.append(settings['chrome_trace'])
+        return written
+
+    def print_summary(self):
+        sections = [span for span in sorted(self.spans, key=lambda span: span.start)
+                    if span.kind in ('report', 'section', 'fetch')]
+        print(f"\n{'='*60}")
+        print("TRACE")
+        print(f"{'='*60}")
+        print(f"{'span':<46} {'wall s':>8} {'cpu s':>8} {'+peak MB':>9} {'docs':>10} {'MB read':>8}")
+        for span in sections:
+            indent = '  ' * span.depth()
+            print(f"{(indent + span.name)[:46]:<46} {span.end - span.start:>8.3f} {span.cpu:>8.3f} "
+                  f"{span.peak_rss_delta / 2 ** 20:>9.1f} {span.docs:>10,} {span.bytes / 2 ** 20:>8.1f}")
+        for profile in self.profiles:
+            print(f"\nProfile of section '{profile['section']}' ({profile['profiler']}): {profile['path']}")
+            print(profile['summary'])
+
+
+def _write_json(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=1, default=str)
+
+
+# ===========================================
+# PROFILERS
+# ===========================================
+
+def _profile_path(section, suffix):
+    """<trace file minus extension>.<section slug>.<suffix> (./pp-profile.* without a trace file)."""
+    settings = section.tracer.settings
+    base = settings['trace'] or settings['chrome_trace']
+    base = os.path.splitext(base)[0] if base else 'pp-profile'
+    slug = '-'.join(re.findall(r'[a-z0-9]+', section.name.lower()))
+    path = f"{base}.{slug[:40]}.{suffix}"
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return path
+
+
+class _CProfiler:
+    """cProfile of the thread running the section."""
+
+    def __init__(self, section):
+        import cProfile
+        self.section = section
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def stop(self):
+        import io
+        import pstats
+
+        self.profile.disable()
+        path = _profile_path(self.section, 'prof')
+        self.profile.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).sort_stats('cumulative').print_stats(20)
+        return {'section': self.section.name, 'profiler': 'cprofile', 'path': path, 'summary': out.getvalue()}
+
+
+class _SamplingProfiler:
+    """
+    Samples the section thread's stack every SAMPLE_INTERVAL seconds.
+
+    Cheaper than cProfile on hot loops and doesn't distort them; writes
+    collapsed stacks (one 'frame;frame;frame count' line per stack, the
+    input format of flamegraph.pl and speedscope).
+    """
+
+    def __init__(self, section):
+        self.section = section
+        self.thread_id = threading.get_ident()
+        self.stacks = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='trace-sampler', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                key = ';'.join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.samples += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        path = _profile_path(self.section, 'folded')
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1]):
+                f.write(f"{stack} {count}\n")
+
+        # Self time per innermost frame (function and line)
+        leaves = {}
+        for stack, count in self.stacks.items():
+            leaf = stack.rsplit(';', 1)[-1]
+            leaves[leaf] = leaves.get(leaf, 0) + count
+        lines = [f"{self.samples} samples every {SAMPLE_INTERVAL * 1000:g} ms; hottest lines:"]
+        for leaf, count in sorted(leaves.items(), key=lambda item: -item[1])[:15]:
+            lines.append(f"  {count / max(self.samples, 1) * 100:5.1f}%  {leaf}")
+        return {'section': self.section.name, 'profiler': 'sample', 'path': path, 'summary': '\n'.join(lines)}
+
+
+def _start_profiler(kind, section):
+    return _SamplingProfiler(section) if kind == 'sample' else _CProfiler(section)
+
+
+# ===========================================
+# API USED BY THE REPORTS AND LOADERS
+# ===========================================
+
+def traced_report(name):
+    """
+    Decorator for a report function: traces it if tracing is configured.
+
+    When one traced report calls another (run_reports.py), the inner report
+    becomes a span inside the outer report's trace.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            global _tracer
+            owner = _tracer is None
+            if owner:
+                settings = trace_settings()
+                if not _enabled(settings):
+                    return func(*args, **kwargs)
+                _tracer = Tracer(settings)
+            tracer = _tracer
+            tracer.begin_report(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                tracer.end_report()
+                if owner:
+                    _tracer = None
+                    tracer.print_summary()
+                    for path in tracer.write():
+                        print(f"Trace written to {path}")
+        return wrapper
+    return decorate
+
+
+def section(name):
+    """Start a new section of the running report (ending the previous one)."""
+    if _tracer is not None and _tracer._reports:
+        _tracer.begin_section(name)
+
+
+class span:
+    """Context manager timing a fetch or query inside the current section."""
+
+    def __init__(self, name, kind='fetch'):
+        self.name = name
+        self.kind = kind
+        self._span = None
+
+    def __enter__(self):
+        tracer = _tracer
+        if tracer is not None:
+            parent = tracer._reports[-1][1] if tracer._reports else None
+            self._span = tracer.open(self.name, self.kind, parent)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._span is not None:
+            self._span.tracer.close(self._span)
+        return False
+
+
+def tracing():
+    """True while a traced report is running."""
+    return _tracer is not None
+
+
+def record_read(collection, docs, nbytes=0):
+    """Count documents (and their approximate encoded size) read by the current spans."""
+    if _tracer is not None and docs:
+        _tracer.record_read(collection, docs, nbytes)
+
+
+def estimate_bytes(docs, sample_size=100):
+    """Approximate encoded size of a list of documents, from a sample of them."""
+    if not docs:
+        return 0
+    from pp_analytics.snapshot import encode_document
+
+    step = max(1, len(docs) // sample_size)
+    sample = docs[::step][:sample_size]
+    sampled = sum(len(encode_document(doc.to_dict())) for doc in sample)
+    return sampled * len(docs) // len(sample)
+
+
+def add_trace_arguments(parser):
+    """Add the --trace / --chrome-trace / --profile-section / --profiler options."""
+    parser.add_argument('--trace', default=None, metavar='FILE',
+                        help="Write a JSON trace of per-section time, CPU, memory and reads (PP_TRACE)")
+    parser.add_argument('--chrome-trace', default=None, metavar='FILE',
+                        help="Write the trace in Chrome trace-event format (PP_TRACE_CHROME)")
+    parser.add_argument('--profile-section', default=None, metavar='NAME',
+                        help="Profile the section whose heading contains NAME (PP_PROFILE_SECTION)")
+    parser.add_argument('--profiler', choices=PROFILERS, default=None,
+                        help="Profiler for --profile-section (default: cprofile)")
+    return parser
+
+
+def configure_from_args(args):
+    """Apply the options added by add_trace_arguments()."""
+    configure(trace=args.trace, chrome_trace=args.chrome_trace,
+              profile_section=args.profile_section, profiler=args.profiler)
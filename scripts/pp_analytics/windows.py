@@ -0,0 +1,109 @@
+# windows.py
+"""
+Time-windowed collection loads.
+
+Some tasks only look at a slice of a collection: temp listings older than
+7 days, sessions from the last 30 days. load_window() pushes that slice
+into the query (where('createdAt', '<', cutoff)) so only matching
+documents are read from Firestore.
+
+A window is a list of clauses; a document is in the window if it matches
+every filter of ANY clause (each clause is one query, results are merged
+by id):
+
+    [[('createdAt', '<', cutoff)],
+     [('stage', 'in', ['pre_listing', 'active_listing']), ('updatedAt', '<', cutoff)]]
+
+A fresh local snapshot (or one an --incremental sync can bring up to date)
+is filtered locally instead. Windowed results are never written back as the
+collection's snapshot, since they hold only part of it.
+
+Clauses mixing an equality/in filter with a range filter need a composite
+index; those are declared in firestore.indexes.json at the project root.
+"""
+
+from datetime import timezone
+
+from pp_analytics.aggregations import matches_filters
+from pp_analytics.client import field_filter
+from pp_analytics.snapshot import (
+    PROCESS_STARTED_AT,
+    incremental_enabled,
+    is_fresh,
+    load_collection,
+    merge_fields,
+    project_query,
+    read_snapshot,
+    snapshot_fetched_at,
+)
+from pp_analytics.sync import WATERMARK_FIELDS
+from pp_analytics.trace import estimate_bytes, record_read, tracing
+
+
+def utc_cutoff(local_dt):
+    """Aware UTC datetime for a naive local one (what the reports compute with datetime.now())."""
+    if local_dt.tzinfo is None:
+        local_dt = local_dt.astimezone()
+    return local_dt.astimezone(timezone.utc)
+
+
+def window_fields(fields, clauses):
+    """Field list covering the requested fields plus those the window filters on."""
+    return merge_fields(fields, sorted({field for clause in clauses for field, _, _ in clause}))
+
+
+def in_window(data, clauses):
+    """True if a document matches every filter of any clause."""
+    return any(matches_filters(data, clause) for clause in clauses)
+
+
+def window_query(db, collection, clause, fields=None):
+    """Return a query for one clause, projected to fields if given."""
+    query = project_query(db, collection, fields)
+    for field, op, value in clause:
+        query = query.where(filter=field_filter(db, field, op, value))
+    return query
+
+
+def load_window(db, collection, clauses, refresh=False, ttl_hours=None, path=None, incremental=None,
+                fields=None, tables=None):
+    """
+    Return the documents of a collection that fall in a window.
+
+    Args:
+        db: Firestore client
+        collection: Collection name
+        clauses: List of filter lists, see the module docstring. Datetime
+            values should be timezone-aware (see utc_cutoff).
+        refresh, ttl_hours, incremental: Snapshot options (see snapshot.load_collection)
+        fields: Field paths the caller reads; the filter fields are added
+        tables: Optional Tables; a collection held there is filtered in memory
+
+    Returns:
+        List of documents with .id, .to_dict() and .reference
+    """
+    needed = window_fields(fields, clauses)
+    not_before = PROCESS_STARTED_AT if refresh else None
+    if incremental is None:
+        incremental = incremental_enabled()
+
+    shared = tables.lookup(collection, needed) if tables is not None else None
+    if shared is not None:
+        docs = shared
+    elif is_fresh(collection, ttl_hours, path, not_before=not_before, fields=needed):
+        docs = read_snapshot(collection, db=db, path=path)
+    elif incremental and collection in WATERMARK_FIELDS and snapshot_fetched_at(collection, path) is not None:
+        # A delta sync reads fewer documents than the window queries would
+        docs = load_collection(db, collection, refresh=refresh, ttl_hours=ttl_hours, path=path,
+                               incremental=True, fields=needed)
+    else:
+        merged = {}
+        for clause in clauses:
+            for doc in window_query(db, collection, clause, needed).stream():
+                merged.setdefault(doc.id, doc)
+        docs = list(merged.values())
+        if tracing():
+            record_read(collection, len(docs), estimate_bytes(docs))
+        return docs
+
+    return [doc for doc in docs if in_window(doc.to_dict() or {}, clauses)]
@@ -0,0 +1,324 @@
+# writes.py
+"""
+Bulk Firestore writes.
+
+A Firestore batch holds at most 500 writes. execute_writes() takes any
+number of operations, splits them into batches, commits the batches from a
+thread pool, and retries a batch with exponential backoff (plus jitter)
+when Firestore reports contention or quota errors. A 200k-document cleanup
+is one call instead of 400 reruns.
+
+Progress is checkpointed: each committed batch's operations are appended
+to a file under the snapshot directory, keyed by kind, document path and a
+hash of the data written. If a run is interrupted, the next run with the
+same checkpoint name skips exactly those operations, and nothing else
+written to the same documents. At most two batches per worker are in
+flight, so on Ctrl-C the run stops after those and checkpoints the ones
+that committed. A checkpoint only applies to the set of
+operations it was started for and for CHECKPOINT_TTL_HOURS: a run with a
+different set, or a later one, starts a new checkpoint. It is removed once
+every operation has committed.
+
+Operations are tuples:
+- ('delete', ref)
+- ('update', ref, data)
+- ('set', ref, data)
+
+A list of operations is a group: it is committed in one batch, so either
+all of its writes are made or none are.
+
+Settings:
+- PP_WRITE_CONCURRENCY: batches committed at once (default: 8)
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+import hashlib
+from itertools import islice
+import json
+import os
+import random
+import time
+
+from pp_analytics.client import retryable_errors
+from pp_analytics.snapshot import snapshot_dir
+
+MAX_BATCH_SIZE = 500
+DEFAULT_WRITE_CONCURRENCY = 8
+DEFAULT_MAX_RETRIES = 6
+CHECKPOINT_DIR = 'checkpoints'
+CHECKPOINT_TTL_HOURS = 24
+PROGRESS_EVERY = 10  # batches between progress lines
+
+
+def write_concurrency(value=None):
+    """Return the number of batches committed at once, honouring PP_WRITE_CONCURRENCY."""
+    if value is not None:
+        return value
+    env_value = os.environ.get('PP_WRITE_CONCURRENCY')
+    return int(env_value) if env_value else DEFAULT_WRITE_CONCURRENCY
+
+
+# ===========================================
+# CHECKPOINTS
+# ===========================================
+
+def checkpoint_path(name, path=None):
+    return os.path.join(snapshot_dir(path), CHECKPOINT_DIR, f"{name}.jsonl")
+
+
+def _canonical(value):
+    # JSON stand-in for values json can't encode: timestamps, and Firestore
+    # transforms (ArrayUnion, ...) as their class name and values
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, 'values') and not callable(value.values):
+        return [type(value).__name__, list(value.values)]
+    return str(value)
+
+
+def operation_key(operation):
+    """'kind path hash' for a write operation; the hash covers the data written."""
+    kind, ref = operation[0], operation[1]
+    payload = json.dumps(operation[2], sort_keys=True, default=_canonical) if len(operation) > 2 else ''
+    return f"{kind} {ref.path} {hashlib.sha1(payload.encode()).hexdigest()[:16]}"
+
+
+def targets_digest(keys):
+    """Digest of a set of operation keys: the set a checkpoint belongs to."""
+    digest = hashlib.sha1()
+    for key in sorted(keys):
+        digest.update(key.encode() + b"\n")
+    return digest.hexdigest()
+
+
+def read_checkpoint(name, targets, path=None, ttl_hours=None):
+    """
+    Return the keys (see operation_key()) of operations already written under
+    a checkpoint, or None if there is none for this target set (see
+    targets_digest()) started in the last ttl_hours (default:
+    CHECKPOINT_TTL_HOURS).
+    """
+    if ttl_hours is None:
+        ttl_hours = CHECKPOINT_TTL_HOURS
+    file_path = checkpoint_path(name, path)
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path) as f:
+        try:
+            header = json.loads(f.readline())
+            started = datetime.fromisoformat(header['started'])
+        except (ValueError, KeyError, TypeError):
+            return None
+        if header.get('targets') != targets or datetime.now(timezone.utc) - started > timedelta(hours=ttl_hours):
+            return None
+        done = set()
+        for line in f:
+            try:
+                done.update(json.loads(line))
+            except ValueError:
+                # A line cut short by an interrupted write: that batch gets redone
+                continue
+    return done
+
+
+def clear_checkpoint(name, path=None):
+    file_path = checkpoint_path(name, path)
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+
+# ===========================================
+# EXECUTOR
+# ===========================================
+
+def _pack(groups, size):
+    """Batches of whole groups, up to size writes each."""
+    batch, count = [], 0
+    for group in groups:
+        if batch and count + len(group) > size:
+            yield batch
+            batch, count = [], 0
+        batch.append(group)
+        count += len(group)
+    if batch:
+        yield batch
+
+
+def _commit(db, operations):
+    batch = db.batch()
+    for operation in operations:
+        kind, ref = operation[0], operation[1]
+        if kind == 'delete':
+            batch.delete(ref)
+        elif kind == 'update':
+            batch.update(ref, operation[2])
+        elif kind == 'set':
+            batch.set(ref, operation[2])
+        else:
+            raise ValueError(f"Unknown write operation: {kind}")
+    batch.commit()
+
+
+def _commit_with_retry(db, operations, max_retries, base_delay, max_delay):
+    retryable = retryable_errors()
+    attempt = 0
+    while True:
+        try:
+            _commit(db, operations)
+            return attempt
+        except retryable:
+            if attempt >= max_retries:
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt)
+            time.sleep(delay * random.uniform(0.5, 1.0))
+            attempt += 1
+
+
+def _record(checkpoint_file, operations):
+    # Only the calling (main) thread writes the checkpoint
+    if checkpoint_file:
+        checkpoint_file.write(json.dumps([operation_key(operation) for operation in operations]) + "\n")
+        checkpoint_file.flush()
+
+
+def execute_writes(db, operations, checkpoint=None, batch_size=MAX_BATCH_SIZE, max_workers=None,
+                   max_retries=DEFAULT_MAX_RETRIES, base_delay=0.5, max_delay=30.0, path=None,
+                   verbose=True):
+    """
+    Commit any number of write operations in parallel batches.
+
+    Args:
+        db: Firestore client
+        operations: Iterable of ('delete', ref) / ('update', ref, data) /
+            ('set', ref, data) tuples, and of lists of them (groups) that
+            must be committed together; a group holds at most batch_size
+        checkpoint: Name to checkpoint progress under (None = no checkpoint).
+            Operations recorded by an earlier, interrupted run with the same
+            operations are skipped.
+        batch_size: Writes per batch (at most 500)
+        max_workers: Batches committed at once (default: PP_WRITE_CONCURRENCY or 8)
+        max_retries: Retries per batch on contention/quota errors
+        base_delay, max_delay: Backoff bounds in seconds
+        verbose: Print progress and throughput
+
+    Returns:
+        Dict with 'written' (writes committed by this call), 'skipped'
+        (committed by an earlier run, per the checkpoint), 'failed',
+        'groups_written' and 'groups_skipped' (a single operation counts as a
+        group of one), 'batches', 'retries', 'seconds', 'docs_per_second'
+        and 'errors' (first few messages)
+    """
+    batch_size = min(batch_size, MAX_BATCH_SIZE)
+    max_workers = write_concurrency(max_workers)
+    groups = [item if isinstance(item, list) else [item] for item in operations]
+    for group in groups:
+        if len(group) > batch_size:
+            raise ValueError(f"A group of {len(group)} writes does not fit in a batch of {batch_size}")
+
+    done = targets = None
+    if checkpoint:
+        keys = [[operation_key(operation) for operation in group] for group in groups]
+        targets = targets_digest(key for group_keys in keys for key in group_keys)
+        done = read_checkpoint(checkpoint, targets, path)
+    if done:
+        # Groups commit whole, so a group is done when all of it is
+        pending = [group for group, group_keys in zip(groups, keys) if not all(key in done for key in group_keys)]
+    else:
+        pending = groups
+    pending_writes = sum(len(group) for group in pending)
+    skipped = sum(len(group) for group in groups) - pending_writes
+    groups_skipped = len(groups) - len(pending)
+    if verbose and skipped:
+        print(f"  Resuming from checkpoint '{checkpoint}': skipping {skipped} writes made by an earlier run")
+
+    checkpoint_file = None
+    if checkpoint and pending:
+        file_path = checkpoint_path(checkpoint, path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        if done is None:
+            # No checkpoint for these operations: start one (replacing any other)
+            checkpoint_file = open(file_path, 'w')
+            checkpoint_file.write(json.dumps({'targets': targets,
+                                              'started': datetime.now(timezone.utc).isoformat()}) + "\n")
+        else:
+            checkpoint_file = open(file_path, 'a')
+
+    written = failed = retries = completed = groups_written = 0
+    errors = []
+    batches = list(_pack(pending, batch_size))
+    started = time.perf_counter()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='write') as pool:
+            futures = {}
+            queue = iter(batches)
+            try:
+                while True:
+                    # At most two batches per worker in flight: an interrupt
+                    # waits for those, not for every batch of the run
+                    for batch in islice(queue, max_workers * 2 - len(futures)):
+                        chunk = [operation for group in batch for operation in group]
+                        future = pool.submit(_commit_with_retry, db, chunk, max_retries, base_delay, max_delay)
+                        futures[future] = (chunk, len(batch))
+                    if not futures:
+                        break
+                    finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        chunk, group_count = futures.pop(future)
+                        completed += 1
+                        try:
+                            retries += future.result()
+                        except Exception as e:
+                            failed += len(chunk)
+                            if len(errors) < 5:
+                                errors.append(str(e))
+                            continue
+                        written += len(chunk)
+                        groups_written += group_count
+                        _record(checkpoint_file, chunk)
+                        if verbose and len(batches) > 1 and (completed % PROGRESS_EVERY == 0
+                                                             or completed == len(batches)):
+                            elapsed = time.perf_counter() - started
+                            print(f"  ... {written}/{pending_writes} written ({written / elapsed:.0f} docs/s)")
+            except BaseException:
+                # Interrupted: drop the batches not started, let the running
+                # ones finish and checkpoint those that committed
+                pool.shutdown(wait=True, cancel_futures=True)
+                for future, (chunk, _) in futures.items():
+                    if not future.cancelled() and future.exception() is None:
+                        _record(checkpoint_file, chunk)
+                raise
+    finally:
+        if checkpoint_file:
+            checkpoint_file.close()
+
+    seconds = time.perf_counter() - started
+    if checkpoint and not failed:
+        clear_checkpoint(checkpoint, path)
+
+    result = {
+        'written': written,
+        'skipped': skipped,
+        'failed': failed,
+        'groups_written': groups_written,
+        'groups_skipped': groups_skipped,
+        'batches': len(batches),
+        'retries': retries,
+        'seconds': seconds,
+        'docs_per_second': written / seconds if seconds > 0 else 0.0,
+        'errors': errors,
+    }
+    if verbose:
+        print(f"  Wrote {written} docs in {len(batches)} batches in {seconds:.2f}s "
+              f"({result['docs_per_second']:.0f} docs/s, {retries} retries, {failed} failed)")
+        for error in errors:
+            print(f"  ✗ {error}")
+    return result
+
+
+def add_write_arguments(parser):
+    """Add the --write-concurrency option."""
+    parser.add_argument('--write-concurrency', type=int, default=None, metavar='N',
+                        help="Batches committed at once (default: PP_WRITE_CONCURRENCY or 8)")
+    return parser
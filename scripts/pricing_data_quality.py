@@ -28,51 +28,119 @@ Your soldPrices schema:
 Run: python scripts/pricing_data_quality.py
 """
 
-from google.cloud import firestore
-from google.oauth2 import service_account
 from datetime import datetime, timedelta
 from collections import defaultdict
-import pandas as pd
-import numpy as np
-import os
-
-# Initialize Firestore with service account
-script_dir = os.path.dirname(os.path.abspath(__file__))
-project_dir = os.path.dirname(script_dir)
-key_path = os.path.join(project_dir, 'serviceAccountKey.json')
-
-if os.path.exists(key_path):
-    credentials = service_account.Credentials.from_service_account_file(key_path)
-    db = firestore.Client(credentials=credentials, project=credentials.project_id)
-else:
-    print(f"ERROR: Service account key not found at: {key_path}")
-    print("\nTo fix this:")
-    print("1. Go to Firebase Console → Project Settings → Service Accounts")
-    print("2. Click 'Generate new private key'")
-    print("3. Save the file as 'serviceAccountKey.json' in your project root")
-    print(f"   Expected location: {key_path}")
-    exit(1)
-
-
-def analyze_pricing_data():
-    """Main pricing data quality analysis."""
 
-    print("Fetching data from Firestore...")
+from pp_analytics.aggregations import count_documents
+from pp_analytics.client import CredentialsNotFound, client, print_credentials_help
+from pp_analytics.columns import (
+    DICTIONARY,
+    FLOAT,
+    NAT,
+    PRESENT,
+    TIMESTAMP,
+    dictionary_counts,
+    epoch_ns,
+    group_values,
+    iter_column_batches,
+)
+from pp_analytics.fetch import add_fetch_arguments, fetch_collections
+from pp_analytics.fields import report_fields
+from pp_analytics.scans import add_scan_arguments, configure_scans_from_args
+from pp_analytics.sketches import BucketCounter, ValueSummary
+from pp_analytics.snapshot import ROW_GROUP_SIZE, add_snapshot_arguments, iter_collection
+from pp_analytics.trace import add_trace_arguments, configure_from_args, section, traced_report
+
+
+PRICE_BUCKET_EDGES = [0, 25, 50, 100, 250, 500, 1000, 5000, float('inf')]
+PRICE_BUCKET_LABELS = ['$0-25', '$25-50', '$50-100', '$100-250', '$250-500', '$500-1K', '$1K-5K', '$5K+']
+DAYS_BUCKET_EDGES = [float('-inf'), 3, 7, 30, float('inf')]
+
+# Typed columns read from each soldPrices document (see pp_analytics/columns.py)
+SOLD_PRICE_COLUMNS = {
+    'price': ('actualSoldPrice', FLOAT),
+    'category': ('category', DICTIONARY),
+    'condition': ('condition', DICTIONARY),
+    'has_item_name': ('itemName', PRESENT),
+    'metro': ('location.parsed.metro', DICTIONARY),
+    'state': ('location.parsed.state', DICTIONARY),
+    'has_city': ('location.parsed.city', PRESENT),
+    'timestamp': ('timestamp', TIMESTAMP),
+    'days_to_sell': ('daysToSell', FLOAT),
+}
 
-    sold_prices = list(db.collection('soldPrices').stream())
-    listings = list(db.collection('listings').stream())
-    feedback_events = list(db.collection('feedback_events').stream())
 
-    now = datetime.now()
-    ninety_days_ago = now - timedelta(days=90)
+def _or_nan(value):
+    return float('nan') if value is None else value
+
 
+def print_header(now, record_count, listing_count, feedback_count, streaming=False):
+    """Print the report title and collection totals."""
     print(f"\n{'='*60}")
     print("PRICING DATA QUALITY REPORT - Precision Prices")
     print(f"{'='*60}")
     print(f"Report Generated: {now.strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"\nTotal Sold Prices Records: {len(sold_prices)}")
-    print(f"Total Listings: {len(listings)}")
-    print(f"Total Feedback Events: {len(feedback_events)}")
+    if streaming:
+        print("Mode: STREAMING (medians approximate, within 1%)")
+    print(f"\nTotal Sold Prices Records: {record_count}")
+    print(f"Total Listings: {listing_count}")
+    print(f"Total Feedback Events: {feedback_count}")
+
+
+@traced_report('pricing_data_quality')
+def analyze_pricing_data(refresh=False, snapshot_ttl=None, incremental=None,
+                         fetch_concurrency=None, streaming=False, quick=False, db=None, tables=None):
+    """
+    Main pricing data quality analysis.
+
+    Args:
+        refresh: If True, re-fetch collections from Firestore instead of using local snapshots.
+        snapshot_ttl: Max age in hours of a local snapshot (default: PP_SNAPSHOT_TTL_HOURS or 12).
+        incremental: If True, update stale snapshots with a delta sync (default: PP_SNAPSHOT_INCREMENTAL).
+        fetch_concurrency: Max collections fetched at once (default: PP_FETCH_CONCURRENCY or all).
+        streaming: If True, read each collection once as a stream and keep only
+            running totals, so memory stays flat however large soldPrices gets.
+            Medians come from a quantile sketch and are accurate to within 1%;
+            every count, average, min/max and bucket is exact.
+        quick: If True, only print the headline totals, from aggregation queries.
+        db: Firestore client (default: the shared, lazily created client; see pp_analytics/client.py).
+        tables: Collections already loaded this run (see run_reports.py), used instead of fetching.
+    """
+    import numpy as np
+
+    if db is None:
+        db = client
+
+    print("Fetching data from Firestore...")
+
+    fields = report_fields('pricing_data_quality')
+    listing_count = count_documents(db, 'listings', refresh=refresh, ttl_hours=snapshot_ttl, tables=tables)
+    feedback_count = count_documents(db, 'feedback_events', refresh=refresh, ttl_hours=snapshot_ttl, tables=tables)
+    now = datetime.now()
+
+    if quick:
+        record_count = count_documents(db, 'soldPrices', refresh=refresh, ttl_hours=snapshot_ttl, tables=tables)
+        print_header(now, record_count, listing_count, feedback_count)
+        print(f"\n{'='*60}")
+        return {
+            'total_records': record_count,
+            'total_listings': listing_count,
+            'total_feedback_events': feedback_count,
+        }
+
+    if streaming:
+        sold_prices = iter_collection(db, 'soldPrices', refresh=refresh, ttl_hours=snapshot_ttl,
+                                      incremental=incremental, fields=fields['soldPrices'], tables=tables)
+    else:
+        collections, _ = fetch_collections(
+            db, ['soldPrices'],
+            max_workers=fetch_concurrency, refresh=refresh, ttl_hours=snapshot_ttl, incremental=incremental,
+            fields=fields,
+            tables=tables,
+        )
+        sold_prices = collections['soldPrices']
+
+    ninety_days_ago = now - timedelta(days=90)
 
     # ===========================================
     # DATA QUALITY CHECKS
@@ -90,114 +158,99 @@ def analyze_pricing_data():
         'invalid_days_to_sell': 0,  # > 365 or negative
     }
 
-    # Data aggregations
-    category_data = defaultdict(list)
+    # Data aggregations (exact summaries keep values; streaming ones keep sketches)
+    exact = not streaming
+    category_data = defaultdict(lambda: ValueSummary(exact=exact))
     condition_breakdown = defaultdict(int)
     metro_breakdown = defaultdict(int)
     state_breakdown = defaultdict(int)
     recent_count = 0
     historical_count = 0
 
-    all_records = []
+    record_count = 0
+    price_records = 0
+    days_records = 0
+    valid_prices = ValueSummary(exact=exact)
+    valid_days = ValueSummary(exact=exact)
+    price_buckets = BucketCounter(PRICE_BUCKET_EDGES)
+    days_buckets = BucketCounter(DAYS_BUCKET_EDGES)
 
-    for doc in sold_prices:
-        data = doc.to_dict()
-        record = {'doc_id': doc.id}
+    ninety_days_ago_ns = epoch_ns(ninety_days_ago)
+
+    # Checks run as vectorized expressions over typed columns, one batch at a time
+    # (a single batch unless streaming)
+    batch_size = ROW_GROUP_SIZE if streaming else None
+    for batch in iter_column_batches(sold_prices, SOLD_PRICE_COLUMNS, batch_size=batch_size):
+        record_count += len(batch)
 
         # Price validation
-        price = data.get('actualSoldPrice')
-        if price is None:
-            quality_issues['missing_price'] += 1
-            record['price'] = None
-        elif price <= 0:
-            quality_issues['invalid_price_zero_negative'] += 1
-            record['price'] = price
-        elif price > 50000:
-            quality_issues['invalid_price_too_high'] += 1
-            record['price'] = price
-        else:
-            record['price'] = price
+        price = batch['price'].to_numpy()
+        has_price = ~np.isnan(price)
+        non_positive = price <= 0
+        too_high = price > 50000
+        valid_price = has_price & ~non_positive & ~too_high
+        price_records += int(has_price.sum())
+        quality_issues['missing_price'] += int((~has_price).sum())
+        quality_issues['invalid_price_zero_negative'] += int(non_positive.sum())
+        quality_issues['invalid_price_too_high'] += int(too_high.sum())
+        valid_prices.add_many(price[valid_price])
+        price_buckets.add_many(price[valid_price])
 
         # Category validation
-        category = data.get('category')
-        if not category:
-            quality_issues['missing_category'] += 1
-            record['category'] = 'unknown'
-        else:
-            record['category'] = category
-            if record['price'] and record['price'] > 0:
-                category_data[category].append(record['price'])
+        category = batch['category'].array
+        quality_issues['missing_category'] += int((category.codes < 0).sum())
+        for cat, prices in group_values(category, price, mask=price > 0):
+            category_data[cat].add_many(prices)
 
         # Condition validation
-        condition = data.get('condition')
-        if not condition:
-            quality_issues['missing_condition'] += 1
-            record['condition'] = 'unknown'
-        else:
-            record['condition'] = condition
-            condition_breakdown[condition] += 1
+        condition = batch['condition'].array
+        quality_issues['missing_condition'] += int((condition.codes < 0).sum())
+        for cond, count in dictionary_counts(condition):
+            condition_breakdown[cond] += count
 
         # Item name validation
-        if not data.get('itemName'):
-            quality_issues['missing_item_name'] += 1
+        quality_issues['missing_item_name'] += int((~batch['has_item_name'].to_numpy()).sum())
 
         # Location validation (nested structure)
-        location = data.get('location', {})
-        parsed = location.get('parsed', {}) if isinstance(location, dict) else {}
-        metro = parsed.get('metro')
-        state = parsed.get('state')
-        city = parsed.get('city')
-
-        if not (metro or state or city):
-            quality_issues['missing_location'] += 1
-        else:
-            if metro:
-                metro_breakdown[metro] += 1
-            if state:
-                state_breakdown[state] += 1
-
-        record['metro'] = metro
-        record['state'] = state
-        record['city'] = city
+        metro = batch['metro'].array
+        state = batch['state'].array
+        has_location = (metro.codes >= 0) | (state.codes >= 0) | batch['has_city'].to_numpy()
+        quality_issues['missing_location'] += int((~has_location).sum())
+        for name, count in dictionary_counts(metro):
+            metro_breakdown[name] += count
+        for name, count in dictionary_counts(state):
+            state_breakdown[name] += count
 
         # Timestamp validation
-        timestamp = data.get('timestamp')
-        if not timestamp:
-            quality_issues['missing_timestamp'] += 1
-            record['timestamp'] = None
-        else:
-            if hasattr(timestamp, 'timestamp'):
-                ts_dt = datetime.fromtimestamp(timestamp.timestamp())
-            else:
-                ts_dt = timestamp
-            record['timestamp'] = ts_dt
-
-            if ts_dt > ninety_days_ago:
-                recent_count += 1
-            else:
-                historical_count += 1
+        timestamp = batch['timestamp'].to_numpy()
+        has_timestamp = timestamp != NAT
+        recent = has_timestamp & (timestamp > ninety_days_ago_ns)
+        quality_issues['missing_timestamp'] += int((~has_timestamp).sum())
+        recent_count += int(recent.sum())
+        historical_count += int((has_timestamp & ~recent).sum())
 
         # Days to sell validation
-        days_to_sell = data.get('daysToSell')
-        if days_to_sell is None:
-            quality_issues['missing_days_to_sell'] += 1
-            record['days_to_sell'] = None
-        elif days_to_sell < 0 or days_to_sell > 365:
-            quality_issues['invalid_days_to_sell'] += 1
-            record['days_to_sell'] = days_to_sell
-        else:
-            record['days_to_sell'] = days_to_sell
-
-        all_records.append(record)
+        days_to_sell = batch['days_to_sell'].to_numpy()
+        has_days = ~np.isnan(days_to_sell)
+        invalid_days = (days_to_sell < 0) | (days_to_sell > 365)
+        valid_days_mask = has_days & ~invalid_days
+        days_records += int(has_days.sum())
+        quality_issues['missing_days_to_sell'] += int((~has_days).sum())
+        quality_issues['invalid_days_to_sell'] += int(invalid_days.sum())
+        valid_days.add_many(days_to_sell[valid_days_mask])
+        days_buckets.add_many(days_to_sell[valid_days_mask])
+
+    print_header(now, record_count, listing_count, feedback_count, streaming=streaming)
 
     # ===========================================
     # QUALITY ISSUES SUMMARY
     # ===========================================
+    section("DATA QUALITY ISSUES")
     print(f"\n{'='*60}")
     print("DATA QUALITY ISSUES")
     print(f"{'='*60}")
 
-    total_records = len(sold_prices) if sold_prices else 1
+    total_records = record_count if record_count else 1
     critical_issues = []
     warning_issues = []
 
@@ -214,6 +267,7 @@ def analyze_pricing_data():
     # ===========================================
     # DATA FRESHNESS
     # ===========================================
+    section("DATA FRESHNESS")
     print(f"\n{'='*60}")
     print("DATA FRESHNESS")
     print(f"{'='*60}")
@@ -226,28 +280,27 @@ def analyze_pricing_data():
     # ===========================================
     # CATEGORY ANALYSIS
     # ===========================================
+    section("TOP CATEGORIES BY VOLUME")
     print(f"\n{'='*60}")
     print("TOP CATEGORIES BY VOLUME")
     print(f"{'='*60}")
 
-    top_categories = sorted(category_data.items(), key=lambda x: len(x[1]), reverse=True)[:15]
+    top_categories = sorted(category_data.items(), key=lambda x: x[1].count, reverse=True)[:15]
     for cat, prices in top_categories:
-        if prices:
-            avg = sum(prices) / len(prices)
-            median = sorted(prices)[len(prices)//2]
-            min_p = min(prices)
-            max_p = max(prices)
-            print(f"  {cat}: {len(prices)} items | Avg: ${avg:.2f} | Med: ${median:.2f} | Range: ${min_p:.2f}-${max_p:.2f}")
+        if prices.count:
+            print(f"  {cat}: {prices.count} items | Avg: ${prices.mean:.2f} | Med: ${prices.upper_median():.2f} | "
+                  f"Range: ${prices.min:.2f}-${prices.max:.2f}")
 
     # ===========================================
     # DATA GAPS (Sparse Categories)
     # ===========================================
+    section("DATA GAPS - Categories Needing More Data")
     print(f"\n{'='*60}")
     print("DATA GAPS - Categories Needing More Data")
     print(f"{'='*60}")
 
     # Categories with < 10 samples can't reliably inform pricing
-    sparse_categories = [(cat, len(prices)) for cat, prices in category_data.items() if len(prices) < 10]
+    sparse_categories = [(cat, prices.count) for cat, prices in category_data.items() if prices.count < 10]
     sparse_categories.sort(key=lambda x: x[1], reverse=True)
 
     print(f"Categories with <10 samples: {len(sparse_categories)}")
@@ -258,6 +311,7 @@ def analyze_pricing_data():
     # ===========================================
     # CONDITION BREAKDOWN
     # ===========================================
+    section("CONDITION BREAKDOWN")
     print(f"\n{'='*60}")
     print("CONDITION BREAKDOWN")
     print(f"{'='*60}")
@@ -279,6 +333,7 @@ def analyze_pricing_data():
     # ===========================================
     # GEOGRAPHIC COVERAGE
     # ===========================================
+    section("GEOGRAPHIC COVERAGE")
     print(f"\n{'='*60}")
     print("GEOGRAPHIC COVERAGE")
     print(f"{'='*60}")
@@ -309,57 +364,49 @@ def analyze_pricing_data():
     # ===========================================
     # PRICE DISTRIBUTION ANALYSIS
     # ===========================================
-    df = pd.DataFrame(all_records)
-
-    if not df.empty and df['price'].notna().any():
-        valid_prices = df[df['price'].notna() & (df['price'] > 0) & (df['price'] <= 50000)]['price']
-
+    if price_records:
+        section("PRICE DISTRIBUTION")
         print(f"\n{'='*60}")
         print("PRICE DISTRIBUTION")
         print(f"{'='*60}")
-        print(f"Valid price records: {len(valid_prices)}")
-        print(f"Mean price: ${valid_prices.mean():.2f}")
+        print(f"Valid price records: {valid_prices.count}")
+        print(f"Mean price: ${valid_prices.mean:.2f}")
         print(f"Median price: ${valid_prices.median():.2f}")
         print(f"Std deviation: ${valid_prices.std():.2f}")
-        print(f"Min: ${valid_prices.min():.2f}")
-        print(f"Max: ${valid_prices.max():.2f}")
+        print(f"Min: ${_or_nan(valid_prices.min):.2f}")
+        print(f"Max: ${_or_nan(valid_prices.max):.2f}")
 
         # Price buckets
         print(f"\nPrice Buckets:")
-        buckets = [0, 25, 50, 100, 250, 500, 1000, 5000, float('inf')]
-        bucket_labels = ['$0-25', '$25-50', '$50-100', '$100-250', '$250-500', '$500-1K', '$1K-5K', '$5K+']
-        for i in range(len(buckets)-1):
-            count = len(valid_prices[(valid_prices > buckets[i]) & (valid_prices <= buckets[i+1])])
-            pct = count / len(valid_prices) * 100
-            print(f"  {bucket_labels[i]}: {count} ({pct:.1f}%)")
+        for label, count in zip(PRICE_BUCKET_LABELS, price_buckets.counts):
+            pct = count / max(valid_prices.count, 1) * 100
+            print(f"  {label}: {count} ({pct:.1f}%)")
 
     # ===========================================
     # DAYS TO SELL ANALYSIS
     # ===========================================
-    if not df.empty and df['days_to_sell'].notna().any():
-        valid_days = df[(df['days_to_sell'].notna()) & (df['days_to_sell'] >= 0) & (df['days_to_sell'] <= 365)]['days_to_sell']
-
+    if days_records:
+        section("DAYS TO SELL ANALYSIS")
         print(f"\n{'='*60}")
         print("DAYS TO SELL ANALYSIS")
         print(f"{'='*60}")
-        print(f"Records with valid days_to_sell: {len(valid_days)}")
-        print(f"Average days to sell: {valid_days.mean():.1f}")
+        print(f"Records with valid days_to_sell: {valid_days.count}")
+        print(f"Average days to sell: {valid_days.mean:.1f}")
         print(f"Median days to sell: {valid_days.median():.1f}")
 
         # Quick sell vs slow sell
-        quick_sell = len(valid_days[valid_days <= 3])
-        week_sell = len(valid_days[(valid_days > 3) & (valid_days <= 7)])
-        month_sell = len(valid_days[(valid_days > 7) & (valid_days <= 30)])
-        slow_sell = len(valid_days[valid_days > 30])
+        quick_sell, week_sell, month_sell, slow_sell = days_buckets.counts
+        days_total = max(valid_days.count, 1)
 
-        print(f"\n  Quick (≤3 days): {quick_sell} ({quick_sell/len(valid_days)*100:.1f}%)")
-        print(f"  Week (4-7 days): {week_sell} ({week_sell/len(valid_days)*100:.1f}%)")
-        print(f"  Month (8-30 days): {month_sell} ({month_sell/len(valid_days)*100:.1f}%)")
-        print(f"  Slow (>30 days): {slow_sell} ({slow_sell/len(valid_days)*100:.1f}%)")
+        print(f"\n  Quick (≤3 days): {quick_sell} ({quick_sell/days_total*100:.1f}%)")
+        print(f"  Week (4-7 days): {week_sell} ({week_sell/days_total*100:.1f}%)")
+        print(f"  Month (8-30 days): {month_sell} ({month_sell/days_total*100:.1f}%)")
+        print(f"  Slow (>30 days): {slow_sell} ({slow_sell/days_total*100:.1f}%)")
 
     # ===========================================
     # RECOMMENDATIONS
     # ===========================================
+    section("TOP 3 DATA QUALITY PRIORITIES")
     print(f"\n{'='*60}")
     print("TOP 3 DATA QUALITY PRIORITIES")
     print(f"{'='*60}")
@@ -421,7 +468,7 @@ def analyze_pricing_data():
     return {
         'quality_issues': quality_issues,
         'total_records': total_records,
-        'category_counts': {k: len(v) for k, v in category_data.items()},
+        'category_counts': {k: v.count for k, v in category_data.items()},
         'sparse_categories': sparse_categories,
         'recent_data_pct': recent_count / total_records * 100 if total_records else 0,
         'top_metros': top_metros[:5],
@@ -430,4 +477,27 @@ def analyze_pricing_data():
 
 
 if __name__ == "__main__":
-    results = analyze_pricing_data()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Analyze soldPrices data quality.")
+    add_snapshot_arguments(parser)
+    add_scan_arguments(parser)
+    add_fetch_arguments(parser)
+    parser.add_argument('--streaming', action='store_true',
+                        help="Constant-memory mode: stream soldPrices once, approximate medians")
+    parser.add_argument('--quick', action='store_true',
+                        help="Only print headline totals (aggregation queries, no document downloads)")
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+    configure_scans_from_args(args)
+
+    try:
+        results = analyze_pricing_data(refresh=args.refresh, snapshot_ttl=args.snapshot_ttl,
+                                       incremental=args.incremental,
+                                       fetch_concurrency=args.fetch_concurrency,
+                                       streaming=args.streaming,
+                                       quick=args.quick)
+    except CredentialsNotFound as e:
+        print_credentials_help(e)
+        raise SystemExit(1)
@@ -0,0 +1,119 @@
+# run_reports.py
+"""
+Precision Prices - Run Several Reports in One Pass
+
+Running the four scripts one after another re-reads the collections they
+share (listings, listings_temp, feedback_events, soldPrices, sessions). This
+runner works out the union of collections and fields the selected reports
+need (from pp_analytics/fields.py), fetches each collection exactly once,
+concurrently, and hands the in-memory tables to every report.
+
+Collections a report only counts or sums are still answered with
+aggregation queries unless another selected report loads them anyway.
+
+Run: python scripts/run_reports.py
+     python scripts/run_reports.py --reports pricing validator
+"""
+
+import time
+
+from pp_analytics.client import CredentialsNotFound, client, print_credentials_help
+from pp_analytics.fetch import add_fetch_arguments, fetch_collections
+from pp_analytics.fields import report_fields
+from pp_analytics.scans import add_scan_arguments, configure_scans_from_args
+from pp_analytics.snapshot import Tables, add_snapshot_arguments, merge_fields
+from pp_analytics.trace import add_trace_arguments, configure_from_args, section, traced_report
+
+# CLI name -> (REPORT_FIELDS key, module, function), in the README's run order
+REPORTS = {
+    'engagement': ('user_engagement', 'user_engagement_analysis', 'analyze_user_engagement'),
+    'pricing': ('pricing_data_quality', 'pricing_data_quality', 'analyze_pricing_data'),
+    'validator': ('ai_accuracy_validator', 'ai_accuracy_validator', 'validate_ai_predictions'),
+    'cleanup': ('data_cleanup', 'data_cleanup', 'generate_cleanup_tasks'),
+}
+
+
+def combined_fields(reports):
+    """Return {collection: union of field paths} over the given reports."""
+    combined = {}
+    for name in reports:
+        for collection, fields in report_fields(REPORTS[name][0]).items():
+            if collection in combined:
+                combined[collection] = merge_fields(combined[collection], fields)
+            else:
+                combined[collection] = fields
+    return combined
+
+
+def load_tables(reports, db=None, refresh=False, snapshot_ttl=None, incremental=None, fetch_concurrency=None):
+    """Fetch every collection the reports need, once, with the union of their fields."""
+    if db is None:
+        db = client
+    fields = combined_fields(reports)
+    docs, _ = fetch_collections(
+        db, list(fields),
+        max_workers=fetch_concurrency, refresh=refresh, ttl_hours=snapshot_ttl, incremental=incremental,
+        fields=fields,
+    )
+    return Tables(docs, fields=fields)
+
+
+@traced_report('run_reports')
+def run_reports(reports=None, refresh=False, snapshot_ttl=None, incremental=None, fetch_concurrency=None, db=None):
+    """
+    Run several reports against one shared load of their collections.
+
+    Args:
+        reports: Report names from REPORTS (default: all, in REPORTS order).
+            data_cleanup always runs as a dry run here.
+        refresh, snapshot_ttl, incremental: Snapshot options (see pp_analytics/snapshot.py).
+        fetch_concurrency: Max collections fetched at once (default: PP_FETCH_CONCURRENCY or all).
+        db: Firestore client (default: the shared, lazily created client; see pp_analytics/client.py).
+
+    Returns:
+        {report name: that report's return value}
+    """
+    import importlib
+
+    if db is None:
+        db = client
+    reports = [name for name in REPORTS if reports is None or name in reports]
+
+    print(f"Loading collections for: {', '.join(reports)}")
+    started = time.perf_counter()
+    tables = load_tables(reports, db=db, refresh=refresh, snapshot_ttl=snapshot_ttl,
+                         incremental=incremental, fetch_concurrency=fetch_concurrency)
+
+    options = {'refresh': refresh, 'snapshot_ttl': snapshot_ttl, 'incremental': incremental,
+               'db': db, 'tables': tables}
+    results = {}
+    for name in reports:
+        _, module_name, function_name = REPORTS[name]
+        report = getattr(importlib.import_module(module_name), function_name)
+        section(name)
+        results[name] = report(**options)
+
+    print(f"\nRan {len(reports)} reports in {time.perf_counter() - started:.2f}s")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run several reports, fetching each collection once.")
+    parser.add_argument('--reports', nargs='+', choices=list(REPORTS), default=None, metavar='REPORT',
+                        help=f"Reports to run (default: all). Choices: {', '.join(REPORTS)}")
+    add_snapshot_arguments(parser)
+    add_scan_arguments(parser)
+    add_fetch_arguments(parser)
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+    configure_scans_from_args(args)
+
+    try:
+        run_reports(reports=args.reports, refresh=args.refresh, snapshot_ttl=args.snapshot_ttl,
+                    incremental=args.incremental, fetch_concurrency=args.fetch_concurrency)
+    except CredentialsNotFound as e:
+        print_credentials_help(e)
+        raise SystemExit(1)
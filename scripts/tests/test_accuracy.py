@@ -0,0 +1,153 @@
+from datetime import datetime, timedelta, timezone
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from ai_accuracy_validator import mape_change
+from pp_analytics.accuracy import (
+    MATCHED,
+    MATCH_COLUMNS,
+    NOT_OUTCOME,
+    UNMATCHED,
+    AccuracyLedger,
+    daily_cells,
+    drift_series,
+    merge_cells,
+)
+from pp_analytics.columns import NAT, epoch_ns
+
+FETCHED_AT = datetime(2026, 10, 1, tzinfo=timezone.utc)
+
+
+def matches(rows):
+    frame = pd.DataFrame([dict(zip(MATCH_COLUMNS, row)) for row in rows], columns=MATCH_COLUMNS)
+    return frame.assign(days_to_sell=float('nan'), sold_at=NAT)
+
+
+def match(outcome_id, source, method, listing_id, category, pct_error):
+    return (outcome_id, source, method, listing_id, category, 'good', 'item', 100.0, 110.0, 10.0, 10.0,
+            pct_error, 'under', None, NAT)
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = AccuracyLedger(str(tmp_path))
+    ledger.add_matches(matches([match('f1', 'feedback', 'id', 'L1', 'toys', 5.0),
+                                match('f2', 'feedback', 'id', 'L2', 'tools', 15.0),
+                                match('t1', 'temp', 'exact', 't1', 'toys', 25.0)]))
+    ledger.set_status('temp', 't2', UNMATCHED)
+    ledger.save(FETCHED_AT)
+    return AccuracyLedger(str(tmp_path))
+
+
+def test_counts_and_listing_ids_come_from_meta(ledger):
+    assert ledger.match_count('feedback', 'id') == 2
+    assert ledger.match_count('temp', 'exact') == 1
+    assert ledger.feedback_listings == {'L1', 'L2'}
+
+
+def test_columns_reads_only_the_rows_asked_for(ledger):
+    ledger.add_matches(matches([match('f3', 'feedback', 'id', 'L3', 'toys', 35.0)]))
+
+    columns = ledger.columns(['category', 'pct_error'], where=('category', ['toys']))
+
+    assert columns['category'].tolist() == ['toys', 'toys', 'toys']
+    assert sorted(columns['pct_error'].tolist()) == [5.0, 25.0, 35.0]
+
+
+def test_unmatched_outcomes_are_retried_when_listings_are_fetched_again(ledger):
+    assert not ledger.retry_needed(FETCHED_AT)
+    assert not ledger.pending('temp', 't2', ledger.retry_needed(FETCHED_AT))
+    assert ledger.retry_needed(FETCHED_AT + timedelta(hours=12))
+    assert ledger.retry_needed(None)
+    assert ledger.pending('temp', 't2', ledger.retry_needed(None))
+
+
+def test_status_counts_follow_changes(ledger, tmp_path):
+    assert ledger.status_count('temp', UNMATCHED) == 1
+    ledger.add_matches(matches([match('t2', 'temp', 'exact', 't2', 'toys', 5.0)]))
+    ledger.set_statuses('feedback', ['f4', 'f5'], NOT_OUTCOME)
+    ledger.save(FETCHED_AT)
+
+    reloaded = AccuracyLedger(str(tmp_path))
+    assert reloaded.status_count('temp', UNMATCHED) == 0
+    assert reloaded.status_count('temp', MATCHED) == 2
+    assert reloaded.status_count('feedback', NOT_OUTCOME) == 2
+    assert reloaded.outcomes[('temp', 't2')] == MATCHED
+
+
+def test_outcome_statuses_are_appended(ledger, tmp_path, monkeypatch):
+    ledger.set_status('feedback', 'f4', NOT_OUTCOME)
+    ledger.set_status('feedback', 'f1', MATCHED)  # unchanged: not written again
+    ledger.save(FETCHED_AT)
+
+    part = pq.read_table(os.path.join(ledger.directory, 'outcomes', ledger.outcome_parts[-1])).to_pydict()
+    assert (part['id'], len(ledger.outcome_parts)) == (['f4'], 2)
+
+    monkeypatch.setattr('pp_analytics.accuracy.OUTCOME_PARTS_MAX', 2)
+    ledger.set_status('feedback', 'f5', NOT_OUTCOME)
+    ledger.save(FETCHED_AT)
+    reloaded = AccuracyLedger(str(tmp_path))
+    assert len(reloaded.outcome_parts) == 1
+    assert len(os.listdir(os.path.join(ledger.directory, 'outcomes'))) == 1
+    assert reloaded.outcomes == ledger.outcomes and len(reloaded.outcomes) == 6
+
+
+def sales(category, pct_errors, day):
+    """Matches of a category sold on a day (a date string), one per percentage error."""
+    frame = matches([match(f'{category}{day}{i}', 'feedback', 'id', 'L', category, pct_error)
+                     for i, pct_error in enumerate(pct_errors)])
+    return frame.assign(sold_at=epoch_ns(datetime.fromisoformat(day).replace(hour=12, tzinfo=timezone.utc)))
+
+
+def test_weekly_drift_starts_on_mondays():
+    # Sunday 2026-10-04 and Monday 2026-10-05 are in different weeks
+    cells = daily_cells(pd.concat([sales('toys', [10.0], '2026-10-04'), sales('toys', [20.0, 30.0], '2026-10-05')]))
+
+    weekly = drift_series(cells, 'overall', freq='W', window=1, start='2026-09-30', end='2026-10-08')
+
+    periods = weekly.index.get_level_values('period')
+    assert list(periods) == list(pd.to_datetime(['2026-09-28', '2026-10-05']))
+    assert weekly['count'].tolist() == [1, 2]
+    assert weekly['mape'].tolist() == [10.0, 25.0]
+
+
+def test_first_windows_include_the_days_before_start():
+    cells = daily_cells(pd.concat([sales('toys', [10.0], '2026-09-24'), sales('toys', [30.0], '2026-09-30')]))
+
+    rolling = drift_series(cells, 'overall', window=7, start='2026-09-30', end='2026-10-01')
+
+    # 2026-09-24 is the first day of the window ending on start, not of the next
+    assert rolling['count'].tolist() == [2, 1]
+    assert rolling['mape'].tolist() == [20.0, 30.0]
+
+
+def test_late_matches_add_to_their_day():
+    first = sales('toys', [10.0, 20.0], '2026-09-01')
+    late = pd.concat([sales('toys', [60.0], '2026-09-01'), sales('tools', [5.0], '2026-09-01')])
+
+    merged = merge_cells(daily_cells(first), daily_cells(late))
+
+    expected = daily_cells(pd.concat([first, late], ignore_index=True))
+    key = ['day', 'group', 'key']
+    pd.testing.assert_frame_equal(merged.sort_values(key).reset_index(drop=True),
+                                  expected.sort_values(key).reset_index(drop=True), check_dtype=False)
+    toys = merged[(merged['group'] == 'category') & (merged['key'] == 'toys')]
+    assert toys[['count', 'sum_pct_error']].values.tolist() == [[3, 90.0]]
+
+
+def test_mape_change_skips_categories_outside_the_windows():
+    today = pd.Timestamp('2026-10-15')
+    cells = daily_cells(pd.concat(
+        [sales('toys', [10.0] * 5, '2026-09-01'), sales('toys', [30.0] * 5, '2026-10-10'),
+         sales('tools', [50.0] * 5, '2026-06-01'),  # only before both windows
+         sales('games', [20.0] * 4, '2026-09-02'), sales('games', [20.0] * 5, '2026-10-02')]))
+
+    change = mape_change(cells, today)
+
+    assert change.index.tolist() == ['toys']
+    assert change.loc['toys', ['mape', 'before', 'count', 'delta']].tolist() == [30.0, 10.0, 5, 20.0]
+    assert mape_change(daily_cells(sales('tools', [50.0] * 5, '2026-06-01')), today).empty
+    assert mape_change(merge_cells(), today).empty
@@ -0,0 +1,69 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from pp_analytics.active_users import REOPEN_DAYS, ActiveUserStore, update_active_users
+
+TODAY = date(2026, 10, 15)
+_DAY_NS = 86_400 * 1_000_000_000
+
+
+def sessions(rows):
+    """Session columns from (userId or None, date) rows; sessions without a userId are guests."""
+    users = pd.Categorical([user for user, _ in rows])
+    times = np.array([((day - date(1970, 1, 1)).days + 0.5) * _DAY_NS for _, day in rows], dtype=np.int64)
+    ids = np.array([f's{i}' for i in range(len(rows))], dtype=object)
+    return ids, users, np.zeros(len(rows), dtype=bool), times
+
+
+def test_sealed_days_are_not_rebuilt(tmp_path):
+    first_day = TODAY - timedelta(days=9)
+    rows = [(f'u{i % 7}', first_day + timedelta(days=i % 10)) for i in range(70)]
+    store = ActiveUserStore(str(tmp_path))
+    assert len(store.update(*sessions(rows), first_day, TODAY, today=TODAY)) == 10
+    store.save()
+
+    # More sessions on every day: only the days still open are rebuilt
+    more = rows + [(f'v{i}', first_day + timedelta(days=i % 10)) for i in range(50)]
+    store = ActiveUserStore(str(tmp_path))
+    rebuilt = store.update(*sessions(more), first_day, TODAY, today=TODAY)
+    assert rebuilt == [TODAY - timedelta(days=i) for i in reversed(range(REOPEN_DAYS))]
+    assert store.distinct(first_day, first_day) == 7
+    assert store.distinct(TODAY, TODAY) == 12
+
+    # The next day seals today
+    store.update(*sessions(more), first_day, TODAY + timedelta(days=1), today=TODAY + timedelta(days=1))
+    assert store.open_days(first_day, TODAY) == [TODAY]
+
+
+def test_weekly_and_monthly_counts_are_close(tmp_path):
+    rng = np.random.default_rng(0)
+    first_day = TODAY - timedelta(days=59)
+    rows = [(f'u{user}', first_day + timedelta(days=int(day)))
+            for user, day in zip(rng.zipf(1.3, 100_000) % 20_000, rng.integers(0, 60, 100_000))]
+    store = update_active_users(*sessions(rows), first_day=first_day, path=str(tmp_path), today=TODAY)
+    frame = pd.DataFrame(rows, columns=['user', 'day'])
+
+    series = store.series(TODAY - timedelta(days=20), TODAY)
+    for column, width in (('dau', 1), ('wau', 7), ('mau', 30)):
+        errors = []
+        for day in series.index:
+            window = frame[(frame['day'] > day - timedelta(days=width)) & (frame['day'] <= day)]
+            exact = window['user'].nunique()
+            errors.append(abs(series.loc[day, column] - exact) / exact)
+        # Standard error 1.04 / sqrt(2**14) = 0.8%; overlapping windows share
+        # their errors, so every window is held to three of them
+        assert max(errors) < 0.025, (column, max(errors))
+
+
+def test_days_past_history_are_pruned(tmp_path):
+    rows = [('u1', TODAY - timedelta(days=i)) for i in range(60)]
+    store = update_active_users(*sessions(rows), first_day=TODAY - timedelta(days=59), path=str(tmp_path),
+                                today=TODAY)
+    assert min(store.days) == TODAY - timedelta(days=59)
+
+    # A shorter history keeps history_days plus the 29 days of the first 30-day window
+    store = update_active_users(*sessions(rows), history_days=20, path=str(tmp_path), today=TODAY)
+    assert min(store.days) == TODAY - timedelta(days=19 + 29)
+    assert min(ActiveUserStore(str(tmp_path)).days) == TODAY - timedelta(days=48)
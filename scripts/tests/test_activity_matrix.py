@@ -0,0 +1,25 @@
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from pp_analytics.activity_matrix import ActivityMatrix
+
+
+def test_counts_across_chunks(monkeypatch):
+    monkeypatch.setattr('pp_analytics.activity_matrix.CHUNK_USERS', 100)
+    rng = np.random.default_rng(0)
+    matrix = ActivityMatrix()
+    expected = Counter()
+    for _ in range(4):
+        users = [f'u{i}' if i % 50 else None for i in rng.integers(0, 700, 2000)]
+        types = [f't{i}' for i in rng.integers(0, 5, 2000)]
+        matrix.add(pd.DataFrame({'user': pd.Categorical(users), 'type': pd.Categorical(types)}))
+        expected.update(zip((user or 'guest' for user in users), types))
+
+    assert matrix.activity_count == 8000
+    assert matrix.type_totals() == {t: sum(n for (_, kind), n in expected.items() if kind == t)
+                                    for t in matrix.types.values}
+    for activity_type in matrix.types.values:
+        column = matrix._column(activity_type)
+        assert column.tolist() == [expected[(user, activity_type)] for user in matrix.users.values]
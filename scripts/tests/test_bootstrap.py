@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+from pp_analytics.bootstrap import bootstrap_intervals, rank_against
+
+
+def test_rank_against_splits_on_whole_interval():
+    intervals = pd.DataFrame({
+        'mape': [50.0, 12.0, 30.0, 8.0, 21.0],
+        'mape_low': [40.0, 10.0, 5.0, 6.0, 20.5],
+        'mape_high': [60.0, 14.0, 80.0, 9.0, 22.0],
+    }, index=['a', 'b', 'c', 'd', 'e'])
+
+    worst, best = rank_against(intervals, 20.0)
+
+    assert worst.index.tolist() == ['a', 'e']
+    assert best.index.tolist() == ['d', 'b']
+
+
+def test_rank_against_never_lists_a_category_twice():
+    rng = np.random.default_rng(1)
+    keys = rng.choice(['a', 'b', 'c', 'd', 'e', 'f'], size=600)
+    # Occasional wild errors give wide, overlapping intervals
+    pct_error = rng.exponential(25, size=600) * np.where(rng.random(600) < 0.03, 40, 1)
+    intervals = bootstrap_intervals(keys, pct_error * 3, pct_error, resamples=200, workers=1)
+
+    worst, best = rank_against(intervals, pct_error.mean())
+
+    assert not set(worst.index) & set(best.index)
+    assert (worst['mape_low'] > pct_error.mean()).all()
+    assert (best['mape_high'] < pct_error.mean()).all()
@@ -0,0 +1,106 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from pp_analytics.cohorts import CohortStore, REOPEN_DAYS, date_week
+from pp_analytics.columns import NAT
+
+_DAY_NS = 86_400 * 1_000_000_000
+
+
+def day_ns(day, hour=12):
+    return ((day - date(1970, 1, 1)).days * 24 + hour) * 3_600_000_000_000
+
+
+def sessions(rows):
+    """Session columns from (userId, date) rows."""
+    users = pd.Categorical([user for user, _ in rows])
+    guest = np.zeros(len(rows), dtype=bool)
+    times = np.array([day_ns(day) for _, day in rows], dtype=np.int64)
+    return users, guest, times
+
+
+def test_overlap_refold_counts_once(tmp_path):
+    rng = np.random.default_rng(0)
+    start = date(2026, 1, 5)
+    rows = [(f'u{u}', start + timedelta(days=int(d)))
+            for u, d in zip(rng.integers(0, 40, 600), rng.integers(0, 60, 600))]
+    rows.sort(key=lambda row: row[1])
+    ids = [f'u{u}' for u in range(40)]
+    created = np.array([day_ns(start)] * 20 + [NAT] * 20, dtype=np.int64)
+    now = day_ns(date(2026, 6, 1))
+
+    full = CohortStore(str(tmp_path / 'full'))
+    full.add_users(ids, created)
+    full.add_sessions(*sessions(rows), now=now)
+
+    # Each run sees everything so far, so the REOPEN_DAYS overlap is seen twice
+    path = str(tmp_path / 'incremental')
+    for end in (20, 21, 35, 60):
+        store = CohortStore(path)
+        store.add_users(ids, created)
+        seen = [row for row in rows if row[1] < start + timedelta(days=end)]
+        store.add_sessions(*sessions(seen), now=now)
+        store.save()
+
+    store = CohortStore(path)
+    assert store.cells == full.cells
+    assert store.users.sort_index().equals(full.users.sort_index())
+    assert store.sessions_through == full.sessions_through
+    assert store.fold_from == full.sessions_through - REOPEN_DAYS * _DAY_NS
+
+
+def test_users_without_created_join_first_session_week(tmp_path):
+    store = CohortStore(str(tmp_path))
+    store.add_users(['a', 'b'], np.array([day_ns(date(2026, 3, 2)), NAT], dtype=np.int64))
+    store.add_sessions(*sessions([('b', date(2026, 3, 20)), ('b', date(2026, 3, 10)), ('c', date(2026, 3, 31))]),
+                       now=day_ns(date(2026, 4, 1)))
+
+    assert store.users['a'] == date_week(date(2026, 3, 2))
+    assert store.users['b'] == date_week(date(2026, 3, 10))
+    assert store.users['c'] == date_week(date(2026, 3, 31))
+    week = date_week(date(2026, 3, 10))
+    assert store.cells == {(week, 0): 1, (week, 1): 1, (date_week(date(2026, 3, 31)), 0): 1}
+
+
+def test_sessions_before_signup_ignored(tmp_path):
+    store = CohortStore(str(tmp_path))
+    signup = date(2026, 3, 16)
+    store.add_users(['a'], np.array([day_ns(signup)], dtype=np.int64))
+    store.add_sessions(*sessions([('a', date(2026, 3, 2)), ('a', date(2026, 3, 23))]),
+                       now=day_ns(date(2026, 4, 1)))
+
+    assert store.cells == {(date_week(signup), 1): 1}
+    assert store.table(last_week=date(2026, 3, 23))['active_users'].tolist() == [0, 1]
+
+
+def test_reload_after_save(tmp_path):
+    store = CohortStore(str(tmp_path))
+    store.add_users(['a', 'b'], np.array([day_ns(date(2026, 3, 2))] * 2, dtype=np.int64))
+    store.add_sessions(*sessions([('a', date(2026, 3, 3)), ('b', date(2026, 3, 12)), ('c', date(2026, 3, 13))]),
+                       now=day_ns(date(2026, 4, 1)))
+    store.save()
+
+    loaded = CohortStore(str(tmp_path))
+    assert loaded.cells == store.cells
+    assert loaded.users.sort_index().equals(store.users.sort_index())
+    assert loaded.sessions_through == store.sessions_through
+    pd.testing.assert_frame_equal(loaded.table(), store.table())
+
+    # Weeks already saved are checked, so the same sessions add nothing
+    assert loaded.add_sessions(*sessions([('b', date(2026, 3, 12)), ('c', date(2026, 3, 13))]),
+                               now=day_ns(date(2026, 4, 1))) == 0
+
+
+def test_future_sessions_wait_for_their_time(tmp_path):
+    store = CohortStore(str(tmp_path))
+    rows = [('a', date(2026, 3, 2)), ('b', date(2026, 3, 3)), ('b', date(2027, 1, 1))]
+    store.add_sessions(*sessions(rows), now=day_ns(date(2026, 3, 4)))
+
+    assert store.sessions_through == day_ns(date(2026, 3, 3))
+    assert 'b' in store.users and store.cells == {(date_week(date(2026, 3, 2)), 0): 2}
+
+    # Once its time comes the session is folded in
+    assert store.add_sessions(*sessions(rows), now=day_ns(date(2027, 1, 2))) == 1
+    assert store.sessions_through == day_ns(date(2027, 1, 1))
@@ -0,0 +1,74 @@
+import random
+
+import pytest
+
+from pp_analytics.local import LocalClient, LocalCollectionGroup, LocalQuery, write_fixture
+from pp_analytics.scans import AUTO_ID_ALPHABET, scan_documents
+
+
+class Flaky(Exception):
+    """A transient error (deadline, unavailable) injected into streams."""
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    rng = random.Random(0)
+    ids = [''.join(rng.choice(AUTO_ID_ALPHABET) for _ in range(20)) for _ in range(500)]
+    # Ids that aren't auto-generated are covered by the ranges too
+    ids += ['0', 'user-1', 'zzz', '~custom']
+    write_fixture(tmp_path / 'data', 'items', {doc_id: {'n': i} for i, doc_id in enumerate(ids)})
+    monkeypatch.setattr('pp_analytics.scans.retryable_errors', lambda: (Flaky,))
+    monkeypatch.setattr('pp_analytics.scans.random.uniform', lambda low, high: 0.0)  # no backoff
+    return LocalClient(str(tmp_path / 'data'))
+
+
+def expected(db):
+    return [(doc.id, doc.to_dict()) for doc in db.collection('items').stream()]
+
+
+def scan(db, partitions):
+    return [(doc.id, doc.to_dict()) for doc in scan_documents(db, 'items', partitions=partitions, max_workers=4)]
+
+
+def test_failed_streams_resume_after_the_last_document(db, monkeypatch):
+    documents = expected(db)
+    stream = LocalQuery.stream
+    starts = []
+
+    def flaky_stream(query):
+        # Every stream fails after 7 documents, so each range is resumed many times
+        starts.append(query._start)
+        for count, doc in enumerate(stream(query)):
+            if count == 7:
+                raise Flaky("deadline exceeded")
+            yield doc
+
+    monkeypatch.setattr(LocalQuery, 'stream', flaky_stream)
+
+    assert scan(db, 4) == documents
+    resumed = [start for start in starts if start is not None and not start[1]]
+    assert len(resumed) >= 504 // 7 - 4  # all but the last stream of each range failed
+
+
+def test_other_errors_are_raised(db, monkeypatch):
+    def broken_stream(query):
+        raise ValueError("bad query")
+        yield
+
+    monkeypatch.setattr(LocalQuery, 'stream', broken_stream)
+    with pytest.raises(ValueError):
+        scan(db, 4)
+
+
+@pytest.mark.parametrize('partitions', [1, 2, 3, 7, 16, 64])
+def test_output_is_the_same_for_any_partition_count(db, partitions):
+    assert scan(db, partitions) == expected(db)
+
+
+@pytest.mark.parametrize('partitions', [2, 16])
+def test_auto_id_split_covers_every_id(db, monkeypatch, partitions):
+    def no_partitions(group, partition_count):
+        raise NotImplementedError
+
+    monkeypatch.setattr(LocalCollectionGroup, 'get_partitions', no_partitions)
+    assert scan(db, partitions) == expected(db)
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from pp_analytics.local import LocalClient, write_fixture
+from pp_analytics.sessions import load_sessions, merge_operations
+from pp_analytics.writes import execute_writes
+
+T0 = datetime(2026, 9, 1, tzinfo=timezone.utc)
+
+
+def session(user, seconds, **extra):
+    return dict({'userId': user, 'startTime': T0 + timedelta(seconds=seconds), 'duration': 5000}, **extra)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setenv('PP_SNAPSHOT_DIR', str(tmp_path / 'snapshots'))
+    write_fixture(tmp_path / 'data', 'sessions', {
+        'a1': session('alice', 0, mergedSessionIds=['a0']),
+        'a2': session('alice', 10),
+        'a3': session('alice', 20),
+        'b1': session('bob', 0),
+        'b2': session('bob', 30),
+        'c1': session('carol', 0),
+    })
+    return LocalClient(str(tmp_path / 'data'))
+
+
+def bursts(db):
+    return load_sessions(db.collection('sessions').stream()).bursts(60)
+
+
+def ids(db):
+    return sorted(doc.id for doc in db.collection('sessions').stream())
+
+
+def test_merge_adds_to_merged_session_ids(db):
+    result = execute_writes(db, merge_operations(db, bursts(db)), verbose=False)
+
+    assert (result['written'], result['groups_written']) == (5, 2)
+    assert ids(db) == ['a1', 'b1', 'c1']
+    kept = db.collection('sessions').document('a1').get().to_dict()
+    assert kept['mergedSessionIds'] == ['a0', 'a2', 'a3']
+    assert kept['duration'] == 25000
+
+
+def test_failed_merge_deletes_nothing(db):
+    found = bursts(db)
+    # Bob's kept session disappears before the merge, so its update fails
+    db.collection('sessions').document('b1').delete()
+
+    result = execute_writes(db, merge_operations(db, found), batch_size=3, max_retries=0, verbose=False)
+
+    assert (result['groups_written'], result['failed']) == (1, 2)
+    assert ids(db) == ['a1', 'b2', 'c1']
+
+
+def test_long_burst_is_merged_in_batch_sized_runs(db):
+    groups = list(merge_operations(db, bursts(db), max_sessions=2))
+
+    assert [[operation[1].id for operation in group] for group in groups] == [['a1', 'a2'], ['b1', 'b2']]
@@ -0,0 +1,40 @@
+import pytest
+
+from pp_analytics import local
+from pp_analytics.local import LocalClient, write_fixture
+from pp_analytics.snapshot import iter_collection, iter_document_ids, read_manifest
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setenv('PP_SNAPSHOT_DIR', str(tmp_path / 'snapshots'))
+    write_fixture(tmp_path / 'data', 'listings', {f'doc{i}': {'title': f'item {i}', 'price': i} for i in range(5)})
+    return LocalClient(str(tmp_path / 'data'))
+
+
+@pytest.mark.parametrize('partitions', [1, 3])
+def test_id_scan_fetches_no_fields(db, monkeypatch, partitions):
+    monkeypatch.setenv('PP_SCAN_PARTITIONS', str(partitions))
+    monkeypatch.setattr('pp_analytics.scans.MIN_PARTITION_DOCS', 1)
+    # A stale snapshot projected to 'title': its fields must not be fetched for an id scan
+    list(iter_collection(db, 'listings', fields=['title']))
+    snapshot = read_manifest()['listings']
+
+    selected = []
+    fetched = []
+    stream = local.LocalQuery.stream
+
+    def recording_stream(query):
+        selected.append(query._fields)
+        for doc in stream(query):
+            fetched.append(doc.to_dict())
+            yield doc
+
+    monkeypatch.setattr(local.LocalQuery, 'stream', recording_stream)
+    batches = list(iter_document_ids(db, 'listings', ttl_hours=0, incremental=False, batch_size=2))
+
+    assert batches == [['doc0', 'doc1'], ['doc2', 'doc3'], ['doc4']]
+    assert len(selected) == partitions
+    assert all(fields == [] for fields in selected)
+    assert fetched == [{}] * 5
+    assert read_manifest()['listings'] == snapshot
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from pp_analytics.local import LocalClient, write_fixture
+from pp_analytics.snapshot import decode_document, read_manifest, read_rows
+from pp_analytics.sync import sync_collection
+
+T0 = datetime(2026, 10, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def snapshots(tmp_path):
+    return str(tmp_path / 'snapshots')
+
+
+@pytest.fixture
+def db(tmp_path):
+    users = {f'u{i}': {'createdAt': T0 + timedelta(hours=i), 'name': f'user {i}'} for i in range(5)}
+    write_fixture(tmp_path / 'data', 'users', users)
+    return LocalClient(str(tmp_path / 'data'))
+
+
+def local_users(snapshots):
+    ids, payloads = read_rows('users', snapshots)
+    return {doc_id: decode_document(payload) for doc_id, payload in zip(ids, payloads)}
+
+
+def test_boundary_documents_are_fetched_again_harmlessly(db, snapshots):
+    assert sync_collection(db, 'users', snapshots)['mode'] == 'full'
+    # Written in the same instant as the newest document synced
+    db.collection('users').document('u9').set({'createdAt': T0 + timedelta(hours=4), 'name': 'late'})
+
+    first = sync_collection(db, 'users', snapshots, reconcile=False)
+    after_first = local_users(snapshots)
+    second = sync_collection(db, 'users', snapshots, reconcile=False)
+
+    # >= re-reads the documents at the watermark: u4 and u9, twice
+    assert (first['mode'], first['fetched'], first['doc_count']) == ('delta', 2, 6)
+    assert (second['fetched'], second['doc_count']) == (2, 6)
+    assert local_users(snapshots) == after_first
+    assert after_first['u9']['name'] == 'late'
+
+
+def test_deletes_are_dropped_by_reconcile(db, snapshots, monkeypatch):
+    sync_collection(db, 'users', snapshots)
+    db.collection('users').document('u1').delete()
+    # No createdAt: a delta query can't see it
+    db.collection('users').document('u7').set({'name': 'imported'})
+
+    delta = sync_collection(db, 'users', snapshots, reconcile=False)
+    assert (delta['deleted'], delta['doc_count']) == (0, 5)
+    assert 'u1' in local_users(snapshots)
+
+    # Due again once PP_SYNC_RECONCILE_HOURS have passed since the last one
+    monkeypatch.setenv('PP_SYNC_RECONCILE_HOURS', '0')
+    reconciled = sync_collection(db, 'users', snapshots)
+    assert (reconciled['mode'], reconciled['deleted'], reconciled['doc_count']) == ('reconcile', 1, 5)
+    assert sorted(local_users(snapshots)) == ['u0', 'u2', 'u3', 'u4', 'u7']
+    assert read_manifest(snapshots)['users']['reconciled_at'] == read_manifest(snapshots)['users']['fetched_at']
+
+
+def test_timestamp_and_string_watermarks_are_kept_apart(db, snapshots):
+    users = db.collection('users')
+    users.document('s1').set({'createdAt': '2026-10-02T00:00:00Z'})
+    sync_collection(db, 'users', snapshots)
+
+    marks = read_manifest(snapshots)['users']['watermarks']['createdAt']
+    assert marks == {'timestamp': (T0 + timedelta(hours=4)).isoformat(), 'string': '2026-10-02T00:00:00Z'}
+
+    # Each kind is compared with its own watermark: an ISO string is not
+    # behind a timestamp watermark, however the two would order
+    users.document('s2').set({'createdAt': '2026-10-01T00:00:00Z'})  # older than the string watermark
+    users.document('s3').set({'createdAt': '2026-10-03T00:00:00Z'})
+    users.document('t1').set({'createdAt': T0 + timedelta(days=1)})
+
+    result = sync_collection(db, 'users', snapshots, reconcile=False)
+
+    # u4 and s1 (at their watermarks), s3 and t1; not s2
+    assert result['fetched'] == 4
+    assert 's2' not in local_users(snapshots) and {'s3', 't1'} <= set(local_users(snapshots))
+    marks = read_manifest(snapshots)['users']['watermarks']['createdAt']
+    assert marks == {'timestamp': (T0 + timedelta(days=1)).isoformat(), 'string': '2026-10-03T00:00:00Z'}
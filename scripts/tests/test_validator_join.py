@@ -0,0 +1,164 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from ai_accuracy_validator import (
+    FEEDBACK_COLUMNS,
+    LISTING_COLUMNS,
+    SOLD_STAGES,
+    first_sales,
+    join_sold_events,
+    listing_index,
+    resolve_listings,
+)
+from pp_analytics.accuracy import MATCH_COLUMNS
+from pp_analytics.columns import NAT, epoch_ns, to_columns
+from pp_analytics.local import LocalClient, write_fixture
+
+DAY = datetime(2026, 9, 1, tzinfo=timezone.utc)
+
+# Listings stream in doc id order: L1, L2, L3, L5, L6, L7, M1
+LISTINGS = {
+    'L1': {'id': 'M1', 'pricingStrategy': {'listingPrice': 100},
+           'itemIdentification': {'category': 'toys', 'observedCondition': 'good', 'name': 'Robot'}},
+    'L2': {'pricingStrategy': {'listingPrice': 0, 'optimal': 50}, 'category': 'tools', 'condition': 'fair',
+           'itemName': 'Saw'},
+    # Its alias is written after L1's doc id, so listingId 'L1' is this listing
+    'L3': {'id': 'L1', 'pricingStrategy': {'listingPrice': 80}, 'itemIdentification': {'name': 'Drone'}},
+    # A doc id written after L1's alias, so listingId 'M1' is this listing
+    'M1': {'pricingStrategy': {'optimal': 120}, 'category': 'games'},
+    'L5': {'pricingStrategy': {'listingPrice': float('nan'), 'optimal': 60}},
+    'L6': {'pricingStrategy': {}},
+    'L7': {'pricingStrategy': {'listingPrice': 40}, 'category': 'books'},
+}
+
+
+def sold(listing_id, days=None, value=None, metadata=None, stage='sold'):
+    data = {'stage': stage, 'listingId': listing_id}
+    if days is not None:
+        data['createdAt'] = DAY + timedelta(days=days)
+    if value is not None:
+        data['value'] = value
+    if metadata is not None:
+        data['metadata'] = metadata
+    return data
+
+
+FEEDBACK = {
+    'f01': sold('L1', 3, {'actualPrice': 90}),
+    'f02': sold('M1', 1, 'x', {'soldPrice': 130}, stage='SOLD'),
+    'f03': sold('L2', 2, {'actualPrice': 0, 'soldPrice': 45}),
+    'f04': sold('L2', 1, {'soldPrice': 55}),
+    'f05': sold('L5', 1, {'actualPrice': 70}),
+    'f06': sold('L6', 1, {'actualPrice': 70}),
+    'f07': sold('L1', 1, {'actualPrice': float('nan'), 'soldPrice': 90}),
+    'f08': sold('L7', 2, {'actualPrice': 35}),
+    'f09': sold('missing', 1, {'actualPrice': 10}),
+    'f10': sold('L1', 0, {'actualPrice': 10}, stage='listed'),
+    'f11': sold('L1', None, {'actualPrice': 95}),
+    'f12': sold('M1', 0, {}, {'actualPrice': 100}),
+    'f13': sold('L2', 1, {'actualPrice': 65}),
+}
+
+
+def old_matches(feedback, listings, earlier):
+    """The per-event loop the join replaced, then the earliest sold event per listing."""
+    by_id = {}
+    for listing in listings:
+        data = listing.to_dict()
+        by_id[listing.id] = (listing.id, data)
+        if data.get('id'):
+            by_id[data['id']] = (listing.id, data)
+
+    matches = []
+    for event in feedback:
+        data = event.to_dict()
+        listing_id = data.get('listingId')
+        value = data.get('value')
+        metadata = data.get('metadata', {})
+        if data.get('stage') not in SOLD_STAGES or not listing_id or listing_id not in by_id:
+            continue
+        listing, listing_data = by_id[listing_id]
+        pricing_strategy = listing_data.get('pricingStrategy', {})
+        ai_price = pricing_strategy.get('listingPrice') or pricing_strategy.get('optimal')
+        actual_price = None
+        if isinstance(value, dict):
+            actual_price = value.get('actualPrice') or value.get('soldPrice')
+        elif metadata:
+            actual_price = metadata.get('actualPrice') or metadata.get('soldPrice')
+        if not (ai_price and actual_price and ai_price > 0 and actual_price > 0):
+            continue
+        error = actual_price - ai_price
+        item_id = listing_data.get('itemIdentification', {})
+        matches.append({
+            'outcome_id': event.id,
+            'listing': listing,
+            'listing_id': listing_id,
+            'category': item_id.get('category') or listing_data.get('category', 'unknown'),
+            'condition': item_id.get('observedCondition') or listing_data.get('condition', 'unknown'),
+            'item_name': item_id.get('name') or listing_data.get('itemName', ''),
+            'ai_price': ai_price,
+            'actual_price': actual_price,
+            'error': error,
+            'pct_error': abs(error) / actual_price * 100,
+            'direction': 'over' if ai_price > actual_price else 'under' if ai_price < actual_price else 'exact',
+            'sold_at': epoch_ns(data.get('createdAt')),
+        })
+
+    sold_listings = {by_id[listing_id][0] for listing_id in earlier if listing_id in by_id}
+    kept = []
+    for match in sorted(matches, key=lambda m: m['sold_at'] if m['sold_at'] != NAT else np.iinfo(np.int64).max):
+        if match['listing'] not in sold_listings:
+            sold_listings.add(match['listing'])
+            kept.append(match)
+    order = [event.id for event in feedback]
+    return sorted(kept, key=lambda m: order.index(m['outcome_id']))
+
+
+def new_matches(feedback, listings, earlier):
+    """join_sold_events() and first_sales(), as the validator runs them."""
+    events = to_columns(feedback, FEEDBACK_COLUMNS)
+    is_sold = events['stage'].isin(SOLD_STAGES).to_numpy() & (np.asarray(events['listing_id'].array.codes) >= 0)
+    listing_frame = to_columns(listings, LISTING_COLUMNS)
+    index = listing_index(listing_frame)
+    joined = join_sold_events(events[is_sold], listing_frame, index)
+    return joined.loc[first_sales(joined, resolve_listings(index, earlier)), MATCH_COLUMNS]
+
+
+@pytest.fixture
+def db(tmp_path):
+    write_fixture(tmp_path / 'data', 'listings', LISTINGS)
+    write_fixture(tmp_path / 'data', 'feedback_events', FEEDBACK)
+    return LocalClient(str(tmp_path / 'data'))
+
+
+@pytest.mark.parametrize('earlier', [[], ['L7'], ['M1', 'L1', 'missing']])
+def test_join_matches_the_per_event_loop(db, earlier):
+    feedback = list(db.collection('feedback_events').stream())
+    listings = list(db.collection('listings').stream())
+
+    expected = old_matches(feedback, listings, earlier)
+    joined = new_matches(feedback, listings, earlier)
+
+    assert joined['outcome_id'].tolist() == [match['outcome_id'] for match in expected]
+    for name in ('listing_id', 'category', 'condition', 'item_name', 'direction', 'sold_at'):
+        assert joined[name].tolist() == [match[name] for match in expected], name
+    for name in ('ai_price', 'actual_price', 'error', 'pct_error'):
+        np.testing.assert_allclose(joined[name].to_numpy(dtype=float), [match[name] for match in expected])
+
+
+def test_join_cases(db):
+    feedback = list(db.collection('feedback_events').stream())
+    listings = list(db.collection('listings').stream())
+
+    joined = new_matches(feedback, listings, ['L7']).set_index('outcome_id')
+
+    # f01 is the alias L3 (80), f02 the later doc id M1 (optimal 120, metadata price)
+    assert joined.loc['f01', ['ai_price', 'item_name']].tolist() == [80, 'Drone']
+    assert joined.loc['f02', ['ai_price', 'actual_price', 'category']].tolist() == [120, 130, 'games']
+    # f04 and f13 sold L2 on the same day: the first in event order counts, f03 is later
+    assert joined.loc['f04', ['ai_price', 'actual_price']].tolist() == [50, 55]
+    # NaN and missing prices, L7 sold before, an unknown listing, no sale,
+    # a value map without prices and a second sale of L3 count for nothing
+    assert sorted(joined.index) == ['f01', 'f02', 'f04']
@@ -0,0 +1,101 @@
+from collections import Counter
+import threading
+
+import pytest
+
+from pp_analytics.local import LocalClient, write_fixture
+from pp_analytics.writes import execute_writes
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setenv('PP_SNAPSHOT_DIR', str(tmp_path / 'snapshots'))
+    write_fixture(tmp_path / 'data', 'items', {f'doc{i}': {'n': i} for i in range(4)})
+    return LocalClient(str(tmp_path / 'data'))
+
+
+def run(db, operations):
+    return execute_writes(db, operations, checkpoint='test', batch_size=2, max_workers=1, max_retries=0,
+                          verbose=False)
+
+
+def interrupted_run(db):
+    # The second batch fails: there is no 'missing' document to update
+    items = db.collection('items')
+    operations = [('update', items.document('doc0'), {'n': 10}), ('update', items.document('doc1'), {'n': 11}),
+                  ('update', items.document('missing'), {'n': 0})]
+    result = run(db, operations)
+    assert (result['written'], result['failed']) == (2, 1)
+    items.document('missing').set({'n': -1})
+    return operations
+
+
+def test_checkpoint_resumes_the_same_operations(db):
+    operations = interrupted_run(db)
+
+    resumed = run(db, operations)
+    assert (resumed['written'], resumed['skipped'], resumed['failed']) == (1, 2, 0)
+
+
+def test_checkpoint_does_not_skip_other_writes_to_the_same_documents(db):
+    operations = interrupted_run(db)
+    items = db.collection('items')
+    operations[0] = ('update', items.document('doc0'), {'n': 20})
+
+    resumed = run(db, operations)
+    assert (resumed['written'], resumed['skipped']) == (3, 0)
+    assert items.document('doc0').get().to_dict() == {'n': 20}
+
+
+def test_expired_checkpoint_is_not_resumed(db, monkeypatch):
+    operations = interrupted_run(db)
+    monkeypatch.setattr('pp_analytics.writes.CHECKPOINT_TTL_HOURS', 0)
+
+    resumed = run(db, operations)
+    assert (resumed['written'], resumed['skipped']) == (3, 0)
+
+
+class InterruptedClient(LocalClient):
+    """Raises KeyboardInterrupt on the given commit; records the documents committed."""
+
+    def __init__(self, path, interrupt_at):
+        super().__init__(path)
+        self.interrupt_at = interrupt_at
+        self.commits = 0
+        self.committed = Counter()
+        self._commits_lock = threading.Lock()
+
+    def _apply(self, operations):
+        with self._commits_lock:
+            self.commits += 1
+            interrupt = self.commits == self.interrupt_at
+        if interrupt:
+            raise KeyboardInterrupt
+        super()._apply(operations)
+        with self._commits_lock:
+            self.committed.update(operation[1].id for operation in operations)
+
+
+def test_interrupted_run_checkpoints_committed_batches(tmp_path, monkeypatch):
+    monkeypatch.setenv('PP_SNAPSHOT_DIR', str(tmp_path / 'snapshots'))
+    write_fixture(tmp_path / 'data', 'items', {f'doc{i}': {'n': i} for i in range(20)})
+    db = InterruptedClient(str(tmp_path / 'data'), interrupt_at=3)
+    items = db.collection('items')
+    operations = [('update', items.document(f'doc{i}'), {'n': -i}) for i in range(20)]
+
+    def write():
+        return execute_writes(db, operations, checkpoint='test', batch_size=2, max_workers=2, max_retries=0,
+                              verbose=False)
+
+    with pytest.raises(KeyboardInterrupt):
+        write()
+    # Batches past the in-flight window were never started
+    assert db.commits < 10
+    first = sum(db.committed.values())
+    assert first > 0
+
+    db.interrupt_at = None
+    resumed = write()
+    assert (resumed['skipped'], resumed['written'], resumed['failed']) == (first, 20 - first, 0)
+    assert set(db.committed.values()) == {1}
+    assert [items.document(f'doc{i}').get().to_dict() for i in range(20)] == [{'n': -i} for i in range(20)]
@@ -11,33 +11,99 @@ Analyzes sessions, activities, and user_stats collections to understand:
 Run: python scripts/user_engagement_analysis.py
 """
 
-from google.cloud import firestore
-from google.oauth2 import service_account
-from datetime import datetime, timedelta
-from collections import defaultdict
-import pandas as pd
-import os
-
-# Initialize Firestore with service account
-script_dir = os.path.dirname(os.path.abspath(__file__))
-project_dir = os.path.dirname(script_dir)
-key_path = os.path.join(project_dir, 'serviceAccountKey.json')
-
-if os.path.exists(key_path):
-    credentials = service_account.Credentials.from_service_account_file(key_path)
-    db = firestore.Client(credentials=credentials, project=credentials.project_id)
-else:
-    print(f"ERROR: Service account key not found at: {key_path}")
-    print("\nTo fix this:")
-    print("1. Go to Firebase Console → Project Settings → Service Accounts")
-    print("2. Click 'Generate new private key'")
-    print("3. Save the file as 'serviceAccountKey.json' in your project root")
-    print(f"   Expected location: {key_path}")
-    exit(1)
-
-
-def analyze_user_engagement():
-    """Main engagement analysis function."""
+from datetime import datetime, timedelta, timezone
+
+from pp_analytics.active_users import HISTORY_DAYS, update_active_users, utc_today
+from pp_analytics.activity_matrix import ACTIVITY_COLUMNS, ActivityMatrix, popcount
+from pp_analytics.aggregations import aggregate_collection, count_documents
+from pp_analytics.client import CredentialsNotFound, client, print_credentials_help
+from pp_analytics.cohorts import CohortStore, date_week, week_start
+from pp_analytics.columns import (
+    DICTIONARY,
+    FLOAT,
+    NAT,
+    PRESENT,
+    TIMESTAMP,
+    epoch_ns,
+    iter_column_batches,
+    to_columns,
+)
+from pp_analytics.fetch import add_fetch_arguments, fetch_collections
+from pp_analytics.fields import report_fields
+from pp_analytics.scans import add_scan_arguments, configure_scans_from_args
+from pp_analytics.snapshot import ROW_GROUP_SIZE, add_snapshot_arguments, iter_collection
+from pp_analytics.trace import add_trace_arguments, configure_from_args, section, traced_report
+from pp_analytics.windows import utc_cutoff
+
+# Typed columns read from each session document (see pp_analytics/columns.py)
+SESSION_COLUMNS = {
+    'user': ('userId', DICTIONARY),
+    'guest': ('isGuest', PRESENT),
+    'start': ('startTime', TIMESTAMP),
+    'last_activity': ('lastActivity', TIMESTAMP),
+    'duration': ('duration', FLOAT),
+    'device_type': ('deviceInfo.type', DICTIONARY),
+    'browser': ('deviceInfo.browser', DICTIONARY),
+}
+
+USER_COLUMNS = {
+    'created': ('createdAt', TIMESTAMP),
+}
+
+COHORT_WEEKS = 8  # cohorts and weeks since signup shown in the report
+
+
+def summarize_user_stats(db, refresh=False, snapshot_ttl=None, tables=None):
+    """
+    Engagement tiers and totals from user_stats, using aggregation queries.
+
+    Tiers are filtered counts on totalAnalyses (documents without it count
+    as inactive), so no user_stats document is downloaded.
+    """
+    options = {'refresh': refresh, 'ttl_hours': snapshot_ttl, 'tables': tables}
+    totals = aggregate_collection(db, 'user_stats', sums=['totalAnalyses', 'totalImages'], **options)
+    at_least = {
+        n: count_documents(db, 'user_stats', filters=[('totalAnalyses', '>=', n)], **options)
+        for n in (1, 3, 10)
+    }
+    return {
+        'total_tracked': totals['count'],
+        'power_users': at_least[10],  # 10+ analyses
+        'regular_users': at_least[3] - at_least[10],  # 3-9 analyses
+        'casual_users': at_least[1] - at_least[3],  # 1-2 analyses
+        'inactive_users': totals['count'] - at_least[1],  # 0 analyses
+        'total_analyses': totals['sum:totalAnalyses'],
+        'total_images': totals['sum:totalImages'],
+    }
+
+
+@traced_report('user_engagement')
+def analyze_user_engagement(refresh=False, snapshot_ttl=None, incremental=None,
+                            fetch_concurrency=None, quick=False, window_days=None, active_users_csv=None,
+                            cohorts_csv=None, db=None, tables=None):
+    """
+    Main engagement analysis function.
+
+    Args:
+        refresh: If True, re-fetch collections from Firestore instead of using local snapshots.
+        snapshot_ttl: Max age in hours of a local snapshot (default: PP_SNAPSHOT_TTL_HOURS or 12).
+        incremental: If True, update stale snapshots with a delta sync (default: PP_SNAPSHOT_INCREMENTAL).
+        fetch_concurrency: Max collections fetched at once (default: PP_FETCH_CONCURRENCY or all).
+        quick: If True, only print the headline totals, from aggregation queries.
+        window_days: If set (30 or more), only read sessions and activities from the
+            last window_days days, filtered server-side. DAU/MAU are unchanged; the
+            activity, funnel and session sections then cover the window only.
+        active_users_csv: If set, write the daily DAU/WAU/MAU series (last HISTORY_DAYS days) to this CSV.
+        cohorts_csv: If set, write the cohort retention table (every signup week) to this CSV.
+        db: Firestore client (default: the shared, lazily created client; see pp_analytics/client.py).
+        tables: Collections already loaded this run (see run_reports.py), used instead of fetching.
+    """
+    import pandas as pd
+
+    if db is None:
+        db = client
+    if window_days is not None and window_days < 30:
+        raise ValueError("window_days must be at least 30 (MAU looks back 30 days)")
 
     # Get date ranges
     now = datetime.now()
@@ -47,108 +113,198 @@ def analyze_user_engagement():
     print("Fetching data from Firestore...")
 
     # Fetch collections
-    sessions = list(db.collection('sessions').stream())
-    activities = list(db.collection('activities').stream())
-    users = list(db.collection('users').stream())
-    user_stats = list(db.collection('user_stats').stream())
+    if quick:
+        session_count = count_documents(db, 'sessions', refresh=refresh, ttl_hours=snapshot_ttl, tables=tables)
+        activity_count = count_documents(db, 'activities', refresh=refresh, ttl_hours=snapshot_ttl, tables=tables)
+    else:
+        windows = None
+        if window_days is not None:
+            cutoff = utc_cutoff(now - timedelta(days=window_days))
+            windows = {
+                'sessions': [[('startTime', '>', cutoff)], [('lastActivity', '>', cutoff)]],
+                'activities': [[('timestamp', '>', cutoff)]],
+            }
+        fields = report_fields('user_engagement')
+        # Activities are only counted into the user x activity matrix, so
+        # unless windowed they are streamed rather than loaded
+        loaded = ['sessions', 'users'] if window_days is None else ['sessions', 'users', 'activities']
+        collections, _ = fetch_collections(
+            db, loaded,
+            max_workers=fetch_concurrency, refresh=refresh, ttl_hours=snapshot_ttl, incremental=incremental,
+            fields=fields, windows=windows,
+            tables=tables,
+        )
+        sessions = collections['sessions']
+        users = collections['users']
+        if window_days is None:
+            activities = iter_collection(db, 'activities', refresh=refresh, ttl_hours=snapshot_ttl,
+                                         incremental=incremental, fields=fields['activities'], tables=tables)
+        else:
+            activities = collections['activities']
+        activity_matrix = ActivityMatrix()
+        for batch in iter_column_batches(activities, ACTIVITY_COLUMNS, batch_size=ROW_GROUP_SIZE):
+            activity_matrix.add(batch)
+
+        if window_days is None:
+            session_count = len(sessions)
+            activity_count = activity_matrix.activity_count
+        else:
+            session_count = count_documents(db, 'sessions', refresh=refresh, ttl_hours=snapshot_ttl, tables=tables)
+            activity_count = count_documents(db, 'activities', refresh=refresh, ttl_hours=snapshot_ttl, tables=tables)
+    user_count = count_documents(db, 'users', refresh=refresh, ttl_hours=snapshot_ttl, tables=tables)
+    stats = summarize_user_stats(db, refresh=refresh, snapshot_ttl=snapshot_ttl, tables=tables)
 
     print(f"\n{'='*60}")
     print("USER ENGAGEMENT REPORT - Precision Prices")
     print(f"{'='*60}")
     print(f"Report Generated: {now.strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"\nTotal Users: {len(users)}")
-    print(f"Total Sessions: {len(sessions)}")
-    print(f"Total Activities: {len(activities)}")
+    if window_days is not None:
+        print(f"Window: sessions/activities from the last {window_days} days "
+              f"({len(sessions)} sessions, {activity_matrix.activity_count} activities)")
+    print(f"\nTotal Users: {user_count}")
+    print(f"Total Sessions: {session_count}")
+    print(f"Total Activities: {activity_count}")
+
+    if quick:
+        print(f"Total Analyses Across All Users: {stats['total_analyses']}")
+        print(f"Total Images Uploaded: {stats['total_images']}")
+        if stats['total_tracked'] > 0:
+            print(f"Avg Analyses per User: {stats['total_analyses']/stats['total_tracked']:.1f}")
+        print(f"\n{'='*60}")
+        return {
+            'total_users': user_count,
+            'total_sessions': session_count,
+            'total_activities': activity_count,
+            'total_analyses': stats['total_analyses'],
+            'total_images': stats['total_images'],
+        }
 
     # ===========================================
     # ACTIVE USER ANALYSIS (DAU/MAU)
     # ===========================================
-    active_7d = set()
-    active_30d = set()
-    guest_sessions_7d = 0
-    guest_sessions_30d = 0
-    session_data = []
-
-    for session in sessions:
-        data = session.to_dict()
-        # Your schema uses 'startTime' for session timestamp
-        session_time = data.get('startTime') or data.get('lastActivity')
-        user_id = data.get('userId')
-        is_guest = data.get('isGuest', False)
-
-        if session_time:
-            # Handle Firestore timestamp
-            if hasattr(session_time, 'timestamp'):
-                session_time = session_time.timestamp()
-                session_dt = datetime.fromtimestamp(session_time)
-            else:
-                session_dt = session_time
-
-            if session_dt > last_7_days:
-                if user_id and not is_guest:
-                    active_7d.add(user_id)
-                else:
-                    guest_sessions_7d += 1
-
-            if session_dt > last_30_days:
-                if user_id and not is_guest:
-                    active_30d.add(user_id)
-                else:
-                    guest_sessions_30d += 1
-
-        # Session duration in milliseconds per your schema
-        duration_ms = data.get('duration', 0) or 0
-        session_data.append({
-            'user_id': user_id,
-            'is_guest': is_guest,
-            'timestamp': session_time,
-            'duration_seconds': duration_ms / 1000 if duration_ms else 0,
-            'device_type': data.get('deviceInfo', {}).get('type', 'unknown'),
-            'browser': data.get('deviceInfo', {}).get('browser', 'unknown'),
-        })
-
-    total_users = len(users) if users else 1  # Avoid division by zero
-
+    import numpy as np
+
+    session_columns = to_columns(sessions, SESSION_COLUMNS)
+    user_codes = session_columns['user'].array.codes
+    # Your schema uses 'startTime' for session timestamp
+    start = session_columns['start'].to_numpy()
+    session_time = np.where(start != NAT, start, session_columns['last_activity'].to_numpy())
+    registered = (user_codes >= 0) & ~session_columns['guest'].to_numpy()
+
+    def active_since(cutoff):
+        """(distinct registered users, guest sessions) with a session after cutoff."""
+        recent = (session_time != NAT) & (session_time > epoch_ns(cutoff))
+        return len(np.unique(user_codes[recent & registered])), int((recent & ~registered).sum())
+
+    active_7d, guest_sessions_7d = active_since(last_7_days)
+    active_30d, guest_sessions_30d = active_since(last_30_days)
+
+    # Session duration in milliseconds per your schema
+    duration_ms = np.nan_to_num(session_columns['duration'].to_numpy())
+    session_data = pd.DataFrame({
+        'duration_seconds': duration_ms / 1000,
+        'device_type': session_columns['device_type'].astype(object).fillna('unknown'),
+        'browser': session_columns['browser'].astype(object).fillna('unknown'),
+    })
+
+    # Per-day user sketches: each day is built once and kept (see pp_analytics/active_users.py)
+    first_day = None
+    if window_days is not None:
+        first_day = (now - timedelta(days=window_days)).astimezone(timezone.utc).date() + timedelta(days=1)
+    active_users = update_active_users(session_columns['id'].to_numpy(), session_columns['user'].array,
+                                       session_columns['guest'].to_numpy(), session_time, first_day=first_day)
+
+    total_users = user_count if user_count else 1  # Avoid division by zero
+
+    section("ACTIVE USERS (DAU/MAU)")
     print(f"\n{'='*60}")
     print("ACTIVE USERS (DAU/MAU)")
     print(f"{'='*60}")
-    print(f"DAU (7-day active registered users): {len(active_7d)}")
-    print(f"MAU (30-day active registered users): {len(active_30d)}")
+    print(f"DAU (7-day active registered users): {active_7d}")
+    print(f"MAU (30-day active registered users): {active_30d}")
     print(f"Guest sessions (7-day): {guest_sessions_7d}")
     print(f"Guest sessions (30-day): {guest_sessions_30d}")
-    print(f"7-day Retention Rate: {len(active_7d)/total_users*100:.1f}%")
-    print(f"30-day Retention Rate: {len(active_30d)/total_users*100:.1f}%")
+    print(f"Users active in the last 7 days: {active_7d/total_users*100:.1f}%")
+    print(f"Users active in the last 30 days: {active_30d/total_users*100:.1f}%")
 
-    if len(active_30d) > 0:
-        print(f"Stickiness (DAU/MAU): {len(active_7d)/len(active_30d)*100:.1f}%")
+    if active_30d > 0:
+        print(f"Stickiness (DAU/MAU): {active_7d/active_30d*100:.1f}%")
+
+    # ===========================================
+    # ACTIVE USER TRENDS (daily sketches)
+    # ===========================================
+    section("ACTIVE USER TRENDS")
+    print(f"\n{'='*60}")
+    print("ACTIVE USER TRENDS")
+    print(f"{'='*60}")
+
+    today = utc_today()
+    last_day = today - timedelta(days=1)  # last complete UTC day
+    trend = active_users.series(today - timedelta(days=HISTORY_DAYS - 1), last_day)
+    latest = trend.iloc[-1]
+    print(f"Daily active users ({last_day}, UTC): {latest['dau']:.0f}")
+    print(f"Weekly active users (7 days to {last_day}): {latest['wau']:.0f}")
+    print(f"Monthly active users (30 days to {last_day}): {latest['mau']:.0f}")
+    recent = trend.tail(30)
+    if recent['mau'].gt(0).any():
+        print(f"Stickiness (avg DAU/MAU, last 30 days): {recent['stickiness'].mean()*100:.1f}%")
+    print("(approximate distinct counts, ~1% error)")
+
+    weekly = trend.iloc[::-7].head(8).iloc[::-1]
+    print(f"\n{'Week ending':<12} {'avg DAU':>8} {'WAU':>8} {'MAU':>8} {'DAU/MAU':>8}")
+    for day, row in weekly.iterrows():
+        avg_dau = trend.loc[day - timedelta(days=6):day, 'dau'].mean()
+        stickiness = f"{avg_dau/row['mau']*100:.1f}%" if row['mau'] > 0 else '-'
+        print(f"{day.isoformat():<12} {avg_dau:>8.0f} {row['wau']:>8.0f} {row['mau']:>8.0f} {stickiness:>8}")
+
+    if active_users_csv:
+        trend.to_csv(active_users_csv)
+        print(f"\nDaily series ({len(trend)} days) written to {active_users_csv}")
+
+    # ===========================================
+    # COHORT RETENTION (signup week x weeks since signup)
+    # ===========================================
+    section("COHORT RETENTION")
+    print(f"\n{'='*60}")
+    print("COHORT RETENTION (signup week x weeks since signup)")
+    print(f"{'='*60}")
+
+    # Only users and sessions not folded in before are added (see pp_analytics/cohorts.py)
+    user_columns = to_columns(users, USER_COLUMNS)
+    cohorts = CohortStore()
+    new_users = cohorts.add_users(user_columns['id'].to_numpy(), user_columns['created'].to_numpy())
+    if window_days is not None and cohorts.fold_from is None:
+        # The first update needs every session, or older weeks would never be counted
+        print("Not created: the first update needs all sessions; run without --window-days")
+    elif window_days is not None and cohorts.fold_from < epoch_ns(cutoff):
+        # The window doesn't reach back to the previous update: folding it in would skip sessions
+        print(f"Not updated: the last update predates the {window_days}-day window; run without --window-days")
+    else:
+        new_pairs = cohorts.add_sessions(session_columns['user'].array, session_columns['guest'].to_numpy(),
+                                         session_time, now=epoch_ns(now))
+        print(f"Folded in {new_users} new users and {new_pairs} new user-weeks")
+    cohorts.save()
+
+    this_week = date_week(today)
+    retention = cohorts.table(first_cohort=week_start(this_week - COHORT_WEEKS + 1), last_week=today)
+    header = ''.join(f"{f'W{k}':>7}" for k in range(COHORT_WEEKS))
+    print(f"\n{'Signup week':<12} {'Users':>6}{header}")
+    for cohort_week, rows in retention.groupby('cohort_week', sort=True):
+        cells = ''.join(f"{rate*100:>6.1f}%" for rate in rows['retention'].head(COHORT_WEEKS))
+        print(f"{cohort_week.isoformat():<12} {rows['users'].iloc[0]:>6}{cells}")
+    print("(UTC weeks from Monday; W0 is the signup week, the latest week is in progress)")
+
+    if cohorts_csv:
+        cohorts.table(last_week=today).to_csv(cohorts_csv, index=False)
+        print(f"\nCohort retention table written to {cohorts_csv}")
 
     # ===========================================
     # ACTIVITY BREAKDOWN (Feature Adoption)
     # ===========================================
-    activity_types = defaultdict(int)
-    activity_by_user = defaultdict(lambda: defaultdict(int))
-    recent_activities = []
-
-    for activity in activities:
-        data = activity.to_dict()
-        activity_type = data.get('activityType', 'unknown')
-        activity_types[activity_type] += 1
-
-        user_id = data.get('userId') or 'guest'
-        activity_by_user[user_id][activity_type] += 1
-
-        timestamp = data.get('timestamp')
-        if timestamp:
-            if hasattr(timestamp, 'timestamp'):
-                timestamp = datetime.fromtimestamp(timestamp.timestamp())
-            if timestamp > last_7_days:
-                recent_activities.append({
-                    'type': activity_type,
-                    'user_id': user_id,
-                    'page': data.get('page', ''),
-                    'metadata': data.get('metadata', {})
-                })
+    # Counted from activity_matrix (users x activity types) above
+    activity_types = activity_matrix.type_totals()
 
+    section("ACTIVITY BREAKDOWN (Feature Adoption)")
     print(f"\n{'='*60}")
     print("ACTIVITY BREAKDOWN (Feature Adoption)")
     print(f"{'='*60}")
@@ -174,6 +330,7 @@ def analyze_user_engagement():
     # ===========================================
     # USER JOURNEY ANALYSIS
     # ===========================================
+    section("USER JOURNEY COMPLETION RATES")
     print(f"\n{'='*60}")
     print("USER JOURNEY COMPLETION RATES")
     print(f"{'='*60}")
@@ -181,16 +338,13 @@ def analyze_user_engagement():
     # Define the ideal user journey stages
     journey_stages = ['session_start', 'page_view', 'image_upload', 'analysis', 'feedback']
 
-    users_at_stage = defaultdict(set)
-    for user_id, activities in activity_by_user.items():
-        for stage in journey_stages:
-            if activities.get(stage, 0) > 0:
-                users_at_stage[stage].add(user_id)
+    # One bitset per stage: bit i is set if user i has that activity
+    users_at_stage = {stage: activity_matrix.users_with(stage) for stage in journey_stages}
 
     print("\nFunnel Analysis (cumulative users reaching each stage):")
-    prev_count = len(activity_by_user)
+    prev_count = activity_matrix.user_count
     for stage in journey_stages:
-        count = len(users_at_stage[stage])
+        count = popcount(users_at_stage[stage])
         pct = (count / prev_count * 100) if prev_count > 0 else 0
         drop = prev_count - count
         print(f"  {stage}: {count} users ({pct:.1f}% of previous, {drop} dropped)")
@@ -199,32 +353,34 @@ def analyze_user_engagement():
     # ===========================================
     # DROP-OFF ANALYSIS
     # ===========================================
+    section("DROP-OFF POINTS")
     print(f"\n{'='*60}")
     print("DROP-OFF POINTS")
     print(f"{'='*60}")
 
     # Users who started but didn't complete analysis
-    started_session = users_at_stage.get('session_start', set())
-    completed_analysis = users_at_stage.get('analysis', set())
+    started_session = users_at_stage['session_start']
+    completed_analysis = users_at_stage['analysis']
 
-    dropped_before_analysis = started_session - completed_analysis
-    if started_session:
-        drop_rate = len(dropped_before_analysis) / len(started_session) * 100
-        print(f"Users who started but didn't complete analysis: {len(dropped_before_analysis)} ({drop_rate:.1f}%)")
+    dropped_before_analysis = popcount(started_session & ~completed_analysis)
+    if popcount(started_session):
+        drop_rate = dropped_before_analysis / popcount(started_session) * 100
+        print(f"Users who started but didn't complete analysis: {dropped_before_analysis} ({drop_rate:.1f}%)")
 
     # Users who analyzed but didn't give feedback
-    gave_feedback = users_at_stage.get('feedback', set())
-    analyzed_no_feedback = completed_analysis - gave_feedback
-    if completed_analysis:
-        no_feedback_rate = len(analyzed_no_feedback) / len(completed_analysis) * 100
-        print(f"Users who analyzed but didn't give feedback: {len(analyzed_no_feedback)} ({no_feedback_rate:.1f}%)")
+    gave_feedback = users_at_stage['feedback']
+    analyzed_no_feedback = popcount(completed_analysis & ~gave_feedback)
+    if popcount(completed_analysis):
+        no_feedback_rate = analyzed_no_feedback / popcount(completed_analysis) * 100
+        print(f"Users who analyzed but didn't give feedback: {analyzed_no_feedback} ({no_feedback_rate:.1f}%)")
 
     # ===========================================
     # SESSION METRICS
     # ===========================================
-    df = pd.DataFrame(session_data)
+    df = session_data
 
     if not df.empty and df['duration_seconds'].sum() > 0:
+        section("SESSION METRICS")
         print(f"\n{'='*60}")
         print("SESSION METRICS")
         print(f"{'='*60}")
@@ -252,35 +408,20 @@ def analyze_user_engagement():
     # ===========================================
     # USER STATS ANALYSIS
     # ===========================================
-    if user_stats:
+    if stats['total_tracked']:
+        section("USER ENGAGEMENT TIERS")
         print(f"\n{'='*60}")
         print("USER ENGAGEMENT TIERS")
         print(f"{'='*60}")
 
-        power_users = 0  # 10+ analyses
-        regular_users = 0  # 3-9 analyses
-        casual_users = 0  # 1-2 analyses
-        inactive_users = 0  # 0 analyses
-
-        total_analyses = 0
-        total_images = 0
-
-        for stat in user_stats:
-            data = stat.to_dict()
-            analyses = data.get('totalAnalyses', 0)
-            total_analyses += analyses
-            total_images += data.get('totalImages', 0)
-
-            if analyses >= 10:
-                power_users += 1
-            elif analyses >= 3:
-                regular_users += 1
-            elif analyses >= 1:
-                casual_users += 1
-            else:
-                inactive_users += 1
-
-        total_tracked = len(user_stats)
+        power_users = stats['power_users']
+        regular_users = stats['regular_users']
+        casual_users = stats['casual_users']
+        inactive_users = stats['inactive_users']
+        total_analyses = stats['total_analyses']
+        total_images = stats['total_images']
+
+        total_tracked = stats['total_tracked']
         print(f"Power Users (10+ analyses): {power_users} ({power_users/total_tracked*100:.1f}%)")
         print(f"Regular Users (3-9 analyses): {regular_users} ({regular_users/total_tracked*100:.1f}%)")
         print(f"Casual Users (1-2 analyses): {casual_users} ({casual_users/total_tracked*100:.1f}%)")
@@ -290,16 +431,21 @@ def analyze_user_engagement():
         if total_tracked > 0:
             print(f"Avg Analyses per User: {total_analyses/total_tracked:.1f}")
 
+        # The same bands from analysis events in activities, per registered user
+        casual, regular, power = activity_matrix.tiers('analysis', [1, 3, 10])
+        print(f"\nFrom activities (analysis events): {power} power, {regular} regular, {casual} casual users")
+
     # ===========================================
     # RECOMMENDATIONS
     # ===========================================
+    section("RECOMMENDATIONS")
     print(f"\n{'='*60}")
     print("RECOMMENDATIONS")
     print(f"{'='*60}")
 
     recommendations = []
 
-    if guest_sessions_30d > len(active_30d):
+    if guest_sessions_30d > active_30d:
         recommendations.append("- High guest traffic: Consider improving signup conversion flow")
 
     if activity_types.get('feedback', 0) < activity_types.get('analysis', 0) * 0.3:
@@ -308,7 +454,7 @@ def analyze_user_engagement():
     if activity_types.get('image_upload', 0) < activity_types.get('analysis', 0) * 0.5:
         recommendations.append("- Many text-only analyses: Encourage image uploads for better accuracy")
 
-    if len(active_7d) < len(active_30d) * 0.3:
+    if active_7d < active_30d * 0.3:
         recommendations.append("- Low stickiness: Users aren't returning regularly. Consider engagement features")
 
     if not recommendations:
@@ -320,16 +466,45 @@ def analyze_user_engagement():
     print(f"\n{'='*60}")
 
     return {
-        'dau': len(active_7d),
-        'mau': len(active_30d),
+        'dau': active_7d,
+        'mau': active_30d,
         'guest_sessions_7d': guest_sessions_7d,
         'guest_sessions_30d': guest_sessions_30d,
-        'total_users': len(users),
+        'total_users': user_count,
         'activity_breakdown': dict(activity_types),
-        'retention_7d': len(active_7d)/total_users*100 if total_users else 0,
-        'retention_30d': len(active_30d)/total_users*100 if total_users else 0,
+        'retention_7d': active_7d/total_users*100 if total_users else 0,
+        'retention_30d': active_30d/total_users*100 if total_users else 0,
     }
 
 
 if __name__ == "__main__":
-    results = analyze_user_engagement()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Analyze user engagement.")
+    add_snapshot_arguments(parser)
+    add_scan_arguments(parser)
+    add_fetch_arguments(parser)
+    parser.add_argument('--quick', action='store_true',
+                        help="Only print headline totals (aggregation queries, no document downloads)")
+    parser.add_argument('--window-days', type=int, default=None, metavar='DAYS',
+                        help="Only read sessions/activities from the last DAYS days (at least 30)")
+    parser.add_argument('--active-users-csv', default=None, metavar='FILE',
+                        help="Write the daily DAU/WAU/MAU/stickiness series for the past year to FILE")
+    parser.add_argument('--cohorts-csv', default=None, metavar='FILE',
+                        help="Write the cohort retention table (signup week x weeks since signup) to FILE")
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+    configure_scans_from_args(args)
+
+    try:
+        results = analyze_user_engagement(refresh=args.refresh, snapshot_ttl=args.snapshot_ttl,
+                                          incremental=args.incremental,
+                                          fetch_concurrency=args.fetch_concurrency,
+                                          quick=args.quick,
+                                          window_days=args.window_days,
+                                          active_users_csv=args.active_users_csv,
+                                          cohorts_csv=args.cohorts_csv)
+    except CredentialsNotFound as e:
+        print_credentials_help(e)
+        raise SystemExit(1)